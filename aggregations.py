@@ -0,0 +1,101 @@
+from app import db
+from datetime import datetime
+from sqlalchemy import func, case, text, Date, DateTime, Integer
+
+
+def count_where(condition):
+    """COUNT of rows matching a condition, usable alongside other aggregates"""
+    return func.count(case((condition, 1)))
+
+
+def sum_where(column, condition):
+    """SUM of a column over rows matching a condition (0 when none match)"""
+    return func.coalesce(func.sum(case((condition, column))), 0)
+
+
+def status_counts(status_column, statuses):
+    """One conditional COUNT per status, labelled with the status name"""
+    return [count_where(status_column == status).label(status) for status in statuses]
+
+
+def date_bucket(column, granularity):
+    """Bucket label for a date/datetime column: 'YYYY-MM-DD' for day and week (week start, Monday), 'YYYY-MM' for month"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        if granularity == 'month':
+            return func.to_char(column, 'YYYY-MM')
+        return func.to_char(func.date_trunc(granularity, column), 'YYYY-MM-DD')
+    if dialect in ('mysql', 'mariadb'):
+        if granularity == 'month':
+            return func.date_format(column, '%Y-%m')
+        if granularity == 'week':
+            return func.date_format(func.subdate(column, func.weekday(column)), '%Y-%m-%d')
+        return func.date_format(column, '%Y-%m-%d')
+    if granularity == 'month':
+        return func.strftime('%Y-%m', column)
+    if granularity == 'week':
+        return func.date(column, '-6 days', 'weekday 1')
+    return func.date(column)
+
+
+def add_days(column, days):
+    """SQL expression for a datetime column shifted by a whole number of days"""
+    days = int(days)
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return column + func.make_interval(0, 0, 0, days)
+    if dialect in ('mysql', 'mariadb'):
+        return func.timestampadd(text('DAY'), days, column)
+    # SQLite: shift the date part and keep the stored fractional seconds, preserving SQLAlchemy's text layout
+    return func.strftime('%Y-%m-%d %H:%M:%S', column, '%+d days' % days).op('||', return_type=DateTime)(
+        func.substr(column, 20)
+    )
+
+
+def epoch_seconds(column):
+    """Integer seconds since 1970-01-01 for a naive UTC datetime column"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return func.cast(func.extract('epoch', column), Integer)
+    if dialect in ('mysql', 'mariadb'):
+        return func.timestampdiff(text('SECOND'), '1970-01-01', column)
+    return func.cast(func.strftime('%s', column), Integer)
+
+
+def month_bucket(column):
+    """Calendar-month bucket ('YYYY-MM') for a datetime column"""
+    return date_bucket(column, 'month')
+
+
+def last_months(count, now=None):
+    """Start of the oldest month and the 'YYYY-MM' labels of the last `count` calendar months, oldest first"""
+    now = now or datetime.utcnow()
+    year, month = now.year, now.month
+    labels = []
+    for _ in range(count):
+        labels.append('%04d-%02d' % (year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    labels.reverse()
+    oldest_year, oldest_month = (int(part) for part in labels[0].split('-'))
+    return datetime(oldest_year, oldest_month, 1), labels
+
+
+def monthly_totals(amount_column, date_column, *filters, months=12, now=None):
+    """Per-month SUM of a column over the last `months` calendar months in a single GROUP BY"""
+    window_start, labels = last_months(months, now)
+    if isinstance(date_column.type, Date):
+        window_start = window_start.date()
+    bucket = month_bucket(date_column).label('month')
+
+    rows = db.session.query(
+        bucket,
+        func.sum(amount_column)
+    ).filter(
+        date_column >= window_start,
+        *filters
+    ).group_by(bucket).all()
+
+    totals = {month: float(total or 0) for month, total in rows}
+    return [(label, totals.get(label, 0.0)) for label in labels]
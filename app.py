@@ -2,6 +2,9 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
+from serialization import FastJSONProvider
+from engine_profile import load_profile, engine_options, apply_sqlite_pragmas
+from replicas import RoutingSession, pin_after_write
 from dotenv import load_dotenv
 import os
 
@@ -11,32 +14,168 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
+app.json = FastJSONProvider(app)
 
 # Config
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///data.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Engine profile from env (see engine_profile.py): SQLite pragmas on connect, pool tuning for server databases
+app.config['SQLITE_PRAGMAS'], pool_options = load_profile()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], pool_options)
+
+# Read replicas (see replicas.py): comma-separated URLs, served GETs on these blueprints
+replica_urls = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+app.config['SQLALCHEMY_BINDS'] = {'replica_%d' % number: url for number, url in enumerate(replica_urls, 1)}
+app.config['REPLICA_BLUEPRINTS'] = [
+    'customers', 'tickets', 'service_plans', 'subscriptions', 'payments', 'equipment', 'network_nodes',
+    'dashboard', 'search', 'exports', 'users'
+]
+app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 10))
+app.config['REPLICA_PIN_SECONDS'] = float(os.getenv('REPLICA_PIN_SECONDS', app.config['REPLICA_MAX_LAG_SECONDS']))
+app.config['REPLICA_LAG_CHECK_SECONDS'] = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', 1))
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'super-secret')  # replace in prod
 
+# Password hashing: werkzeug method string (full form, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'),
+# pool size (0 = CPU count), max queued operations beyond the workers, and 'thread' or 'process' workers
+app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_POOL_WORKERS'] = int(os.getenv('PASSWORD_POOL_WORKERS', 0))
+app.config['PASSWORD_POOL_QUEUE_LIMIT'] = int(os.getenv('PASSWORD_POOL_QUEUE_LIMIT')) if os.getenv('PASSWORD_POOL_QUEUE_LIMIT') else None
+app.config['PASSWORD_POOL_KIND'] = os.getenv('PASSWORD_POOL_KIND', 'thread')
+
+# Token revocation: how often each worker pulls new revocations into its Bloom filter, how often it
+# rebuilds the filter (dropping expired entries), and the number of entries the filter is sized for
+app.config['TOKEN_REVOCATION_SYNC_SECONDS'] = float(os.getenv('TOKEN_REVOCATION_SYNC_SECONDS', 5))
+app.config['TOKEN_REVOCATION_REBUILD_SECONDS'] = float(os.getenv('TOKEN_REVOCATION_REBUILD_SECONDS', 300))
+app.config['TOKEN_REVOCATION_BLOOM_CAPACITY'] = int(os.getenv('TOKEN_REVOCATION_BLOOM_CAPACITY', 100000))
+
+# Public plan catalog: Cache-Control max-age, also the longest another worker serves a stale catalog
+app.config['PLAN_CATALOG_MAX_AGE'] = int(os.getenv('PLAN_CATALOG_MAX_AGE', 300))
+
+# Background jobs (`flask jobs worker`): worker threads per process, idle poll interval, attempts per job,
+# retry backoff (base doubling per attempt, capped), and how long a running job may go before it is released
+app.config['JOB_WORKER_CONCURRENCY'] = int(os.getenv('JOB_WORKER_CONCURRENCY', 4))
+app.config['JOB_POLL_SECONDS'] = float(os.getenv('JOB_POLL_SECONDS', 1))
+app.config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+app.config['JOB_BACKOFF_SECONDS'] = float(os.getenv('JOB_BACKOFF_SECONDS', 5))
+app.config['JOB_BACKOFF_MAX_SECONDS'] = float(os.getenv('JOB_BACKOFF_MAX_SECONDS', 600))
+app.config['JOB_LOCK_TIMEOUT_SECONDS'] = float(os.getenv('JOB_LOCK_TIMEOUT_SECONDS', 900))
+
+# Subscription lifecycle (`flask subscriptions lifecycle`): days an auto-renewing subscription is extended
+# by, and subscription ids handled per transaction
+app.config['SUBSCRIPTION_RENEWAL_DAYS'] = int(os.getenv('SUBSCRIPTION_RENEWAL_DAYS', 30))
+app.config['SUBSCRIPTION_LIFECYCLE_CHUNK_SIZE'] = int(os.getenv('SUBSCRIPTION_LIFECYCLE_CHUNK_SIZE', 10000))
+
+# Billing runs: worker processes (0 = CPU count) and payments written per INSERT/transaction
+app.config['BILLING_WORKERS'] = int(os.getenv('BILLING_WORKERS', 0))
+app.config['BILLING_CHUNK_SIZE'] = int(os.getenv('BILLING_CHUNK_SIZE', 2000))
+
+# Node telemetry (see telemetry.py): samples per ingest request, hours each series is kept, and how often
+# each process queues the retention job
+app.config['TELEMETRY_BATCH_MAX_SAMPLES'] = int(os.getenv('TELEMETRY_BATCH_MAX_SAMPLES', 50000))
+app.config['TELEMETRY_RETENTION_RAW_HOURS'] = float(os.getenv('TELEMETRY_RETENTION_RAW_HOURS', 48))
+app.config['TELEMETRY_RETENTION_1M_HOURS'] = float(os.getenv('TELEMETRY_RETENTION_1M_HOURS', 24 * 30))
+app.config['TELEMETRY_RETENTION_1H_HOURS'] = float(os.getenv('TELEMETRY_RETENTION_1H_HOURS', 24 * 730))
+app.config['TELEMETRY_PRUNE_SECONDS'] = float(os.getenv('TELEMETRY_PRUNE_SECONDS', 300))
+
+# Capacity forecast (see forecast.py): days of hourly history fitted, the minimum hours of history a
+# node needs for a fit, and how far ahead projected_peak looks
+app.config['FORECAST_HISTORY_DAYS'] = int(os.getenv('FORECAST_HISTORY_DAYS', 28))
+app.config['FORECAST_MIN_HOURS'] = int(os.getenv('FORECAST_MIN_HOURS', 48))
+app.config['FORECAST_HORIZON_DAYS'] = int(os.getenv('FORECAST_HORIZON_DAYS', 30))
+
+# Node spatial index (see spatial.py): grid cell size in degrees, and how often each process picks up
+# node changes made elsewhere
+app.config['SPATIAL_CELL_DEGREES'] = float(os.getenv('SPATIAL_CELL_DEGREES', 0.1))
+app.config['SPATIAL_SYNC_SECONDS'] = float(os.getenv('SPATIAL_SYNC_SECONDS', 1))
+
+# Capacity admission (see capacity.py): how many of the nearest nodes a signup with assign_node tries
+app.config['CAPACITY_ASSIGN_CANDIDATES'] = int(os.getenv('CAPACITY_ASSIGN_CANDIDATES', 5))
+
+# Ticket claim queue (see ticket_queue.py): default and longest claim lease, and most tickets per claim
+app.config['TICKET_LEASE_SECONDS'] = int(os.getenv('TICKET_LEASE_SECONDS', 900))
+app.config['TICKET_LEASE_MAX_SECONDS'] = int(os.getenv('TICKET_LEASE_MAX_SECONDS', 28800))
+app.config['TICKET_CLAIM_MAX_BATCH'] = int(os.getenv('TICKET_CLAIM_MAX_BATCH', 50))
+
 # Extensions
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+with app.app_context():
+    for engine in db.engines.values():
+        apply_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
+app.after_request(pin_after_write)
 jwt = JWTManager(app)
 
 # Import and register blueprints
+from auth import auth_bp
 from routes.users import users_bp
+from routes.customers import customers_bp
+from routes.tickets import tickets_bp
 from routes.service_plans import service_plans_bp
 from routes.subscriptions import subscriptions_bp
 from routes.payments import payments_bp
 from routes.equipment import equipment_bp
 from routes.network_nodes import network_nodes_bp
 from routes.dashboard import dashboard_bp
+from routes.search import search_bp
+from routes.exports import exports_bp
+from routes.imports import imports_bp
+from routes.jobs import jobs_bp
+from routes.billing import billing_bp
 
+app.register_blueprint(auth_bp)
 app.register_blueprint(users_bp)
+app.register_blueprint(customers_bp)
+app.register_blueprint(tickets_bp)
 app.register_blueprint(service_plans_bp)
 app.register_blueprint(subscriptions_bp)
 app.register_blueprint(payments_bp)
 app.register_blueprint(equipment_bp)
 app.register_blueprint(network_nodes_bp)
 app.register_blueprint(dashboard_bp)
+app.register_blueprint(search_bp)
+app.register_blueprint(exports_bp)
+app.register_blueprint(imports_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(billing_bp)
+
+# Password hashing runs on a bounded pool; a full pool answers 429 rather than queueing, a timed-out hash 503
+from passwords import PasswordPoolBusy, busy_response, passwords_cli
+
+app.register_error_handler(PasswordPoolBusy, busy_response)
+
+# CLI commands
+from rollups import rollups_cli
+from query_plans import plans_cli
+from search import search_cli
+from catalog import catalog_cli
+from serialization import serializers_cli
+from engine_profile import engine_cli
+from replicas import replicas_cli
+from jobs import jobs_cli
+from subscription_lifecycle import lifecycle_cli
+from billing import billing_cli
+from telemetry import telemetry_cli
+from forecast import forecast_cli
+from spatial import spatial_cli
+from capacity import capacity_cli
+from ticket_queue import tickets_cli
+
+app.cli.add_command(rollups_cli)
+app.cli.add_command(plans_cli)
+app.cli.add_command(search_cli)
+app.cli.add_command(passwords_cli)
+app.cli.add_command(catalog_cli)
+app.cli.add_command(serializers_cli)
+app.cli.add_command(engine_cli)
+app.cli.add_command(replicas_cli)
+app.cli.add_command(jobs_cli)
+app.cli.add_command(lifecycle_cli)
+app.cli.add_command(billing_cli)
+app.cli.add_command(telemetry_cli)
+app.cli.add_command(forecast_cli)
+app.cli.add_command(spatial_cli)
+app.cli.add_command(capacity_cli)
+app.cli.add_command(tickets_cli)
 
 # Run the app
 if __name__ == '__main__':
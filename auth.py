@@ -1,16 +1,16 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, create_refresh_token, get_jwt
 from models import User, Customer
-from app import db
-from werkzeug.security import check_password_hash
+from app import db, jwt
+from search import index_entity
+from authz import identity_claims
+from passwords import needs_rehash
+from token_revocation import revoke_token, is_token_revoked
 import secrets
 import string
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
-# In-memory blacklist for demo (use Redis in production)
-blacklisted_tokens = set()
-
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -42,6 +42,8 @@ def register():
             email=data['email']
         )
         db.session.add(customer)
+        db.session.flush()
+        index_entity('customer', customer)
         db.session.commit()
     
     return jsonify({
@@ -60,12 +62,17 @@ def login():
 
     user = User.query.filter_by(username=username).first()
 
-    if not user or not check_password_hash(user.password_hash, password):
+    if not user or not user.check_password(password):
         return jsonify({'message': 'Invalid username or password'}), 401
+    
+    # Transparently upgrade hashes made with an older method or cost
+    if needs_rehash(user.password_hash):
+        user.set_password(password)
+        db.session.commit()
 
     access_token = create_access_token(
         identity=str(user.id), 
-        additional_claims={'role': user.role, 'username': user.username}
+        additional_claims=identity_claims(user)
     )
     refresh_token = create_refresh_token(identity=str(user.id))
     
@@ -86,9 +93,10 @@ def refresh():
     if not user:
         return jsonify({'message': 'User not found'}), 404
     
+    # Reload role and customer link so changes since login take effect
     new_token = create_access_token(
         identity=str(user.id),
-        additional_claims={'role': user.role, 'username': user.username}
+        additional_claims=identity_claims(user)
     )
     
     return jsonify({'access_token': new_token})
@@ -96,8 +104,8 @@ def refresh():
 @auth_bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    jti = get_jwt()['jti']
-    blacklisted_tokens.add(jti)
+    revoke_token(get_jwt())
+    db.session.commit()
     return jsonify({'message': 'Successfully logged out'}), 200
 
 @auth_bp.route('/forgot-password', methods=['POST'])
@@ -148,7 +156,7 @@ def protected():
     current_user = get_jwt_identity()
     return jsonify(logged_in_as=current_user), 200
 
-# Check if token is blacklisted
-@auth_bp.before_app_request
-def check_if_token_revoked():
-    pass  # Implement token blacklist checking if needed
\ No newline at end of file
+# Check if token is revoked (shared store with an in-process Bloom filter fast path)
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return is_token_revoked(jwt_payload['jti'])
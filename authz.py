@@ -0,0 +1,73 @@
+"""Request-scoped principal built from access-token claims.
+
+Access tokens carry everything routes need to authorize a request: the user id (identity) and the
+`role`, `username` and `customer_id` claims written by `identity_claims` at login and refresh.
+`current_principal()` reads them once per request, so authorization costs no queries.
+
+Invalidation: claims are a snapshot taken when the token was issued. A role change, or linking or
+unlinking a customer profile, takes effect when the user's access token is next refreshed
+(`/api/auth/refresh` reloads the user) or expires (JWT_ACCESS_TOKEN_EXPIRES). To cut access off
+immediately, revoke the user's tokens so they must log in again.
+"""
+from flask import g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from models import Customer
+
+STAFF_ROLES = ['admin', 'sales', 'tech']
+
+
+def customer_for_user_query(user_id):
+    """Customer profile linked to a user account"""
+    return Customer.query.filter_by(user_id=user_id)
+
+
+def identity_claims(user):
+    """Additional claims embedded in a user's access tokens"""
+    customer = user.customer_profile if user.role == 'customer' else None
+    return {
+        'role': user.role,
+        'username': user.username,
+        'customer_id': customer.id if customer else None
+    }
+
+
+class Principal:
+    """The authenticated caller, as described by their token"""
+
+    def __init__(self, user_id, role, username=None, customer_id=None):
+        self.user_id = user_id
+        self.role = role
+        self.username = username
+        self.customer_id = customer_id
+
+    @property
+    def is_customer(self):
+        return self.role == 'customer'
+
+    @property
+    def is_staff(self):
+        return self.role in STAFF_ROLES
+
+    def has_role(self, *roles):
+        return self.role in roles
+
+    def owns_customer(self, customer_id):
+        """True if the caller is the customer-role user whose profile is `customer_id`"""
+        return self.is_customer and self.customer_id is not None and self.customer_id == customer_id
+
+
+def current_principal():
+    """Principal for the current request (requires a verified JWT), built once and cached on `g`"""
+    principal = g.get('principal')
+    if principal is None:
+        claims = get_jwt()
+        user_id = int(get_jwt_identity())
+        customer_id = claims.get('customer_id')
+
+        # Tokens issued before customer_id was added to the claims: fall back to one lookup
+        if claims.get('role') == 'customer' and 'customer_id' not in claims:
+            customer = customer_for_user_query(user_id).first()
+            customer_id = customer.id if customer else None
+
+        principal = g.principal = Principal(user_id, claims.get('role'), claims.get('username'), customer_id)
+    return principal
@@ -0,0 +1,242 @@
+"""Billing runs.
+
+A billing run charges every active subscription its plan's price for one cycle ('YYYY-MM'). The
+active subscriptions are split into id ranges of roughly equal size, and a process pool bills
+them (BILLING_WORKERS, the CPU count by default). Each partition reads its subscriptions by keyset
+and writes their payments with one bulk INSERT per chunk. Each chunk commits on its own, together
+with its revenue rollup increment.
+
+Payment has a unique (subscription_id, billing_cycle) key, and each chunk skips subscriptions
+already billed for the cycle. Re-running a cycle after a crash therefore bills only what is
+missing, and concurrent runs cannot bill a subscription twice: the loser's chunk fails on the key
+and is reported.
+"""
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import click
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from models import Payment, ServicePlan, Subscription
+from billing_worker import bill_partition
+from engine_profile import scratch_database
+from jobs import job_handler
+from rollups import rebuild_rollups, record_payments, verify_rollups
+
+billing_cli = AppGroup('billing', help='Billing runs.')
+
+CYCLE_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+DEFAULT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 20
+
+
+def current_cycle():
+    return datetime.utcnow().strftime('%Y-%m')
+
+
+def validate_cycle(cycle):
+    if not isinstance(cycle, str) or not CYCLE_PATTERN.match(cycle):
+        raise ValueError('cycle must be YYYY-MM')
+    return cycle
+
+
+def partition_bounds(partitions):
+    """[low, high) id ranges splitting the active subscriptions into `partitions` parts of similar size"""
+    table = Subscription.__table__
+    active = table.c.status == 'active'
+    total = db.session.execute(select(func.count()).where(active)).scalar()
+    if not total:
+        return []
+    partitions = max(1, min(partitions, total))
+    cuts = [
+        db.session.execute(
+            select(table.c.id).where(active).order_by(table.c.id).offset(total * number // partitions).limit(1)
+        ).scalar()
+        for number in range(1, partitions)
+    ]
+    edges = [None] + sorted(set(cuts)) + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _bill_chunk(cycle, rows, billed_at):
+    """Insert this cycle's payments for a chunk of (id, plan_id, payment_method, price) rows; returns (billed, skipped, amount)"""
+    ids = [row.id for row in rows]
+    already = set(db.session.execute(
+        select(Payment.subscription_id).where(Payment.billing_cycle == cycle, Payment.subscription_id.in_(ids))
+    ).scalars())
+    plans = {row.id: row.plan_id for row in rows}
+    payments = [{
+        'subscription_id': row.id,
+        'amount': row.price,
+        'payment_method': row.payment_method,
+        'transaction_id': 'billing-%s-%d' % (cycle, row.id),
+        'status': 'completed',
+        'billing_cycle': cycle,
+        'payment_date': billed_at,
+        'created_at': billed_at
+    } for row in rows if row.id not in already]
+
+    if payments:
+        db.session.execute(Payment.__table__.insert(), payments)
+        record_payments([dict(payment, plan_id=plans[payment['subscription_id']]) for payment in payments])
+    return len(payments), len(already), sum(payment['amount'] for payment in payments)
+
+
+def bill_range(cycle, low, high, billed_at, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Bill the active subscriptions with low <= id < high (None = unbounded); returns the partition report"""
+    started = time.perf_counter()
+    subscriptions = Subscription.__table__
+    plans = ServicePlan.__table__
+    report = {'low': low, 'high': high, 'billed': 0, 'skipped': 0, 'failed': 0, 'amount': 0.0, 'errors': []}
+
+    # Keyset over the primary key only, so each chunk is a short index range whatever the planner's statistics
+    last_id = low - 1 if low is not None else None
+    while True:
+        query = select(
+            subscriptions.c.id, subscriptions.c.plan_id, subscriptions.c.payment_method, subscriptions.c.status,
+            plans.c.price
+        ).join(plans, subscriptions.c.plan_id == plans.c.id)
+        if last_id is not None:
+            query = query.where(subscriptions.c.id > last_id)
+        if high is not None:
+            query = query.where(subscriptions.c.id < high)
+        rows = db.session.execute(query.order_by(subscriptions.c.id).limit(chunk_size)).all()
+        if not rows:
+            db.session.rollback()
+            break
+        last_id = rows[-1].id
+        rows = [row for row in rows if row.status == 'active']
+        if not rows:
+            continue
+
+        try:
+            billed, skipped, amount = _bill_chunk(cycle, rows, billed_at)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            report['failed'] += len(rows)
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({
+                    'first_id': rows[0].id,
+                    'last_id': rows[-1].id,
+                    'error': '%s: %s' % (e.__class__.__name__, str(e.orig if hasattr(e, 'orig') else e)[:200])
+                })
+            continue
+        report['billed'] += billed
+        report['skipped'] += skipped
+        report['amount'] = round(report['amount'] + amount, 2)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['payments_per_second'] = round(report['billed'] / report['seconds']) if report['seconds'] else 0
+    return report
+
+
+def run_billing(cycle, workers=None, partitions=None, chunk_size=None):
+    """Bill every active subscription for `cycle` across a process pool; returns the run report"""
+    config = current_app.config
+    validate_cycle(cycle)
+    workers = workers or config.get('BILLING_WORKERS') or os.cpu_count() or 1
+    partitions = partitions or workers * 4
+    chunk_size = chunk_size or config.get('BILLING_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    billed_at = datetime.utcnow()
+    started = time.perf_counter()
+
+    bounds = partition_bounds(partitions)
+    db.session.rollback()
+    reports = []
+    if workers == 1:
+        reports = [bill_range(cycle, low, high, billed_at, chunk_size) for low, high in bounds]
+    elif bounds:
+        # spawn: workers load the app fresh instead of inheriting this process's threads and connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(bill_partition, cycle, low, high, billed_at, chunk_size) for low, high in bounds]
+            for (low, high), future in zip(bounds, futures):
+                try:
+                    reports.append(future.result())
+                except Exception as e:
+                    reports.append({'low': low, 'high': high, 'billed': 0, 'skipped': 0, 'failed': None, 'amount': 0.0,
+                                    'errors': [{'error': '%s: %s' % (e.__class__.__name__, e)}]})
+
+    seconds = time.perf_counter() - started
+    billed = sum(report['billed'] for report in reports)
+    return {
+        'cycle': cycle,
+        'workers': workers,
+        'billed': billed,
+        'skipped': sum(report['skipped'] for report in reports),
+        'failed': sum(report['failed'] or 0 for report in reports),
+        'failed_partitions': sum(1 for report in reports if report['failed'] is None),
+        'amount': round(sum(report['amount'] for report in reports), 2),
+        'seconds': round(seconds, 3),
+        'payments_per_second': round(billed / seconds) if seconds else 0,
+        'partitions': reports
+    }
+
+
+@job_handler('billing_run')
+def billing_run_job(payload):
+    """Job runner entry point; safe to retry, since billed subscriptions are skipped"""
+    return run_billing(payload['cycle'], workers=payload.get('workers'), partitions=payload.get('partitions'))
+
+
+def _echo_report(report):
+    for number, partition in enumerate(report['partitions'], 1):
+        click.echo('  partition %2d [%s, %s): billed %7d  skipped %7d  failed %s  %7.0f payments/s%s' % (
+            number, partition['low'] or '-', partition['high'] or '-', partition['billed'], partition['skipped'],
+            'all' if partition['failed'] is None else partition['failed'], partition.get('payments_per_second', 0),
+            '  (%s)' % partition['errors'][0]['error'] if partition['errors'] else ''))
+    click.echo('Cycle %s: billed %d (%.2f), skipped %d, failed %d in %.2fs with %d worker(s): %d payments/s' % (
+        report['cycle'], report['billed'], report['amount'], report['skipped'], report['failed'], report['seconds'],
+        report['workers'], report['payments_per_second']))
+
+
+@billing_cli.command('run')
+@click.option('--cycle', default=None, help='Billing cycle YYYY-MM (default: current month).')
+@click.option('--workers', default=None, type=int, help='Worker processes (default BILLING_WORKERS or CPU count).')
+@click.option('--partitions', default=None, type=int, help='Id-range partitions (default 4 per worker).')
+@click.option('--chunk-size', default=None, type=int, help='Payments per INSERT/transaction.')
+def run_command(cycle, workers, partitions, chunk_size):
+    """Charge every active subscription for a cycle (safe to re-run)."""
+    try:
+        report = run_billing(cycle or current_cycle(), workers=workers, partitions=partitions, chunk_size=chunk_size)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    _echo_report(report)
+    if report['failed'] or report['failed_partitions']:
+        raise SystemExit(1)
+
+
+@billing_cli.command('benchmark')
+@click.option('--subscriptions', 'rows', default=200000, show_default=True)
+@click.option('--workers', default='1,2,4', show_default=True, help='Comma-separated worker counts to compare.')
+def benchmark_command(rows, workers):
+    """Bill a cycle over synthetic subscriptions in a scratch SQLite database at several pool sizes."""
+    from subscription_lifecycle import seed_subscriptions
+    counts = [int(count) for count in workers.split(',')]
+    database_url = os.environ.get('DATABASE_URL')
+    with tempfile.TemporaryDirectory() as directory, scratch_database(directory) as uri:
+        seed_subscriptions(rows)
+        rebuild_rollups()
+        # Spawned pool workers build their app from the environment
+        os.environ['DATABASE_URL'] = uri
+        try:
+            for number, count in enumerate(counts):
+                report = run_billing('2000-%02d' % (number + 1), workers=count)
+                click.echo('%d worker(s): billed %d in %.2fs, %d payments/s, failed %d' % (
+                    count, report['billed'], report['seconds'], report['payments_per_second'], report['failed']))
+            rerun = run_billing('2000-01', workers=counts[-1])
+            click.echo('Re-run of 2000-01: billed %d, skipped %d' % (rerun['billed'], rerun['skipped']))
+        finally:
+            if database_url is None:
+                os.environ.pop('DATABASE_URL', None)
+            else:
+                os.environ['DATABASE_URL'] = database_url
+        mismatches = verify_rollups()
+        click.echo('Rollups %s' % ('consistent' if not mismatches else '%d mismatches' % len(mismatches)))
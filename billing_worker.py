@@ -0,0 +1,13 @@
+"""Process-pool entry point for billing runs.
+
+Spawned workers import this module first; it has no module-level imports so that the app (which
+registers the billing routes) is fully loaded before billing is.
+"""
+
+
+def bill_partition(cycle, low, high, billed_at, chunk_size):
+    """Bill one partition inside this worker's own app context"""
+    from app import app
+    from billing import bill_range
+    with app.app_context():
+        return bill_range(cycle, low, high, billed_at, chunk_size)
@@ -0,0 +1,255 @@
+"""Network node capacity admission.
+
+A subscription with a node_id holds one unit of that node's reserved_load while it is active.
+reserved_load is separate from current_load, which is the latest measured load (telemetry and admin
+updates overwrite it). reserved_load only ever changes by deltas, through conditional UPDATEs:
+- Reserving runs `reserved_load = reserved_load + 1 WHERE status = 'active' AND reserved_load < capacity`.
+- Releasing runs `reserved_load = reserved_load - n`, floored at 0.
+Nothing is read first, so concurrent signups can neither overbook a node nor lose an increment.
+The UPDATE runs in the caller's transaction, so a signup that rolls back gives its unit back.
+Admission is against reserved_load alone: capacity counts subscriptions, not measured connections.
+
+Signups choose a node explicitly (node_id) or ask for one (assign_node). In that case the
+CAPACITY_ASSIGN_CANDIDATES nearest active nodes to the customer's service address are tried in order.
+"""
+import queue
+import tempfile
+import threading
+import time
+import click
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, case, func, select
+from sqlalchemy.exc import OperationalError
+from app import db
+from models import Customer, NetworkNode, ServicePlan, Subscription
+from engine_profile import scratch_database
+from rollups import record_subscription_status
+from spatial import coordinates, node_index, reset_index
+from telemetry import ingest_samples
+
+capacity_cli = AppGroup('capacity', help='Network node capacity admission.')
+
+DEFAULT_CANDIDATES = 5
+
+
+class CapacityError(Exception):
+    """No network node could take the subscription"""
+
+
+def reserve(node_id):
+    """Take one unit of a node's capacity in the current transaction; False if it is full or not active"""
+    table = NetworkNode.__table__
+    return db.session.execute(
+        table.update().where(
+            table.c.id == node_id, table.c.status == 'active', table.c.reserved_load < table.c.capacity
+        ).values(reserved_load=table.c.reserved_load + 1, updated_at=datetime.utcnow())
+    ).rowcount == 1
+
+
+def release(counts):
+    """Give back {node_id: units} in the current transaction (reserved_load never goes below 0)"""
+    counts = {node_id: units for node_id, units in counts.items() if node_id is not None and units}
+    if not counts:
+        return
+    table = NetworkNode.__table__
+    units = bindparam('b_units')
+    db.session.execute(
+        table.update().where(table.c.id == bindparam('b_node_id')).values(
+            reserved_load=case((table.c.reserved_load > units, table.c.reserved_load - units), else_=0),
+            updated_at=datetime.utcnow()
+        ),
+        [{'b_node_id': node_id, 'b_units': units} for node_id, units in counts.items()]
+    )
+
+
+def admit(customer, node_id=None):
+    """Reserve capacity for a new subscription of `customer`, on `node_id` or the nearest node with room.
+
+    Returns the node id. Raises CapacityError when nothing can take it, or ValueError when no node
+    is given and the service address has no coordinates.
+    """
+    if node_id is not None:
+        if not reserve(node_id):
+            raise CapacityError('Network node %s is full or not active' % node_id)
+        return node_id
+
+    origin = coordinates(customer.service_address)
+    if origin is None:
+        raise ValueError('Customer service address has no lat/lng coordinates to assign a node by')
+    candidates = current_app.config.get('CAPACITY_ASSIGN_CANDIDATES', DEFAULT_CANDIDATES)
+    for _, candidate in node_index().nearest(origin[0], origin[1], candidates):
+        if reserve(candidate):
+            return candidate
+    raise CapacityError('No network node with spare capacity near the service address')
+
+
+def admit_for_request(customer, data):
+    """Node for a signup request body: its node_id, the nearest with room if assign_node is set, else None"""
+    if data.get('node_id') is not None:
+        try:
+            node_id = int(data['node_id'])
+        except (TypeError, ValueError):
+            raise ValueError('node_id must be an integer')
+        return admit(customer, node_id)
+    if data.get('assign_node'):
+        return admit(customer)
+    return None
+
+
+def status_changed(node_id, old_status, new_status):
+    """Reserve or release a node's unit for a subscription status change that has just been applied.
+
+    Call only for the transition that actually matched the old status, so each change counts once.
+    """
+    if node_id is None:
+        return
+    if old_status == 'active' and new_status != 'active':
+        release({node_id: 1})
+    elif old_status != 'active' and new_status == 'active' and not reserve(node_id):
+        raise CapacityError('Network node %s is full or not active' % node_id)
+
+
+def verify_capacity():
+    """Nodes whose reserved_load is over capacity or differs from the active subscriptions assigned to them"""
+    assigned = dict(db.session.execute(
+        select(Subscription.node_id, func.count()).where(
+            Subscription.node_id.isnot(None), Subscription.status == 'active'
+        ).group_by(Subscription.node_id)
+    ).all())
+    problems = []
+    for node_id, load, capacity in db.session.execute(
+            select(NetworkNode.id, NetworkNode.reserved_load, NetworkNode.capacity)).all():
+        # reserved_load is only moved by admissions, so any difference from the assignments is drift
+        if load > capacity or load != assigned.get(node_id, 0):
+            problems.append({'node_id': node_id, 'reserved_load': load, 'capacity': capacity,
+                             'assigned': assigned.get(node_id, 0)})
+    return problems
+
+
+@capacity_cli.command('verify')
+def verify_command():
+    """Check node reservations against capacity and assigned active subscriptions."""
+    problems = verify_capacity()
+    for problem in problems:
+        click.echo('Node %(node_id)s: reserved_load %(reserved_load)s, capacity %(capacity)s, '
+                   'assigned %(assigned)s' % problem)
+    click.echo('%d node(s) inconsistent' % len(problems))
+    if problems:
+        raise SystemExit(1)
+
+
+def _run_threads(threads, work, items):
+    """Run work(item) over items on `threads` threads, each in its own app context; returns per-call latencies"""
+    app = current_app._get_current_object()
+    pending = queue.Queue()
+    for item in items:
+        pending.put(item)
+    latencies = []
+
+    def run():
+        with app.app_context():
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    break
+                started = time.perf_counter()
+                work(item)
+                latencies.append(time.perf_counter() - started)
+            db.session.remove()
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sorted(latencies)
+
+
+@capacity_cli.command('benchmark')
+@click.option('--signups', default=500, show_default=True)
+@click.option('--threads', default=50, show_default=True)
+@click.option('--nodes', default=5, show_default=True)
+@click.option('--capacity', 'node_capacity', default=60, show_default=True, help='Capacity of each node.')
+def benchmark_command(signups, threads, nodes, node_capacity):
+    """Race concurrent signups and cancellations for scarce node capacity in a scratch SQLite database."""
+    with tempfile.TemporaryDirectory() as directory, scratch_database(directory):
+        reset_index()
+        now = datetime.utcnow()
+        db.session.execute(NetworkNode.__table__.insert(), [{
+            'name': 'Node %d' % number, 'location': {'lat': 40.7 + number * 0.01, 'lng': -74.0},
+            'status': 'active', 'capacity': node_capacity, 'current_load': 0
+        } for number in range(nodes)])
+        db.session.execute(ServicePlan.__table__.insert(), [{
+            'name': 'Plan', 'speed': '100 Mbps', 'price': 10.0, 'is_active': True, 'created_at': now, 'updated_at': now
+        }])
+        db.session.execute(Customer.__table__.insert(), [{
+            'name': 'Customer %d' % number, 'email': 'signup%d@example.com' % number,
+            'service_address': {'lat': 40.7, 'lng': -74.0 + number * 1e-4}, 'created_at': now, 'updated_at': now
+        } for number in range(signups)])
+        db.session.commit()
+
+        outcome = {'admitted': 0, 'rejected': 0, 'retried': 0}
+        lock = threading.Lock()
+
+        def signup(customer_id):
+            while True:
+                try:
+                    customer = db.session.get(Customer, customer_id)
+                    node_id = admit(customer)
+                    db.session.add(Subscription(
+                        customer_id=customer_id, plan_id=1, node_id=node_id, status='active', payment_method='cash',
+                        end_date=datetime.utcnow() + timedelta(days=30)
+                    ))
+                    record_subscription_status(1, None, 'active')
+                    db.session.commit()
+                    key = 'admitted'
+                except CapacityError:
+                    db.session.rollback()
+                    key = 'rejected'
+                except OperationalError:
+                    db.session.rollback()
+                    with lock:
+                        outcome['retried'] += 1
+                    continue
+                with lock:
+                    outcome[key] += 1
+                return
+
+        latencies = _run_threads(threads, signup, range(1, signups + 1))
+        click.echo('%d signups on %d threads for %d units: admitted %d, rejected %d (%d lock retries); '
+                   'median %.1f ms, p99 %.1f ms' % (
+                       signups, threads, nodes * node_capacity, outcome['admitted'], outcome['rejected'],
+                       outcome['retried'], latencies[len(latencies) // 2] * 1000,
+                       latencies[int(len(latencies) * 0.99)] * 1000))
+        # A telemetry batch overwrites the measured load; the reservations must survive it
+        ingest_samples([{'node_id': number, 'timestamp': datetime.utcnow().isoformat(), 'load': 0}
+                        for number in range(1, nodes + 1)])
+        load = db.session.execute(select(func.sum(NetworkNode.reserved_load))).scalar()
+        click.echo('Total reserved_load after a telemetry batch %d (expected %d); inconsistent nodes: %d' % (
+            load, min(signups, nodes * node_capacity), len(verify_capacity())))
+
+        # Cancel half of the admitted subscriptions concurrently
+        cancelled = db.session.execute(
+            select(Subscription.id).where(Subscription.status == 'active', Subscription.id % 2 == 0)
+        ).scalars().all()
+        db.session.rollback()
+
+        def cancel(subscription_id):
+            from subscription_lifecycle import set_status
+            while True:
+                try:
+                    set_status(db.session.get(Subscription, subscription_id), 'cancelled')
+                    db.session.commit()
+                    return
+                except OperationalError:
+                    db.session.rollback()
+
+        _run_threads(threads, cancel, cancelled)
+        load = db.session.execute(select(func.sum(NetworkNode.reserved_load))).scalar()
+        active = db.session.execute(select(func.count()).where(Subscription.status == 'active')).scalar()
+        click.echo('Cancelled %d: total reserved_load %d, active subscriptions %d; inconsistent nodes: %d' % (
+            len(cancelled), load, active, len(verify_capacity())))
+        reset_index()
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from models import ServicePlan
+from replicas import primary_reads
+from serialization import dumps_bytes
+
+catalog_cli = AppGroup('catalog', help='Public service-plan catalog cache.')
+
+DEFAULT_MAX_AGE = 300
+
+
+class CatalogEntry:
+    """Serialized catalog body with its strong ETag"""
+
+    def __init__(self, body, etag):
+        self.body = body
+        self.etag = etag
+        self.built_at = time.monotonic()
+
+
+# Keyed by the active_only flag; any plan write in this process clears it, other workers pick the
+# change up once PLAN_CATALOG_MAX_AGE has elapsed
+_entries = {}
+_generation = 0
+_lock = threading.Lock()
+
+
+def max_age():
+    return current_app.config.get('PLAN_CATALOG_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def get_catalog(active_only=True):
+    """The cached catalog, rebuilt from the database when missing or older than max_age()"""
+    entry = _entries.get(active_only)
+    if entry is not None and time.monotonic() - entry.built_at < max_age():
+        return entry
+
+    generation = _generation
+    query = ServicePlan.query
+    if active_only:
+        query = query.filter_by(is_active=True)
+    # Cached for every request in this process, so never built from a lagging replica
+    with primary_reads():
+        body = dumps_bytes(ServicePlan.serializers['catalog'].many(query.order_by(ServicePlan.id))) + b'\n'
+    entry = CatalogEntry(body, hashlib.sha256(body).hexdigest())
+
+    # Don't store a body built from rows read before a concurrent invalidation
+    with _lock:
+        if generation == _generation:
+            _entries[active_only] = entry
+    return entry
+
+
+def invalidate_catalog():
+    """Drop the cached catalog; call after committing any service plan change"""
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.clear()
+
+
+@catalog_cli.command('benchmark')
+@click.option('--requests', 'total', default=2000, show_default=True)
+def benchmark_command(total):
+    """Compare GET /api/plans throughput uncached, cached and revalidated (304)."""
+    client = current_app.test_client()
+
+    def run(label, headers=None, before=None):
+        started = time.perf_counter()
+        for _ in range(total):
+            if before:
+                before()
+            response = client.get('/api/plans', headers=headers)
+        elapsed = time.perf_counter() - started
+        click.echo('%-12s %8.0f req/s  (status %d)' % (label, total / elapsed, response.status_code))
+        return response
+
+    run('uncached', before=invalidate_catalog)
+    response = run('cached')
+    run('revalidated', headers={'If-None-Match': response.headers['ETag']})
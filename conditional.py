@@ -0,0 +1,41 @@
+"""Conditional GET for entity detail endpoints.
+
+Validators come from the `updated_at` of the entity and of every related row its payload embeds,
+read with a timestamp-only query before the entity itself is loaded. The ETag also covers the
+`?fields=` selection, since each selection is a different representation. A request whose
+If-None-Match / If-Modified-Since still matches gets a 304 without the full load or serialization.
+"""
+import hashlib
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+
+
+class Validators:
+    """ETag and Last-Modified for one representation of an entity"""
+
+    def __init__(self, kind, entity_id, *timestamps, fields=None):
+        """`fields` is the serializer's canonical field list, so each ?fields= selection gets its own ETag"""
+        stamps = [timestamp for timestamp in timestamps if timestamp is not None]
+        self.last_modified = max(stamps) if stamps else None
+        key = '%s:%s:%s:%s' % (kind, entity_id, ','.join(
+            timestamp.isoformat() if timestamp is not None else '-' for timestamp in timestamps
+        ), ','.join(fields or ()))
+        self.etag = hashlib.sha1(key.encode()).hexdigest()
+
+    def fresh(self):
+        """True if the client's cached copy (per its conditional headers) is still current"""
+        if not (request.if_none_match or request.if_modified_since):
+            return False
+        return not is_resource_modified(request.environ, etag=self.etag, last_modified=self.last_modified)
+
+    def apply(self, response):
+        response.set_etag(self.etag)
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified
+        # Authenticated data: browsers may keep it but must revalidate every time
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    def not_modified(self):
+        return self.apply(current_app.response_class(status=304))
@@ -0,0 +1,188 @@
+"""Database engine profile, loaded from the environment.
+
+DB_ENGINE_PROFILE selects a base profile ('production', the default, or 'default' for plain
+SQLAlchemy behaviour); individual settings override it:
+
+  SQLite (applied as PRAGMAs on every new connection)
+    SQLITE_JOURNAL_MODE    WAL lets readers proceed while a writer commits
+    SQLITE_SYNCHRONOUS     NORMAL is durable across application crashes in WAL mode
+    SQLITE_BUSY_TIMEOUT    ms a writer waits for the lock before "database is locked"
+    SQLITE_MMAP_SIZE       bytes of the file read through mmap
+    SQLITE_CACHE_SIZE      page cache; negative values are KiB
+
+  Server databases (engine/pool options)
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE (s), DB_POOL_PRE_PING (0/1)
+"""
+import os
+import tempfile
+import threading
+import time
+import click
+from contextlib import contextmanager
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+engine_cli = AppGroup('engine', help='Database engine profile utilities.')
+
+PROFILES = {
+    'default': {'sqlite': {}, 'pool': {}},
+    'production': {
+        'sqlite': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'mmap_size': 268435456,
+            'cache_size': -65536,
+        },
+        'pool': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 30,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True,
+        },
+    },
+}
+
+SQLITE_SETTINGS = {
+    'journal_mode': ('SQLITE_JOURNAL_MODE', str),
+    'synchronous': ('SQLITE_SYNCHRONOUS', str),
+    'busy_timeout': ('SQLITE_BUSY_TIMEOUT', int),
+    'mmap_size': ('SQLITE_MMAP_SIZE', int),
+    'cache_size': ('SQLITE_CACHE_SIZE', int),
+}
+
+POOL_SETTINGS = {
+    'pool_size': ('DB_POOL_SIZE', int),
+    'max_overflow': ('DB_MAX_OVERFLOW', int),
+    'pool_timeout': ('DB_POOL_TIMEOUT', int),
+    'pool_recycle': ('DB_POOL_RECYCLE', int),
+    'pool_pre_ping': ('DB_POOL_PRE_PING', lambda value: value.lower() in ('1', 'true', 'yes')),
+}
+
+
+def _settings(base, spec, environ):
+    settings = dict(base)
+    for name, (variable, convert) in spec.items():
+        if environ.get(variable):
+            settings[name] = convert(environ[variable])
+    return settings
+
+
+def load_profile(environ=os.environ):
+    """(sqlite pragmas, server engine options) for the configured profile"""
+    name = environ.get('DB_ENGINE_PROFILE', 'production')
+    if name not in PROFILES:
+        raise ValueError('Unknown DB_ENGINE_PROFILE %r' % name)
+    profile = PROFILES[name]
+    return _settings(profile['sqlite'], SQLITE_SETTINGS, environ), _settings(profile['pool'], POOL_SETTINGS, environ)
+
+
+def engine_options(uri, pool_options):
+    """Engine options for `uri`: pool tuning applies to server databases only"""
+    return {} if make_url(uri).get_backend_name() == 'sqlite' else dict(pool_options)
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the pragmas on every new DBAPI connection of a SQLite engine (no-op for other backends)"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute('PRAGMA %s = %s' % (name, value))
+        finally:
+            cursor.close()
+
+
+@contextmanager
+def scratch_database(directory):
+    """App context on a throwaway SQLite file in `directory` with every model's table (for benchmarks).
+
+    A second app shares the db object, so application code runs unchanged against the scratch file.
+    Yields the database URI, e.g. for worker processes that load the app themselves.
+    """
+    db = current_app.extensions['sqlalchemy']
+    uri = 'sqlite:///' + os.path.join(directory, 'bench.db')
+    scratch = Flask(current_app.import_name)
+    scratch.config.update(current_app.config)
+    scratch.config['SQLALCHEMY_DATABASE_URI'] = uri
+    scratch.config['SQLALCHEMY_BINDS'] = {}
+    scratch.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    db.init_app(scratch)
+    with scratch.app_context():
+        apply_sqlite_pragmas(db.engine, scratch.config.get('SQLITE_PRAGMAS') or load_profile()[0])
+        db.create_all()
+        try:
+            yield uri
+        finally:
+            db.session.remove()
+            db.engine.dispose()
+
+
+def _run_mixed_load(engine, seconds, readers, writers):
+    """Reads and writes completed (and lock errors) by concurrent threads in `seconds`"""
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def reader():
+        while time.monotonic() < deadline:
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text('SELECT status, COUNT(*) FROM bench_event GROUP BY status')).all()
+                key = 'reads'
+            except OperationalError:
+                key = 'locked'
+            with lock:
+                counts[key] += 1
+
+    def writer():
+        while time.monotonic() < deadline:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(
+                        text('INSERT INTO bench_event (status, payload) VALUES (:status, :payload)'),
+                        [{'status': 'open', 'payload': 'x' * 200}] * 10
+                    )
+                key = 'writes'
+            except OperationalError:
+                key = 'locked'
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+@engine_cli.command('benchmark')
+@click.option('--seconds', default=5.0, show_default=True)
+@click.option('--readers', default=8, show_default=True)
+@click.option('--writers', default=4, show_default=True)
+def benchmark_command(seconds, readers, writers):
+    """Mixed read/write throughput on a scratch SQLite file, without and with the configured profile."""
+    pragmas, _ = load_profile()
+    for label, profile_pragmas in (('without profile', {}), ('with profile', pragmas)):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine('sqlite:///' + os.path.join(directory, 'bench.db'))
+            apply_sqlite_pragmas(engine, profile_pragmas)
+            with engine.begin() as connection:
+                connection.execute(text(
+                    'CREATE TABLE bench_event (id INTEGER PRIMARY KEY, status VARCHAR(20), payload TEXT)'
+                ))
+                connection.execute(text('CREATE INDEX ix_bench_event_status ON bench_event (status)'))
+            counts = _run_mixed_load(engine, seconds, readers, writers)
+            engine.dispose()
+        click.echo('%-16s reads %7.0f/s  writes %6.0f/s (x10 rows)  locked errors %d' % (
+            label, counts['reads'] / seconds, counts['writes'] / seconds, counts['locked']))
@@ -0,0 +1,257 @@
+"""Network node capacity forecasting.
+
+Every node's hourly load (the 1-hour telemetry rollups over FORECAST_HISTORY_DAYS) is fitted with
+a linear trend plus daily and weekly seasonality. All nodes are fitted together: the hourly averages
+form one (nodes x hours) matrix with a mask for missing hours, and the per-node least-squares systems
+are built with two matrix products and solved as one batched np.linalg.solve.
+
+A node saturates when its trend plus its weekly seasonal peak reaches NetworkNode.capacity.
+Nodes with fewer than FORECAST_MIN_HOURS hours of history are reported without a fit.
+
+The forecast is cached per process until new data arrives, meaning a node is added or changed or
+its rollup_version moves (telemetry ingestion bumps it for every batch, including late or backfilled
+samples that leave updated_at alone). Requires NumPy.
+"""
+import tempfile
+import time
+import click
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Float, func, select, type_coerce
+from app import db
+from models import NetworkNode, NodeLoadRollup
+from aggregations import epoch_seconds
+from engine_profile import scratch_database
+
+try:
+    import numpy as np
+except ImportError:  # optional; the forecast endpoint answers 503 without it
+    np = None
+
+forecast_cli = AppGroup('forecast', help='Network node capacity forecasting.')
+
+DEFAULT_HISTORY_DAYS = 28
+DEFAULT_MIN_HOURS = 48
+DEFAULT_HORIZON_DAYS = 30
+RIDGE = 1e-6
+EPOCH = datetime(1970, 1, 1)
+SEASONS = (24, 168)  # daily and weekly periods, in hours
+SORT_FIELDS = ('days_to_saturation', 'load_percentage', 'trend_per_day', 'projected_peak', 'id', 'name')
+
+# (data stamp, forecast) for this process; replaced whole, so readers never see a mismatched pair
+_cache = {'entry': (None, None)}
+
+
+class ForecastUnavailable(RuntimeError):
+    """NumPy is not installed"""
+
+
+def data_stamp():
+    """(node count, newest node updated_at, total rollup_version): changes whenever a node or its telemetry changes"""
+    return tuple(db.session.execute(select(
+        func.count(NetworkNode.id), func.max(NetworkNode.updated_at), func.sum(NetworkNode.rollup_version)
+    )).one())
+
+
+def design_matrix(hours):
+    """Regressors for hour offsets `hours`: intercept, trend, then a sine/cosine pair per season"""
+    columns = [np.ones_like(hours), hours]
+    for period in SEASONS:
+        angle = 2 * np.pi * hours / period
+        columns += [np.sin(angle), np.cos(angle)]
+    return np.stack(columns, axis=1)
+
+
+def fit_nodes(loads, mask, hours):
+    """Least-squares fits for every row of `loads` (nodes x hours) at once, over the hours where `mask` is set.
+
+    Returns (coefficients, r2); a small ridge term keeps rows with little or no history solvable.
+    """
+    X = design_matrix(hours)
+    size = X.shape[1]
+    weights = mask.astype(float)
+    values = np.where(mask, loads, 0.0)
+
+    # Per-node normal equations X' W X and X' W y, as matrix products over all nodes
+    normal = (weights @ (X[:, :, None] * X[:, None, :]).reshape(len(hours), size * size)).reshape(-1, size, size)
+    normal += RIDGE * np.eye(size)
+    rhs = values @ X
+    coefficients = np.linalg.solve(normal, rhs[:, :, None])[:, :, 0]
+
+    observed = weights.sum(axis=1)
+    residual = np.where(mask, loads - coefficients @ X.T, 0.0)
+    mean = values.sum(axis=1) / np.maximum(observed, 1)
+    total = (np.where(mask, loads - mean[:, None], 0.0) ** 2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(total > 0, 1 - (residual ** 2).sum(axis=1) / total, 1.0)
+    return coefficients, r2
+
+
+def seasonal_peak(coefficients):
+    """Highest value each node's seasonal terms reach over one full week"""
+    week = np.arange(max(SEASONS), dtype=float)
+    return (coefficients[:, 2:] @ design_matrix(week)[:, 2:].T).max(axis=1)
+
+
+def load_history_matrix(node_ids, start, hours):
+    """Hourly average loads since `start` as a (nodes x hours) matrix and its observed-hours mask"""
+    table = NodeLoadRollup.__table__
+    # Hour offsets and averages computed in SQL, so no datetimes are built per row
+    rows = db.session.execute(
+        select(
+            table.c.node_id,
+            (epoch_seconds(table.c.bucket_start) - int((start - EPOCH).total_seconds())) // 3600,
+            type_coerce(table.c.load_sum * 1.0 / table.c.sample_count, Float)
+        ).where(table.c.resolution == 3600, table.c.bucket_start >= start, table.c.sample_count > 0)
+    ).all()
+    loads = np.zeros((len(node_ids), hours))
+    mask = np.zeros((len(node_ids), hours), dtype=bool)
+    if not rows:
+        return loads, mask
+
+    columns = np.array([tuple(row) for row in rows], dtype=float)  # plain tuples: numpy probes Row for a mapping
+    row_ids = columns[:, 0].astype(int)
+    offsets = columns[:, 1].astype(int)
+    positions = np.minimum(np.searchsorted(node_ids, row_ids), len(node_ids) - 1)
+    known = (node_ids[positions] == row_ids) & (offsets >= 0) & (offsets < hours)
+    loads[positions[known], offsets[known]] = columns[known, 2]
+    mask[positions[known], offsets[known]] = True
+    return loads, mask
+
+
+def build_forecast(now=None):
+    """Forecast every node; returns {'generated_at', 'nodes': [...]} in node id order"""
+    if np is None:
+        raise ForecastUnavailable('Capacity forecasting requires NumPy')
+    config = current_app.config
+    now = now or datetime.utcnow()
+    history_days = config.get('FORECAST_HISTORY_DAYS', DEFAULT_HISTORY_DAYS)
+    min_hours = config.get('FORECAST_MIN_HOURS', DEFAULT_MIN_HOURS)
+    horizon = config.get('FORECAST_HORIZON_DAYS', DEFAULT_HORIZON_DAYS) * 24
+
+    nodes = db.session.execute(select(
+        NetworkNode.id, NetworkNode.name, NetworkNode.status, NetworkNode.capacity, NetworkNode.current_load
+    ).order_by(NetworkNode.id)).all()
+    if not nodes:
+        return {'generated_at': now, 'nodes': []}
+
+    # Hour offsets are relative to now, so each intercept is the node's trend level at generation time
+    start = (now - timedelta(days=history_days)).replace(minute=0, second=0, microsecond=0)
+    hours = int((now - start).total_seconds() // 3600) + 1
+    node_ids = np.array([node.id for node in nodes])
+    loads, mask = load_history_matrix(node_ids, start, hours)
+    offsets = np.arange(hours) - (now - start).total_seconds() / 3600
+    coefficients, r2 = fit_nodes(loads, mask, offsets)
+
+    capacity = np.array([node.capacity for node in nodes], dtype=float)
+    observed = mask.sum(axis=1)
+    fitted = observed >= min_hours
+    level, slope = coefficients[:, 0], coefficients[:, 1]
+    peak = seasonal_peak(coefficients)
+    headroom = capacity - level - peak
+    with np.errstate(divide='ignore', invalid='ignore'):
+        to_saturation = np.where(headroom <= 0, 0.0, np.where(slope > 0, headroom / slope, np.inf))
+    projected = level + slope * horizon + peak
+
+    forecast = []
+    for index, node in enumerate(nodes):
+        entry = {
+            'id': node.id,
+            'name': node.name,
+            'status': node.status,
+            'capacity': node.capacity,
+            'current_load': node.current_load,
+            'load_percentage': round((node.current_load / node.capacity) * 100, 2) if node.capacity > 0 else 0,
+            'history_hours': int(observed[index]),
+            'trend_per_day': None,
+            'seasonal_peak': None,
+            'projected_peak': None,
+            'fit_r2': None,
+            'saturates_at': None,
+            'days_to_saturation': None
+        }
+        if fitted[index]:
+            entry.update(
+                trend_per_day=round(float(slope[index]) * 24, 3),
+                seasonal_peak=round(float(peak[index]), 2),
+                projected_peak=round(float(projected[index]), 2),
+                fit_r2=round(float(r2[index]), 4)
+            )
+            if np.isfinite(to_saturation[index]):
+                entry['saturates_at'] = now + timedelta(hours=float(to_saturation[index]))
+                entry['days_to_saturation'] = round(float(to_saturation[index]) / 24, 2)
+        forecast.append(entry)
+    return {'generated_at': now, 'nodes': forecast}
+
+
+def get_forecast():
+    """The cached forecast, rebuilt when the node data has changed since it was computed"""
+    stamp = data_stamp()
+    db.session.rollback()
+    cached_stamp, forecast = _cache['entry']
+    if cached_stamp == stamp:
+        return forecast, stamp
+
+    # Built from data at least as new as `stamp`, so a change during the build still triggers a rebuild
+    forecast = build_forecast()
+    _cache['entry'] = (stamp, forecast)
+    return forecast, stamp
+
+
+def sort_nodes(nodes, field, descending=False):
+    """Sort forecast entries by `field`, nodes without a value last in either direction"""
+    if field not in SORT_FIELDS:
+        raise ValueError('sort must be one of: %s' % ', '.join(SORT_FIELDS))
+    present = [node for node in nodes if node[field] is not None]
+    missing = [node for node in nodes if node[field] is None]
+    return sorted(present, key=lambda node: node[field], reverse=descending) + missing
+
+
+@forecast_cli.command('benchmark')
+@click.option('--nodes', default=2000, show_default=True)
+@click.option('--days', default=DEFAULT_HISTORY_DAYS, show_default=True, help='Days of hourly history per node.')
+def benchmark_command(nodes, days):
+    """Fit synthetic hourly history for `nodes` nodes in a scratch SQLite database."""
+    if np is None:
+        raise click.ClickException('Capacity forecasting requires NumPy')
+    with tempfile.TemporaryDirectory() as directory, scratch_database(directory):
+        current_app.config['FORECAST_HISTORY_DAYS'] = days
+        now = datetime.utcnow().replace(minute=30, second=0, microsecond=0)
+        db.session.execute(NetworkNode.__table__.insert(), [{
+            'name': 'Node %d' % number, 'location': {}, 'status': 'active', 'capacity': 1000, 'current_load': 0
+        } for number in range(nodes)])
+
+        # Known trend per node (-2..+6 per day) with a daily swing and noise
+        generator = np.random.default_rng(0)
+        trends = generator.uniform(-2, 6, nodes) / 24
+        hours = np.arange(-days * 24, 0)
+        levels = 400 + trends[:, None] * hours + 80 * np.sin(2 * np.pi * hours / 24) + generator.normal(0, 10, (nodes, len(hours)))
+        first = now.replace(minute=0) - timedelta(hours=days * 24)
+        buckets = [first + timedelta(hours=hour) for hour in range(len(hours))]
+        started = time.perf_counter()
+        rows = []
+        for node_index in range(nodes):
+            for hour, value in enumerate(np.maximum(levels[node_index], 0).round().astype(int).tolist()):
+                rows.append({'node_id': node_index + 1, 'resolution': 3600, 'bucket_start': buckets[hour],
+                             'sample_count': 1, 'load_sum': value, 'load_min': value, 'load_max': value})
+            if len(rows) >= 50000:
+                db.session.execute(NodeLoadRollup.__table__.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(NodeLoadRollup.__table__.insert(), rows)
+        db.session.commit()
+        click.echo('Seeded %d hourly buckets in %.1fs' % (nodes * len(hours), time.perf_counter() - started))
+
+        started = time.perf_counter()
+        forecast = build_forecast(now)
+        elapsed = time.perf_counter() - started
+        fitted = np.array([node['trend_per_day'] for node in forecast['nodes']], dtype=float)
+        error = np.abs(fitted - trends * 24)
+        click.echo('Forecast %d nodes in %.2fs; trend error per day: mean %.3f, max %.3f' % (
+            nodes, elapsed, error.mean(), error.max()))
+
+        get_forecast()
+        started = time.perf_counter()
+        get_forecast()
+        click.echo('Cached lookup: %.2f ms' % ((time.perf_counter() - started) * 1000))
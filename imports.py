@@ -0,0 +1,308 @@
+import csv
+import io
+import json
+import os
+from app import db
+from models import Customer, Equipment, Subscription, ServicePlan, ImportJob
+from rollups import adjust_active_subscriptions
+from search import index_rows
+from jobs import job_handler
+from datetime import datetime
+from collections import Counter
+from flask import current_app
+
+ENTITY_TYPES = ['customers', 'equipment', 'subscriptions']
+IMPORT_FORMATS = ['csv', 'ndjson']
+DEFAULT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+SUBSCRIPTION_STATUSES = ['active', 'inactive', 'cancelled', 'suspended']
+
+
+class RowError(ValueError):
+    """A single input row failed validation"""
+
+
+def read_records(stream, fmt):
+    """Yield (row number, record dict) from a binary CSV or NDJSON stream without reading it all into memory"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        for number, record in enumerate(csv.DictReader(text), start=2):
+            yield number, {key: (value if value != '' else None) for key, value in record.items()}
+        return
+
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None
+            continue
+        yield number, record if isinstance(record, dict) else None
+
+
+def _chunks(records, size):
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _required(record, *fields):
+    missing = [field for field in fields if not record.get(field)]
+    if missing:
+        raise RowError('missing required fields: %s' % ', '.join(missing))
+
+
+def _text_field(record, field):
+    """String columns must arrive as strings; NDJSON can carry any JSON type"""
+    value = record.get(field)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise RowError('%s must be a string' % field)
+    return value.strip()
+
+
+def _json_field(record, field):
+    """JSON columns arrive as objects in NDJSON and as JSON text in CSV"""
+    value = record.get(field)
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            raise RowError('%s is not valid JSON' % field)
+    return value
+
+
+def _int_field(record, field):
+    value = record[field]
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise RowError('%s must be an integer' % field)
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise RowError('%s must be an integer' % field)
+
+
+def _datetime_field(record, field):
+    value = record.get(field)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise RowError('%s must be an ISO datetime' % field)
+
+
+def _existing(column, values):
+    """The subset of `values` already present in `column`, in one set-based query"""
+    if not values:
+        return set()
+    return {value for (value,) in db.session.query(column).filter(column.in_(values))}
+
+
+def _prepare_customers(chunk, seen):
+    rows, errors, emails = [], [], []
+    for number, record in chunk:
+        try:
+            _required(record, 'name', 'email')
+            email = _text_field(record, 'email')
+            if email in seen:
+                raise RowError('duplicate email %s in file' % email)
+            rows.append((number, {
+                'name': _text_field(record, 'name'),
+                'email': email,
+                'phone': _text_field(record, 'phone'),
+                'personal_info': _json_field(record, 'personal_info'),
+                'contact_info': _json_field(record, 'contact_info'),
+                'billing_address': _json_field(record, 'billing_address'),
+                'service_address': _json_field(record, 'service_address'),
+            }))
+            seen.add(email)
+            emails.append(email)
+        except RowError as e:
+            errors.append({'row': number, 'error': str(e)})
+
+    taken = _existing(Customer.email, emails)
+    kept = []
+    for number, row in rows:
+        if row['email'] in taken:
+            errors.append({'row': number, 'error': 'customer with email %s already exists' % row['email']})
+        else:
+            kept.append(row)
+    return kept, errors
+
+
+def _prepare_equipment(chunk, seen):
+    rows, errors, serials, customer_ids = [], [], [], set()
+    for number, record in chunk:
+        try:
+            _required(record, 'customer_id', 'type', 'model', 'serial_number')
+            serial = _text_field(record, 'serial_number')
+            if serial in seen:
+                raise RowError('duplicate serial_number %s in file' % serial)
+            row = {
+                'customer_id': _int_field(record, 'customer_id'),
+                'type': _text_field(record, 'type'),
+                'model': _text_field(record, 'model'),
+                'serial_number': serial,
+                'mac_address': _text_field(record, 'mac_address'),
+                'status': _text_field(record, 'status') or 'active',
+                'installed_date': _datetime_field(record, 'installed_date') or datetime.utcnow(),
+            }
+            rows.append((number, row))
+            seen.add(serial)
+            serials.append(serial)
+            customer_ids.add(row['customer_id'])
+        except RowError as e:
+            errors.append({'row': number, 'error': str(e)})
+
+    taken = _existing(Equipment.serial_number, serials)
+    known_customers = _existing(Customer.id, list(customer_ids))
+    kept = []
+    for number, row in rows:
+        if row['serial_number'] in taken:
+            errors.append({'row': number, 'error': 'equipment with serial_number %s already exists' % row['serial_number']})
+        elif row['customer_id'] not in known_customers:
+            errors.append({'row': number, 'error': 'customer %s not found' % row['customer_id']})
+        else:
+            kept.append(row)
+    return kept, errors
+
+
+def _prepare_subscriptions(chunk, seen):
+    rows, errors, customer_ids, plan_ids = [], [], set(), set()
+    for number, record in chunk:
+        try:
+            _required(record, 'customer_id', 'plan_id')
+            status = _text_field(record, 'status') or 'active'
+            if status not in SUBSCRIPTION_STATUSES:
+                raise RowError('invalid status %s' % status)
+            row = {
+                'customer_id': _int_field(record, 'customer_id'),
+                'plan_id': _int_field(record, 'plan_id'),
+                'status': status,
+                'payment_method': _text_field(record, 'payment_method') or 'cash',
+                'start_date': _datetime_field(record, 'start_date') or datetime.utcnow(),
+                'end_date': _datetime_field(record, 'end_date'),
+            }
+            if status == 'active':
+                if row['customer_id'] in seen:
+                    raise RowError('customer %s has more than one active subscription in file' % row['customer_id'])
+                seen.add(row['customer_id'])
+            rows.append((number, row))
+            customer_ids.add(row['customer_id'])
+            plan_ids.add(row['plan_id'])
+        except RowError as e:
+            errors.append({'row': number, 'error': str(e)})
+
+    known_customers = _existing(Customer.id, list(customer_ids))
+    known_plans = _existing(ServicePlan.id, list(plan_ids))
+    already_active = {
+        customer_id for (customer_id,) in db.session.query(Subscription.customer_id).filter(
+            Subscription.customer_id.in_(list(customer_ids)),
+            Subscription.status == 'active'
+        )
+    } if customer_ids else set()
+
+    kept = []
+    for number, row in rows:
+        if row['customer_id'] not in known_customers:
+            errors.append({'row': number, 'error': 'customer %s not found' % row['customer_id']})
+        elif row['plan_id'] not in known_plans:
+            errors.append({'row': number, 'error': 'plan %s not found' % row['plan_id']})
+        elif row['status'] == 'active' and row['customer_id'] in already_active:
+            errors.append({'row': number, 'error': 'customer %s already has an active subscription' % row['customer_id']})
+        else:
+            kept.append(row)
+    return kept, errors
+
+
+def _insert_customers(rows):
+    db.session.execute(Customer.__table__.insert(), rows)
+    created = db.session.query(
+        Customer.id, Customer.name, Customer.email, Customer.phone,
+        Customer.billing_address, Customer.service_address
+    ).filter(Customer.email.in_([row['email'] for row in rows]))
+    index_rows('customer', [dict(row._mapping) for row in created])
+
+
+def _insert_equipment(rows):
+    db.session.execute(Equipment.__table__.insert(), rows)
+    created = db.session.query(
+        Equipment.id, Equipment.type, Equipment.model, Equipment.serial_number, Equipment.mac_address
+    ).filter(Equipment.serial_number.in_([row['serial_number'] for row in rows]))
+    index_rows('equipment', [dict(row._mapping) for row in created])
+
+
+def _insert_subscriptions(rows):
+    db.session.execute(Subscription.__table__.insert(), rows)
+    active = Counter(row['plan_id'] for row in rows if row['status'] == 'active')
+    for plan_id, count in active.items():
+        adjust_active_subscriptions(plan_id, count)
+
+
+PIPELINES = {
+    'customers': (_prepare_customers, _insert_customers),
+    'equipment': (_prepare_equipment, _insert_equipment),
+    'subscriptions': (_prepare_subscriptions, _insert_subscriptions),
+}
+
+
+def run_import(job_id, stream, fmt, chunk_size=None):
+    """Validate and insert an upload chunk by chunk, committing each chunk together with the job's progress"""
+    chunk_size = chunk_size or current_app.config.get('IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    job = db.session.get(ImportJob, job_id)
+    prepare, insert = PIPELINES[job.entity_type]
+
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    seen = set()
+    reported = []
+    try:
+        for chunk in _chunks(read_records(stream, fmt), chunk_size):
+            errors = [{'row': number, 'error': 'row is not a JSON object'} for number, record in chunk if record is None]
+            rows, row_errors = prepare([(number, record) for number, record in chunk if record is not None], seen)
+            errors.extend(row_errors)
+
+            if rows:
+                insert(rows)
+
+            reported.extend(errors[:MAX_REPORTED_ERRORS - len(reported)])
+            job.processed_rows += len(chunk)
+            job.inserted_rows += len(rows)
+            job.error_count += len(errors)
+            job.errors = sorted(reported, key=lambda error: error['row'])
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(ImportJob, job_id)
+        job.status = 'failed'
+        job.message = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        raise
+
+    job.status = 'completed'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+@job_handler('import')
+def import_job(payload):
+    """Job runner entry point: import a spooled upload file, then delete it"""
+    try:
+        with open(payload['path'], 'rb') as stream:
+            job = run_import(payload['import_job_id'], stream, payload['format'])
+    finally:
+        os.remove(payload['path'])
+    return {'import_job_id': job.id, 'inserted_rows': job.inserted_rows, 'error_count': job.error_count}
@@ -0,0 +1,229 @@
+"""Durable background jobs, run by `flask jobs worker` with no external broker.
+
+Request handlers call `enqueue(kind, payload)` inside their own transaction and return 202 with the
+job id; the job becomes visible to workers when that transaction commits, so work is never started
+for a request that rolled back. Clients poll GET /api/jobs/<id>.
+
+Workers claim a queued job with a compare-and-set UPDATE (status 'queued' -> 'running'), so any
+number of worker threads and processes can share the table. A job whose handler raises is retried
+with exponential backoff (JOB_BACKOFF_SECONDS * 2^(attempt-1), capped at JOB_BACKOFF_MAX_SECONDS)
+until max_attempts, then marked failed. Jobs left 'running' by a worker that died are released
+again after JOB_LOCK_TIMEOUT_SECONDS, so handlers must be safe to run more than once; a worker that
+finishes after its lock was released drops its outcome instead of overwriting the new attempt's.
+
+Handlers are registered per kind with `@job_handler('kind')`; they receive the payload dict and
+return a JSON-serializable result that is stored on the job.
+"""
+import os
+import socket
+import threading
+import time
+import click
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, update
+from app import db
+from models import Job
+
+jobs_cli = AppGroup('jobs', help='Background job runner.')
+
+JOB_STATUSES = ['queued', 'running', 'succeeded', 'failed']
+DEFAULT_MAX_ATTEMPTS = 3
+MAX_ERROR_LENGTH = 2000
+STALE_CHECK_SECONDS = 60
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler for jobs of `kind`"""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, payload=None, created_by=None, max_attempts=None, delay=0):
+    """Add a job to the current transaction; it runs once the caller commits"""
+    if kind not in HANDLERS:
+        raise ValueError('No handler registered for job kind %r' % kind)
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        status='queued',
+        attempts=0,
+        max_attempts=max_attempts or current_app.config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        run_after=datetime.utcnow() + timedelta(seconds=delay),
+        created_by=created_by
+    )
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def backoff(attempts):
+    """Delay before retrying a job that has failed `attempts` times"""
+    config = current_app.config
+    return min(config.get('JOB_BACKOFF_SECONDS', 5) * 2 ** (attempts - 1), config.get('JOB_BACKOFF_MAX_SECONDS', 600))
+
+
+def claim_next(worker_id):
+    """Atomically take the oldest due job, or return None when nothing is due"""
+    while True:
+        now = datetime.utcnow()
+        candidate = db.session.query(Job.id).filter(
+            Job.status == 'queued', Job.run_after <= now
+        ).order_by(Job.run_after, Job.id).limit(1).scalar()
+        if candidate is None:
+            db.session.rollback()
+            return None
+
+        # Another worker may have claimed the same row since the SELECT; only one UPDATE matches
+        claimed = db.session.execute(
+            update(Job).where(Job.id == candidate, Job.status == 'queued').values(
+                status='running', attempts=Job.attempts + 1, locked_by=worker_id, locked_at=now,
+                started_at=now, finished_at=None
+            )
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate)
+
+
+def _finish(job_id, worker_id, **values):
+    """Record a job's outcome if `worker_id` still holds it; False when its lock was released meanwhile"""
+    finished = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.locked_by == worker_id, Job.status == 'running').values(
+            locked_by=None, locked_at=None, **values
+        )
+    ).rowcount
+    db.session.commit()
+    return finished == 1
+
+
+def run_job(job):
+    """Run a claimed job's handler and record the result, a retry or the final failure.
+
+    The outcome is only written while this worker still holds the job. If its lock expired and the job
+    was released (and perhaps claimed again), the outcome is dropped and None is returned.
+    """
+    job_id, kind, worker_id, attempts, max_attempts = job.id, job.kind, job.locked_by, job.attempts, job.max_attempts
+    handler = HANDLERS.get(kind)
+    try:
+        if handler is None:
+            raise LookupError('No handler registered for job kind %r' % kind)
+        result = handler(dict(job.payload or {}))
+    except Exception as e:
+        db.session.rollback()
+        error = ('%s: %s' % (e.__class__.__name__, e))[:MAX_ERROR_LENGTH]
+        if attempts < max_attempts:
+            run_after = datetime.utcnow() + timedelta(seconds=backoff(attempts))
+            if not _finish(job_id, worker_id, status='queued', run_after=run_after, error=error):
+                current_app.logger.warning('Job %s (%s) lost its lock; dropping the failed attempt', job_id, kind)
+                return None
+            current_app.logger.warning('Job %s (%s) attempt %d failed, retrying at %s: %s',
+                                       job_id, kind, attempts, run_after.isoformat(), e)
+        else:
+            if not _finish(job_id, worker_id, status='failed', error=error, finished_at=datetime.utcnow()):
+                current_app.logger.warning('Job %s (%s) lost its lock; dropping the failed attempt', job_id, kind)
+                return None
+            current_app.logger.exception('Job %s (%s) failed after %d attempts', job_id, kind, attempts)
+        return db.session.get(Job, job_id)
+
+    if not _finish(job_id, worker_id, status='succeeded', result=result, error=None, finished_at=datetime.utcnow()):
+        current_app.logger.warning('Job %s (%s) lost its lock; dropping its result', job_id, kind)
+        return None
+    return db.session.get(Job, job_id)
+
+
+def release_stale():
+    """Requeue (or fail, when out of attempts) jobs whose worker stopped before finishing them"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config.get('JOB_LOCK_TIMEOUT_SECONDS', 900))
+    stale = and_(Job.status == 'running', Job.locked_at < cutoff)
+    released = db.session.execute(
+        update(Job).where(stale, Job.attempts < Job.max_attempts).values(
+            status='queued', locked_by=None, locked_at=None, run_after=datetime.utcnow(),
+            error='Worker lock expired'
+        )
+    ).rowcount
+    failed = db.session.execute(
+        update(Job).where(stale, Job.attempts >= Job.max_attempts).values(
+            status='failed', locked_by=None, locked_at=None, finished_at=datetime.utcnow(),
+            error='Worker lock expired'
+        )
+    ).rowcount
+    db.session.commit()
+    return released, failed
+
+
+def work(app, worker_id, stop, poll_interval, burst):
+    """Worker thread loop: run jobs until `stop` is set (or, in burst mode, until none are due)"""
+    processed = 0
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                job = claim_next(worker_id)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Worker %s could not claim a job', worker_id)
+                job = None
+            if job is None:
+                if burst:
+                    break
+                stop.wait(poll_interval)
+                continue
+            run_job(job)
+            processed += 1
+            db.session.remove()
+    return processed
+
+
+@jobs_cli.command('worker')
+@click.option('--concurrency', default=None, type=int, help='Worker threads (default JOB_WORKER_CONCURRENCY).')
+@click.option('--poll-interval', default=None, type=float, help='Seconds to sleep when idle (default JOB_POLL_SECONDS).')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of polling.')
+def worker_command(concurrency, poll_interval, burst):
+    """Run queued jobs."""
+    app = current_app._get_current_object()
+    concurrency = concurrency or app.config.get('JOB_WORKER_CONCURRENCY', 4)
+    poll_interval = poll_interval if poll_interval is not None else app.config.get('JOB_POLL_SECONDS', 1)
+    prefix = '%s:%d' % (socket.gethostname(), os.getpid())
+
+    released, failed = release_stale()
+    if released or failed:
+        click.echo('Released %d stale job(s), failed %d' % (released, failed))
+
+    stop = threading.Event()
+    counts = []
+
+    def run(number):
+        counts.append(work(app, '%s:%d' % (prefix, number), stop, poll_interval, burst))
+
+    threads = [threading.Thread(target=run, args=(number,), name='job-worker-%d' % number, daemon=True)
+               for number in range(concurrency)]
+    click.echo('Worker %s running %d thread(s)' % (prefix, concurrency))
+    for thread in threads:
+        thread.start()
+    next_release = time.monotonic() + STALE_CHECK_SECONDS
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+            if not burst and time.monotonic() >= next_release:
+                release_stale()
+                next_release = time.monotonic() + STALE_CHECK_SECONDS
+    except KeyboardInterrupt:
+        click.echo('Stopping after the running jobs finish...')
+        stop.set()
+        for thread in threads:
+            thread.join()
+    click.echo('Processed %d job(s)' % sum(counts))
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Count jobs by kind and status."""
+    rows = db.session.query(Job.kind, Job.status, db.func.count(Job.id)).group_by(Job.kind, Job.status).all()
+    for kind, status, count in sorted(rows):
+        click.echo('%-20s %-10s %d' % (kind, status, count))
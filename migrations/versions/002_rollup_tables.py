@@ -0,0 +1,55 @@
+"""Revenue and subscription rollup tables
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Completed revenue per day, plan and payment method
+    op.create_table('revenue_rollup',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('plan_id', sa.Integer(), nullable=False),
+        sa.Column('payment_method', sa.String(length=50), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('payment_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['plan_id'], ['service_plan.id'], ),
+        sa.PrimaryKeyConstraint('day', 'plan_id', 'payment_method')
+    )
+    
+    # Active subscriptions per plan
+    op.create_table('plan_subscription_rollup',
+        sa.Column('plan_id', sa.Integer(), nullable=False),
+        sa.Column('active_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['plan_id'], ['service_plan.id'], ),
+        sa.PrimaryKeyConstraint('plan_id')
+    )
+    
+    # Backfill from existing payments and subscriptions (`flask rollups rebuild` recomputes them later)
+    day = 'date(p.payment_date)' if op.get_bind().dialect.name == 'sqlite' else 'CAST(p.payment_date AS DATE)'
+    op.execute(
+        "INSERT INTO revenue_rollup (day, plan_id, payment_method, amount, payment_count) "
+        "SELECT " + day + ", s.plan_id, p.payment_method, SUM(p.amount), COUNT(p.id) "
+        "FROM payment p JOIN subscription s ON s.id = p.subscription_id "
+        "WHERE p.status = 'completed' "
+        "GROUP BY " + day + ", s.plan_id, p.payment_method"
+    )
+    op.execute(
+        "INSERT INTO plan_subscription_rollup (plan_id, active_count) "
+        "SELECT plan_id, COUNT(id) FROM subscription WHERE status = 'active' GROUP BY plan_id"
+    )
+
+
+def downgrade():
+    op.drop_table('plan_subscription_rollup')
+    op.drop_table('revenue_rollup')
@@ -0,0 +1,48 @@
+"""Secondary indexes for the hot route filters
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # Customer-role authorization lookup and recent-activity ordering
+    ('ix_customer_user_id', 'customer', ['user_id']),
+    ('ix_customer_created_at', 'customer', ['created_at']),
+    # "Has an active subscription" checks, plan popularity/deletion, status listing
+    ('ix_subscription_customer_id_status', 'subscription', ['customer_id', 'status']),
+    ('ix_subscription_plan_id_status', 'subscription', ['plan_id', 'status']),
+    ('ix_subscription_status_end_date', 'subscription', ['status', 'end_date']),
+    # Payment listing by status ordered by date, per-subscription history
+    ('ix_payment_status_payment_date', 'payment', ['status', 'payment_date']),
+    ('ix_payment_payment_date', 'payment', ['payment_date']),
+    ('ix_payment_subscription_id', 'payment', ['subscription_id']),
+    # Ticket listing by status/customer/assignee ordered by creation time
+    ('ix_ticket_status_created_at', 'ticket', ['status', 'created_at']),
+    ('ix_ticket_customer_id_created_at', 'ticket', ['customer_id', 'created_at']),
+    ('ix_ticket_assigned_to_created_at', 'ticket', ['assigned_to', 'created_at']),
+    ('ix_ticket_created_at', 'ticket', ['created_at']),
+    # Equipment filters and per-customer listing
+    ('ix_equipment_type_status', 'equipment', ['type', 'status']),
+    ('ix_equipment_status', 'equipment', ['status']),
+    ('ix_equipment_customer_id', 'equipment', ['customer_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
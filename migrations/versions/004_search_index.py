@@ -0,0 +1,79 @@
+"""Full-text search index (SQLite FTS5)
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+# Same document layout as search.py; rowid = entity id * 4 + type code
+TYPE_CODES = {'customer': 1, 'ticket': 2, 'equipment': 3}
+
+
+def _flatten(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value[:1] in ('{', '['):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+    if isinstance(value, dict):
+        return ' '.join(_flatten(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return ' '.join(_flatten(item) for item in value)
+    return str(value)
+
+
+def _documents(bind):
+    for id_, name, email, phone, billing, service in bind.execute(sa.text(
+            'SELECT id, name, email, phone, billing_address, service_address FROM customer')):
+        yield 'customer', id_, name, ' '.join(filter(None, [email, phone, _flatten(billing), _flatten(service)]))
+    for id_, title, description in bind.execute(sa.text('SELECT id, title, description FROM ticket')):
+        yield 'ticket', id_, title, description or ''
+    for id_, serial_number, model, mac_address, type_ in bind.execute(sa.text(
+            'SELECT id, serial_number, model, mac_address, type FROM equipment')):
+        yield 'equipment', id_, serial_number, ' '.join(filter(None, [model, mac_address, type_]))
+
+
+def upgrade():
+    # Other backends fall back to LIKE search (see search.py)
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "entity_type UNINDEXED, entity_id UNINDEXED, title, body, "
+        "tokenize='unicode61', prefix='2 3')"
+    )
+    
+    # Index existing customers, tickets and equipment
+    bind = op.get_bind()
+    rows = [{
+        'rowid': entity_id * 4 + TYPE_CODES[entity_type],
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'title': title,
+        'body': body
+    } for entity_type, entity_id, title, body in _documents(bind)]
+    if rows:
+        bind.execute(sa.text(
+            'INSERT INTO search_index (rowid, entity_type, entity_id, title, body) '
+            'VALUES (:rowid, :entity_type, :entity_id, :title, :body)'
+        ), rows)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    
+    op.execute('DROP TABLE IF EXISTS search_index')
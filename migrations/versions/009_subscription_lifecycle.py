@@ -0,0 +1,43 @@
+"""Subscription auto-renewal and lifecycle transitions
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('auto_renew', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    op.create_table('subscription_transition',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subscription_id', sa.Integer(), nullable=False),
+        sa.Column('run_id', sa.String(length=36), nullable=False),
+        sa.Column('action', sa.String(length=20), nullable=False),
+        sa.Column('from_status', sa.String(length=50), nullable=False),
+        sa.Column('to_status', sa.String(length=50), nullable=False),
+        sa.Column('end_date', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['subscription_id'], ['subscription.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_subscription_transition_subscription_id', 'subscription_transition', ['subscription_id'])
+    op.create_index('ix_subscription_transition_run_id', 'subscription_transition', ['run_id'])
+
+
+def downgrade():
+    op.drop_index('ix_subscription_transition_run_id', table_name='subscription_transition')
+    op.drop_index('ix_subscription_transition_subscription_id', table_name='subscription_transition')
+    op.drop_table('subscription_transition')
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.drop_column('auto_renew')
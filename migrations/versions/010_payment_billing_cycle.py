@@ -0,0 +1,27 @@
+"""Payment billing cycle
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('billing_cycle', sa.String(length=7), nullable=True))
+        batch_op.create_unique_constraint('uq_payment_subscription_id_billing_cycle', ['subscription_id', 'billing_cycle'])
+
+
+def downgrade():
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_payment_subscription_id_billing_cycle', type_='unique')
+        batch_op.drop_column('billing_cycle')
@@ -0,0 +1,53 @@
+"""Network node load telemetry
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('network_node', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('load_sampled_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('rollup_version', sa.Integer(), nullable=False, server_default='0'))
+
+    op.create_table('node_load_sample',
+        sa.Column('node_id', sa.Integer(), nullable=False),
+        sa.Column('sampled_at', sa.DateTime(), nullable=False),
+        sa.Column('load', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['node_id'], ['network_node.id'], ),
+        sa.PrimaryKeyConstraint('node_id', 'sampled_at')
+    )
+    op.create_index('ix_node_load_sample_sampled_at', 'node_load_sample', ['sampled_at'])
+
+    op.create_table('node_load_rollup',
+        sa.Column('node_id', sa.Integer(), nullable=False),
+        sa.Column('resolution', sa.Integer(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('sample_count', sa.Integer(), nullable=False),
+        sa.Column('load_sum', sa.BigInteger(), nullable=False),
+        sa.Column('load_min', sa.Integer(), nullable=False),
+        sa.Column('load_max', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['node_id'], ['network_node.id'], ),
+        sa.PrimaryKeyConstraint('node_id', 'resolution', 'bucket_start')
+    )
+    op.create_index('ix_node_load_rollup_resolution_bucket_start', 'node_load_rollup', ['resolution', 'bucket_start'])
+
+
+def downgrade():
+    op.drop_index('ix_node_load_rollup_resolution_bucket_start', table_name='node_load_rollup')
+    op.drop_table('node_load_rollup')
+    op.drop_index('ix_node_load_sample_sampled_at', table_name='node_load_sample')
+    op.drop_table('node_load_sample')
+    with op.batch_alter_table('network_node', schema=None) as batch_op:
+        batch_op.drop_column('rollup_version')
+        batch_op.drop_column('load_sampled_at')
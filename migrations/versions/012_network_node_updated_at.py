@@ -0,0 +1,23 @@
+"""Index network_node.updated_at for incremental spatial index sync
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_network_node_updated_at', 'network_node', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_network_node_updated_at', table_name='network_node')
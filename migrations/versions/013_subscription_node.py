@@ -0,0 +1,36 @@
+"""Serving network node on subscriptions and the node admission counter for capacity admission
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('node_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_subscription_node_id_network_node', 'network_node', ['node_id'], ['id'])
+        batch_op.create_index('ix_subscription_node_id_status', ['node_id', 'status'])
+
+    # No subscription has a node yet, so every node starts with nothing reserved
+    with op.batch_alter_table('network_node', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('reserved_load', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('network_node', schema=None) as batch_op:
+        batch_op.drop_column('reserved_load')
+
+    with op.batch_alter_table('subscription', schema=None) as batch_op:
+        batch_op.drop_index('ix_subscription_node_id_status')
+        batch_op.drop_constraint('fk_subscription_node_id_network_node', type_='foreignkey')
+        batch_op.drop_column('node_id')
@@ -0,0 +1,36 @@
+"""Ticket claim queue: priority rank, lease expiry and queue index
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('priority_rank', sa.SmallInteger(), nullable=False, server_default='2'))
+        batch_op.add_column(sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+
+    op.execute(
+        "UPDATE ticket SET priority_rank = CASE priority "
+        "WHEN 'urgent' THEN 0 WHEN 'high' THEN 1 WHEN 'low' THEN 3 ELSE 2 END"
+    )
+    op.create_index('ix_ticket_claim_queue', 'ticket', ['status', 'assigned_to', 'priority_rank', 'created_at'])
+    op.create_index('ix_ticket_lease_expires_at', 'ticket', ['lease_expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_ticket_lease_expires_at', table_name='ticket')
+    op.drop_index('ix_ticket_claim_queue', table_name='ticket')
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('priority_rank')
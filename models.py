@@ -1,5 +1,6 @@
 from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password
+from serialization import SerializerRegistry
 from datetime import datetime
 
 class User(db.Model):
@@ -11,11 +12,12 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Hashing runs on the bounded pool in passwords.py; both raise PasswordPoolBusy when it is full (PasswordPoolTimeout when a hash times out)
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -32,6 +34,11 @@ class Customer(db.Model):
 
     user = db.relationship('User', backref=db.backref('customer_profile', uselist=False))
 
+    __table_args__ = (
+        db.Index('ix_customer_user_id', 'user_id'),
+        db.Index('ix_customer_created_at', 'created_at'),
+    )
+
 class ServicePlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -51,12 +58,32 @@ class Subscription(db.Model):
     end_date = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(50), nullable=False, default='active')  # active, inactive, cancelled, suspended
     payment_method = db.Column(db.String(50), nullable=False)  # credit_card, bank_transfer, cash
+    auto_renew = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    node_id = db.Column(db.Integer, db.ForeignKey('network_node.id'), nullable=True)  # serving node; holds one unit of its reserved_load while active (see capacity.py)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     customer = db.relationship('Customer', backref=db.backref('subscriptions', lazy=True))
     plan = db.relationship('ServicePlan', backref=db.backref('subscriptions', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_subscription_customer_id_status', 'customer_id', 'status'),
+        db.Index('ix_subscription_plan_id_status', 'plan_id', 'status'),
+        db.Index('ix_subscription_status_end_date', 'status', 'end_date'),
+        db.Index('ix_subscription_node_id_status', 'node_id', 'status'),
+    )
+
+# Expiries and renewals applied by the subscription lifecycle run (see subscription_lifecycle.py)
+class SubscriptionTransition(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscription.id'), nullable=False, index=True)
+    run_id = db.Column(db.String(36), nullable=False, index=True)
+    action = db.Column(db.String(20), nullable=False)  # expired, renewed
+    from_status = db.Column(db.String(50), nullable=False)
+    to_status = db.Column(db.String(50), nullable=False)
+    end_date = db.Column(db.DateTime, nullable=True)  # end date after the transition
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscription.id'), nullable=False)
@@ -65,10 +92,24 @@ class Payment(db.Model):
     payment_method = db.Column(db.String(50), nullable=False)  # credit_card, bank_transfer, cash
     transaction_id = db.Column(db.String(100), nullable=True)
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, completed, failed, refunded
+    billing_cycle = db.Column(db.String(7), nullable=True)  # 'YYYY-MM' for billing-run charges, None for manual payments
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     subscription = db.relationship('Subscription', backref=db.backref('payments', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_payment_status_payment_date', 'status', 'payment_date'),
+        db.Index('ix_payment_payment_date', 'payment_date'),
+        db.Index('ix_payment_subscription_id', 'subscription_id'),
+        db.UniqueConstraint('subscription_id', 'billing_cycle', name='uq_payment_subscription_id_billing_cycle'),
+    )
+
+# Claim queue order of each priority, lowest first (see ticket_queue.py)
+TICKET_PRIORITY_RANKS = {'urgent': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+def ticket_priority_rank(priority):
+    return TICKET_PRIORITY_RANKS.get(priority, TICKET_PRIORITY_RANKS['medium'])
+
 class Ticket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
@@ -77,6 +118,11 @@ class Ticket(db.Model):
     description = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default='open')  # open, in_progress, resolved, closed
     priority = db.Column(db.String(10), default='medium')  # low, medium, high, urgent
+    priority_rank = db.Column(
+        db.SmallInteger, nullable=False, server_default='2',
+        default=lambda context: ticket_priority_rank(context.get_current_parameters().get('priority'))
+    )  # TICKET_PRIORITY_RANKS[priority]; set together with priority
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # claimed through the queue and still open: back in the queue after this
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     resolved_at = db.Column(db.DateTime, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -84,6 +130,15 @@ class Ticket(db.Model):
     customer = db.relationship('Customer', backref=db.backref('tickets', lazy=True))
     assigned_user = db.relationship('User', backref=db.backref('assigned_tickets', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_ticket_status_created_at', 'status', 'created_at'),
+        db.Index('ix_ticket_customer_id_created_at', 'customer_id', 'created_at'),
+        db.Index('ix_ticket_assigned_to_created_at', 'assigned_to', 'created_at'),
+        db.Index('ix_ticket_created_at', 'created_at'),
+        db.Index('ix_ticket_claim_queue', 'status', 'assigned_to', 'priority_rank', 'created_at'),
+        db.Index('ix_ticket_lease_expires_at', 'lease_expires_at'),
+    )
+
 class Equipment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
@@ -97,6 +152,12 @@ class Equipment(db.Model):
 
     customer = db.relationship('Customer', backref=db.backref('equipment', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_equipment_type_status', 'type', 'status'),
+        db.Index('ix_equipment_status', 'status'),
+        db.Index('ix_equipment_customer_id', 'customer_id'),
+    )
+
 class NetworkNode(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -104,5 +165,163 @@ class NetworkNode(db.Model):
     status = db.Column(db.String(20), default='active')  # active, inactive, maintenance
     capacity = db.Column(db.Integer, nullable=False)  # Maximum connections
     current_load = db.Column(db.Integer, default=0)  # Current connections
+    reserved_load = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # units held by active subscriptions; only +/- deltas (see capacity.py)
+    load_sampled_at = db.Column(db.DateTime, nullable=True)  # time of the telemetry sample current_load came from
+    rollup_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # bumped by every telemetry rollup write for the node
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_network_node_updated_at', 'updated_at'),
+    )
+
+# Raw node load samples reported by pollers, kept for TELEMETRY_RETENTION_RAW_HOURS (see telemetry.py)
+class NodeLoadSample(db.Model):
+    node_id = db.Column(db.Integer, db.ForeignKey('network_node.id'), primary_key=True)
+    sampled_at = db.Column(db.DateTime, primary_key=True)
+    load = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_node_load_sample_sampled_at', 'sampled_at'),
+    )
+
+# Node load downsampled to 1-minute and 1-hour buckets, updated as samples arrive (see telemetry.py)
+class NodeLoadRollup(db.Model):
+    node_id = db.Column(db.Integer, db.ForeignKey('network_node.id'), primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True)  # bucket width in seconds: 60 or 3600
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+    load_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    load_min = db.Column(db.Integer, nullable=False)
+    load_max = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_node_load_rollup_resolution_bucket_start', 'resolution', 'bucket_start'),
+    )
+
+# Completed revenue per day/plan/payment method, kept in step with payment writes (see rollups.py)
+class RevenueRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    plan_id = db.Column(db.Integer, db.ForeignKey('service_plan.id'), primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Active subscriptions per plan, kept in step with subscription writes (see rollups.py)
+class PlanSubscriptionRollup(db.Model):
+    plan_id = db.Column(db.Integer, db.ForeignKey('service_plan.id'), primary_key=True)
+    active_count = db.Column(db.Integer, nullable=False, default=0)
+
+class ImportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)  # customers, equipment, subscriptions
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    inserted_rows = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.JSON, nullable=True)  # First MAX_REPORTED_ERRORS per-row errors: {'row': n, 'error': '...'}
+    message = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def rows_per_second(self):
+        if not self.started_at:
+            return 0.0
+        elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return round(self.processed_rows / elapsed, 1) if elapsed > 0 else float(self.processed_rows)
+
+# Revoked JWTs; rows are only needed until the token itself expires (see token_revocation.py)
+class RevokedToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=False, unique=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Durable background job queue, claimed and run by `flask jobs worker` (see jobs.py)
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+# Single-row clock stamped on the primary and copied to replicas with the data (see replicas.py)
+class ReplicaHeartbeat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.DateTime, nullable=False)
+
+# Response shapes, one registry per model (see serialization.py); datetimes stay native until encoded
+Customer.serializers = SerializerRegistry(
+    Customer,
+    list=['id', 'name', 'email', 'phone', 'billing_address', 'service_address', 'created_at'],
+    detail=['id', 'name', 'email', 'phone', 'personal_info', 'contact_info', 'billing_address',
+            'service_address', 'created_at', 'updated_at'],
+)
+
+ServicePlan.serializers = SerializerRegistry(
+    ServicePlan,
+    catalog=['id', 'name', 'description', 'speed', 'data_cap', 'price', 'is_active'],
+    detail=['id', 'name', 'description', 'speed', 'data_cap', 'price', 'is_active', 'created_at', 'updated_at'],
+)
+
+Subscription.serializers = SerializerRegistry(
+    Subscription,
+    list=['id', ('customer_name', 'customer.name'), ('plan_name', 'plan.name'), 'status', 'start_date', 'end_date'],
+    customer=['id', ('plan_name', 'plan.name'), ('plan_price', 'plan.price'), 'start_date', 'end_date', 'status',
+              'payment_method'],
+    detail=['id', 'customer_id', ('customer_name', 'customer.name'), 'plan_id', ('plan_name', 'plan.name'),
+            ('plan_price', 'plan.price'), 'start_date', 'end_date', 'status', 'payment_method', 'auto_renew', 'node_id'],
+)
+
+Payment.serializers = SerializerRegistry(
+    Payment,
+    list=['id', 'subscription_id', ('customer_name', 'subscription.customer.name'), 'amount', 'payment_date',
+          'payment_method', 'transaction_id', 'status'],
+    subscription=['id', 'amount', 'payment_date', 'payment_method', 'transaction_id', 'status'],
+)
+
+Ticket.serializers = SerializerRegistry(
+    Ticket,
+    list=['id', 'title', 'description', 'status', 'priority', 'created_at', ('customer_name', 'customer.name'),
+          ('assigned_to', 'assigned_user.username')],
+    detail=['id', 'title', 'description', 'status', 'priority', 'created_at', 'resolved_at',
+            ('customer_name', 'customer.name'), ('assigned_to', 'assigned_user.username'), 'lease_expires_at'],
+    claim=['id', 'customer_id', 'title', 'description', 'status', 'priority', 'created_at', 'lease_expires_at'],
+)
+
+Equipment.serializers = SerializerRegistry(
+    Equipment,
+    list=['id', ('customer_name', 'customer.name'), 'type', 'model', 'serial_number', 'mac_address', 'status',
+          'installed_date'],
+    customer=['id', 'type', 'model', 'serial_number', 'mac_address', 'status', 'installed_date'],
+)
+
+NetworkNode.serializers = SerializerRegistry(
+    NetworkNode,
+    detail=['id', 'name', 'location', 'status', 'capacity', 'current_load', 'reserved_load',
+            ('load_percentage', lambda node: round((node.current_load / node.capacity) * 100, 2) if node.capacity > 0 else 0),
+            'created_at', 'updated_at'],
+)
+
+Job.serializers = SerializerRegistry(
+    Job,
+    detail=['id', 'kind', 'status', 'attempts', 'max_attempts', 'run_after', 'result', 'error', 'created_at',
+            'started_at', 'finished_at'],
+)
@@ -0,0 +1,80 @@
+import base64
+import json
+from datetime import datetime, date
+from sqlalchemy import tuple_, DateTime, Date
+
+MAX_PER_PAGE = 100
+
+
+class CursorPage:
+    """One page of keyset-paginated results"""
+
+    def __init__(self, items, next_cursor, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe cursor for the sort key of the last row on a page"""
+    raw = json.dumps([value.isoformat() if isinstance(value, (datetime, date)) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Sort key values from a cursor, converted back to the column types; raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+
+    decoded = []
+    for column, value in zip(columns, values):
+        # Cursors come from clients: anything but a JSON scalar of the column's type is malformed
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise ValueError('Invalid cursor')
+        try:
+            if value is not None and isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            elif value is not None and isinstance(column.type, Date):
+                value = date.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=20, descending=True, include_total=False):
+    """Page through `query` ordered by `columns` (last one must be unique, e.g. the id) without OFFSET.
+
+    Each page seeks straight to the row after the cursor, so its cost does not grow with depth.
+    Any ordering already on `query` is replaced by the key's, and per_page is clamped to 1..MAX_PER_PAGE.
+    The COUNT(*) is only run when `include_total` is set.
+    """
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    total = query.order_by(None).count() if include_total else None
+
+    key = tuple_(*columns)
+    if cursor:
+        after = tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(key < after if descending else key > after)
+
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(None).order_by(*ordering).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+
+    return CursorPage(rows, next_cursor, total)
+
+
+def wants_cursor(args):
+    """Cursor mode is opt-in: any request carrying a `cursor` argument (empty for the first page)"""
+    return 'cursor' in args
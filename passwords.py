@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+import click
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app, jsonify
+from flask.cli import AppGroup
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+passwords_cli = AppGroup('passwords', help='Password hashing pool utilities.')
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+DEFAULT_TIMEOUT = 30
+
+
+class PasswordPoolBusy(Exception):
+    """Raised instead of queueing when the hashing pool is at its queue-depth limit"""
+
+
+class PasswordPoolTimeout(PasswordPoolBusy):
+    """Raised when a queued hash does not finish within the pool timeout"""
+
+
+class _HashingPool:
+    """Bounded executor for the deliberately slow password KDF, so it never runs on request threads"""
+
+    def __init__(self, workers, queue_limit, kind):
+        executor_class = ProcessPoolExecutor if kind == 'process' else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers + queue_limit)
+        self.pid = os.getpid()
+
+    def run(self, fn, *args, timeout=DEFAULT_TIMEOUT):
+        if not self.slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        # The slot is held until the hash finishes, even if the caller has stopped waiting for it
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise PasswordPoolTimeout()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """The pool for this process (re-created after a fork, e.g. in pre-forking servers)"""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                config = current_app.config
+                workers = config.get('PASSWORD_POOL_WORKERS') or os.cpu_count() or 2
+                queue_limit = config.get('PASSWORD_POOL_QUEUE_LIMIT')
+                _pool = _HashingPool(
+                    workers,
+                    workers * 4 if queue_limit is None else queue_limit,
+                    config.get('PASSWORD_POOL_KIND', 'thread')
+                )
+    return _pool
+
+
+def hash_method():
+    """Configured werkzeug hash method, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'"""
+    return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+
+
+def hash_password(password):
+    """Hash on the pool with the configured method; raises PasswordPoolBusy when saturated"""
+    return _get_pool().run(generate_password_hash, password, hash_method())
+
+
+def verify_password(password_hash, password):
+    """Check a password on the pool; raises PasswordPoolBusy when saturated"""
+    return _get_pool().run(check_password_hash, password_hash, password)
+
+
+def method_params(method):
+    """A werkzeug method string with its defaults filled in, e.g. 'scrypt' -> ('scrypt', 32768, 8, 1)"""
+    name, *args = method.split(':')
+    try:
+        if name == 'scrypt':
+            return (name,) + (tuple(int(arg) for arg in args) if args else (2 ** 15, 8, 1))
+        if name == 'pbkdf2':
+            hash_name = args[0] if args else 'sha256'
+            return name, hash_name, int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+    except ValueError:
+        pass
+    return (name,) + tuple(args)
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with a different method or cost than is configured now"""
+    return method_params(password_hash.split('$', 1)[0]) != method_params(hash_method())
+
+
+def busy_response(error):
+    """429 when the pool's queue is full, 503 when a queued hash timed out; both ask the client to retry"""
+    response = jsonify({'message': 'Too many password operations in progress, retry shortly'})
+    response.status_code = 503 if isinstance(error, PasswordPoolTimeout) else 429
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+@passwords_cli.command('benchmark')
+@click.option('--username', required=True, help='Existing user to log in as.')
+@click.option('--password', required=True)
+@click.option('--concurrency', default=32, show_default=True)
+@click.option('--requests', 'total', default=256, show_default=True)
+def benchmark_command(username, password, concurrency, total):
+    """Report login latency percentiles under concurrent load."""
+    app = current_app._get_current_object()
+    latencies, statuses = [], []
+    lock = threading.Lock()
+
+    def login():
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/api/auth/login', json={'username': username, 'password': password})
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses.append(response.status_code)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(total):
+            executor.submit(login)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    click.echo('%d logins, concurrency %d, %.1f logins/s' % (total, concurrency, total / wall))
+    click.echo('p50 %.1f ms  p99 %.1f ms  max %.1f ms' % (percentile(0.50), percentile(0.99), latencies[-1] * 1000))
+    click.echo('status codes: %s' % {code: statuses.count(code) for code in sorted(set(statuses))})
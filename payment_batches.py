@@ -0,0 +1,142 @@
+import math
+import uuid
+from app import db
+from models import Payment, Subscription
+from rollups import record_payments
+from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
+
+BATCH_MODES = ['atomic', 'partial']
+PAYMENT_STATUSES = ['pending', 'completed', 'failed', 'refunded']
+PAYMENT_METHODS = ['credit_card', 'bank_transfer', 'cash']
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _subscription_id(value):
+    """Integer subscription id from an int or a string of digits, else None (bools and floats are rejected)"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    return None
+
+
+def _validate(item, subscriptions):
+    """Payment row for one batch item, or an error message"""
+    if not isinstance(item, dict):
+        return None, 'item must be an object'
+    missing = [field for field in ('subscription_id', 'amount', 'payment_method') if item.get(field) in (None, '')]
+    if missing:
+        return None, 'missing required fields: %s' % ', '.join(missing)
+
+    subscription_id = _subscription_id(item['subscription_id'])
+    if subscription_id is None:
+        return None, 'subscription_id must be an integer'
+    try:
+        amount = float(item['amount'])
+    except (TypeError, ValueError, OverflowError):
+        return None, 'amount must be a number'
+    if isinstance(item['amount'], bool) or not math.isfinite(amount):
+        return None, 'amount must be a finite number'
+
+    payment_method = item['payment_method']
+    if not isinstance(payment_method, str) or payment_method not in PAYMENT_METHODS:
+        return None, 'payment_method must be one of: %s' % ', '.join(PAYMENT_METHODS)
+    transaction_id = item.get('transaction_id')
+    if transaction_id is not None and not isinstance(transaction_id, str):
+        return None, 'transaction_id must be a string'
+
+    if subscription_id not in subscriptions:
+        return None, 'subscription %s not found' % subscription_id
+
+    status = item.get('status', 'completed')
+    if not isinstance(status, str) or status not in PAYMENT_STATUSES:
+        return None, 'invalid status %s' % status
+
+    try:
+        payment_date = datetime.fromisoformat(item['payment_date']) if item.get('payment_date') else datetime.utcnow()
+    except (TypeError, ValueError):
+        return None, 'payment_date must be an ISO datetime'
+
+    return {
+        'subscription_id': subscription_id,
+        'amount': amount,
+        'payment_method': payment_method,
+        'transaction_id': transaction_id or str(uuid.uuid4()),
+        'status': status,
+        'payment_date': payment_date,
+        'created_at': datetime.utcnow(),
+    }, None
+
+
+def _insert(rows, subscriptions):
+    """Insert payment rows with one executemany and fold them into the revenue rollup; returns the new ids"""
+    result = db.session.execute(
+        Payment.__table__.insert().returning(Payment.__table__.c.id, sort_by_parameter_order=True),
+        rows
+    )
+    ids = [row.id for row in result]
+    record_payments([dict(row, plan_id=subscriptions[row['subscription_id']]) for row in rows])
+    return ids
+
+
+def ingest_payments(items, mode='atomic', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Validate and insert a batch of payments.
+
+    Subscription ids are resolved with a single query. In 'atomic' mode any invalid item rejects the
+    whole batch and everything is written in one transaction; in 'partial' mode valid items are written
+    chunk by chunk, each chunk in its own transaction, and failures are reported per item.
+    Returns (results, created_count) with one result per input item, in input order.
+    """
+    ids = set()
+    for item in items:
+        subscription_id = _subscription_id(item.get('subscription_id')) if isinstance(item, dict) else None
+        if subscription_id is not None:
+            ids.add(subscription_id)
+    subscriptions = dict(
+        db.session.query(Subscription.id, Subscription.plan_id).filter(Subscription.id.in_(ids))
+    ) if ids else {}
+
+    results = []
+    valid = []
+    for index, item in enumerate(items):
+        row, error = _validate(item, subscriptions)
+        if error:
+            results.append({'index': index, 'status': 'error', 'error': error})
+        else:
+            results.append({'index': index, 'status': 'created', 'transaction_id': row['transaction_id']})
+            valid.append((index, row))
+
+    if mode == 'atomic':
+        if len(valid) != len(items):
+            for result in results:
+                if result['status'] == 'created':
+                    result.update(status='skipped', error='batch rejected')
+                    del result['transaction_id']
+            return results, 0
+        chunk_size = len(valid) or 1
+
+    created = 0
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        try:
+            new_ids = _insert([row for _, row in chunk], subscriptions)
+            if mode == 'partial':
+                db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            if mode == 'atomic':
+                raise
+            for index, _ in chunk:
+                results[index].update(status='error', error='database error: %s' % e.__class__.__name__)
+                del results[index]['transaction_id']
+            continue
+
+        for (index, _), payment_id in zip(chunk, new_ids):
+            results[index]['id'] = payment_id
+        created += len(chunk)
+
+    if mode == 'atomic':
+        db.session.commit()
+
+    return results, created
@@ -0,0 +1,38 @@
+import random
+from sqlalchemy import update
+from app import db
+from models import Payment, Subscription
+from rollups import record_payment
+from jobs import job_handler
+
+
+def charge(payment):
+    """Send a payment to the gateway; True if it was accepted"""
+    # In a real implementation, integrate with payment gateway here
+    # For demo, we'll simulate success/failure
+    return random.choice([True, True, True, False])  # 75% success rate
+
+
+@job_handler('process_payment')
+def process_payment_job(payload):
+    """Charge a pending payment and record the outcome"""
+    payment = db.session.get(Payment, payload['payment_id'])
+    # A retried or re-released job finds the payment already settled and leaves it alone
+    if payment.status != 'pending':
+        return {'payment_id': payment.id, 'status': payment.status, 'success': payment.status == 'completed'}
+
+    success = charge(payment)
+    status = 'completed' if success else 'failed'
+    # Settle only if still pending, so a job released while running can't record the payment twice
+    settled = db.session.execute(
+        update(Payment).where(Payment.id == payment.id, Payment.status == 'pending').values(status=status)
+    ).rowcount
+    if not settled:
+        db.session.rollback()
+        payment = db.session.get(Payment, payload['payment_id'])
+        return {'payment_id': payment.id, 'status': payment.status, 'success': payment.status == 'completed'}
+
+    db.session.refresh(payment)
+    record_payment(payment, db.session.get(Subscription, payment.subscription_id).plan_id)
+    db.session.commit()
+    return {'payment_id': payment.id, 'status': payment.status, 'success': success}
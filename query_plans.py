@@ -0,0 +1,89 @@
+"""Query-plan check for the main route queries.
+
+Each route builds its main query with a named function in its module; the check explains those same
+functions with sample arguments, so it always sees what the routes run. tests/test_query_plans.py
+fails on any full table scan, and `flask query-plans check` does the same from the command line.
+"""
+import click
+from flask.cli import AppGroup
+from app import db
+from authz import customer_for_user_query
+from routes.dashboard import recent_customers_query, recent_payments_query, recent_tickets_query, revenue_series_query
+from routes.equipment import customer_equipment_query, equipment_query
+from routes.payments import payments_query, subscription_payments_query
+from routes.service_plans import active_plan_subscriptions_query
+from routes.subscriptions import active_subscription_query, customer_subscriptions_query, subscriptions_query
+from routes.tickets import tickets_query
+from datetime import datetime, timedelta
+
+plans_cli = AppGroup('query-plans', help='Inspect the query plans of the main route queries.')
+
+PAGE = 20
+
+
+def route_queries():
+    """(name, query) for the main query behind each endpoint, as the route builds it"""
+    today = datetime.utcnow().date()
+    return [
+        ('customer profile lookup (customer role)', customer_for_user_query(1)),
+        ('dashboard recent customers', recent_customers_query()),
+        ('dashboard recent payments', recent_payments_query()),
+        ('dashboard recent tickets', recent_tickets_query()),
+        ('get_all_payments', payments_query().limit(PAGE)),
+        ('get_all_payments ?status=', payments_query('completed').limit(PAGE)),
+        ('get_subscription_payments', subscription_payments_query(1)),
+        ('active subscription check', active_subscription_query(1)),
+        ('get_customer_subscriptions', customer_subscriptions_query(1)),
+        ('get_all_subscriptions ?status=', subscriptions_query('active').limit(PAGE)),
+        ('delete_service_plan active check', active_plan_subscriptions_query(1)),
+        ('get_tickets', tickets_query().limit(PAGE)),
+        ('get_tickets ?status=', tickets_query(status='open').limit(PAGE)),
+        ('get_tickets (customer role)', tickets_query(customer_id=1).limit(PAGE)),
+        ('get_tickets (tech role)', tickets_query(technician_id=1).limit(PAGE)),
+        ('get_all_equipment ?type=&status=', equipment_query('router', 'active').limit(PAGE)),
+        ('get_all_equipment ?status=', equipment_query(status='active').limit(PAGE)),
+        ('get_customer_equipment', customer_equipment_query(1)),
+        ('revenue analytics series', revenue_series_query(today - timedelta(days=30), today, 'day')),
+    ]
+
+
+def explain(query):
+    """EXPLAIN QUERY PLAN detail lines for an ORM query (SQLite only)"""
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql))]
+
+
+def full_scans(plan):
+    """Plan lines that read a whole table rather than searching an index"""
+    return [line for line in plan if line.startswith('SCAN ') and 'INDEX' not in line]
+
+
+def check_query_plans():
+    """Map of query name -> offending plan lines, for every route query that falls back to a table scan"""
+    failures = {}
+    for name, query in route_queries():
+        scans = full_scans(explain(query))
+        if scans:
+            failures[name] = scans
+    return failures
+
+
+@plans_cli.command('check')
+@click.option('--verbose', '-v', is_flag=True, help='Print the plan of every query.')
+def check_command(verbose):
+    """Fail if any main route query falls back to a full table scan."""
+    if db.engine.dialect.name != 'sqlite':
+        raise SystemExit('query-plans check only supports SQLite')
+
+    if verbose:
+        for name, query in route_queries():
+            click.echo('%s:' % name)
+            for line in explain(query):
+                click.echo('    %s' % line)
+
+    failures = check_query_plans()
+    for name, scans in failures.items():
+        click.echo('%s: %s' % (name, '; '.join(scans)))
+    if failures:
+        raise SystemExit('%d queries fall back to a table scan' % len(failures))
+    click.echo('All route queries use an index')
@@ -0,0 +1,216 @@
+"""Read-replica routing.
+
+Replicas are configured as SQLALCHEMY_BINDS named replica_1, replica_2, ... (DATABASE_REPLICA_URLS).
+`RoutingSession` sends SELECTs issued while serving a GET/HEAD on one of REPLICA_BLUEPRINTS to a
+replica chosen once per request; everything else (writes, flushes, raw SQL, CLI commands, background
+threads) uses the primary.
+
+Lag: the primary's replica_heartbeat row is stamped by `flask replicas heartbeat` (or `sync`) and
+travels to the replicas with the data, so `now - beat_at` read on a replica bounds its staleness.
+Replicas lagging more than REPLICA_MAX_LAG_SECONDS are skipped; with none left, reads use the primary.
+Lag is re-checked at most every REPLICA_LAG_CHECK_SECONDS per process.
+
+Read-your-writes: a successful write request pins that user (and the client, via a cookie) to the
+primary for REPLICA_PIN_SECONDS, which defaults to the maximum lag. Reads whose result outlives the
+request (process-wide caches) go to the primary inside `primary_reads()`.
+
+Local testing with SQLite: point DATABASE_REPLICA_URLS at a second file and run
+`flask replicas sync --interval 2` to copy the primary into it with SQLite's online backup API.
+"""
+import random
+import sqlite3
+import threading
+import time
+import click
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app, g, has_request_context, request
+from flask.cli import AppGroup
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+
+replicas_cli = AppGroup('replicas', help='Read replica maintenance.')
+
+PIN_COOKIE = 'db_primary_until'
+READ_METHODS = ('GET', 'HEAD')
+MAX_PINNED_USERS = 10000
+
+_pins = {}
+_UNSET = object()
+_health = {'checked_at': 0.0, 'healthy': []}
+_health_lock = threading.Lock()
+
+
+def replica_keys(db):
+    return sorted(key for key in db.engines if key and key.startswith('replica_'))
+
+
+# models imports app, which creates db with RoutingSession from this module, so models load lazily here
+def replica_lag(engine):
+    """Seconds since the heartbeat visible on `engine`, or None if it has none"""
+    from models import ReplicaHeartbeat
+    with engine.connect() as connection:
+        beat_at = connection.execute(
+            ReplicaHeartbeat.__table__.select().with_only_columns(ReplicaHeartbeat.beat_at)
+        ).scalar()
+    return (datetime.utcnow() - beat_at).total_seconds() if beat_at else None
+
+
+def healthy_replicas(db):
+    """Replica bind keys within the lag limit (cached per process)"""
+    config = current_app.config
+    now = time.monotonic()
+    if now - _health['checked_at'] >= config.get('REPLICA_LAG_CHECK_SECONDS', 1):
+        with _health_lock:
+            if now - _health['checked_at'] >= config.get('REPLICA_LAG_CHECK_SECONDS', 1):
+                healthy = []
+                for key in replica_keys(db):
+                    try:
+                        lag = replica_lag(db.engines[key])
+                    except Exception as e:
+                        current_app.logger.warning('Replica %s is unavailable: %s', key, e)
+                        continue
+                    if lag is not None and lag <= config.get('REPLICA_MAX_LAG_SECONDS', 10):
+                        healthy.append(key)
+                _health['healthy'] = healthy
+                _health['checked_at'] = now
+    return _health['healthy']
+
+
+def _pinned():
+    """True if this client or user wrote recently enough that a replica may not show it yet"""
+    now = time.time()
+    try:
+        if float(request.cookies.get(PIN_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:  # no token verified for this request
+        return False
+    return identity is not None and _pins.get(identity, 0) > now
+
+
+def request_replica(db):
+    """Replica engine for the current request, or None to use the primary; decided once per request"""
+    if not has_request_context():
+        return None
+    if '_db_replica' not in g:
+        key = None
+        if request.method in READ_METHODS and \
+                request.blueprint in current_app.config.get('REPLICA_BLUEPRINTS', ()) and not _pinned():
+            healthy = healthy_replicas(db)
+            key = random.choice(healthy) if healthy else None
+        g._db_replica = db.engines[key] if key else None
+    return g._db_replica
+
+
+@contextmanager
+def primary_reads():
+    """Send the enclosed SELECTs to the primary, even while serving a replica-routed request"""
+    if not has_request_context():
+        yield
+        return
+    saved = g.pop('_db_replica', _UNSET)
+    g._db_replica = None
+    try:
+        yield
+    finally:
+        g.pop('_db_replica', None)
+        if saved is not _UNSET:
+            g._db_replica = saved
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica during read-only requests and writes to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False):
+            engine = request_replica(self._db)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def pin_after_write(response):
+    """after_request hook: pin the writer to the primary for REPLICA_PIN_SECONDS"""
+    if request.method in READ_METHODS or request.method == 'OPTIONS' or response.status_code >= 400:
+        return response
+
+    window = current_app.config.get('REPLICA_PIN_SECONDS', 10)
+    until = time.time() + window
+    response.set_cookie(PIN_COOKIE, '%.3f' % until, max_age=int(window) + 1, httponly=True, samesite='Lax')
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None
+    if identity is not None:
+        if len(_pins) >= MAX_PINNED_USERS:
+            now = time.time()
+            for user, expires in list(_pins.items()):
+                if expires <= now:
+                    del _pins[user]
+        _pins[identity] = until
+    return response
+
+
+def write_heartbeat(db):
+    from models import ReplicaHeartbeat
+    heartbeat = db.session.get(ReplicaHeartbeat, 1) or ReplicaHeartbeat(id=1)
+    heartbeat.beat_at = datetime.utcnow()
+    db.session.add(heartbeat)
+    db.session.commit()
+    return heartbeat.beat_at
+
+
+def copy_sqlite(source_path, target_path):
+    """Copy a live SQLite database with the online backup API (consistent snapshot)"""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+@replicas_cli.command('heartbeat')
+def heartbeat_command():
+    """Stamp the primary's heartbeat (run periodically when replication is done by the database)."""
+    click.echo('Heartbeat %s' % write_heartbeat(current_app.extensions['sqlalchemy']).isoformat())
+
+
+@replicas_cli.command('sync')
+@click.option('--interval', type=float, default=0, help='Repeat every N seconds (0 = copy once).')
+def sync_command(interval):
+    """Copy a SQLite primary into the SQLite replica files (local replica setup)."""
+    db = current_app.extensions['sqlalchemy']
+    # Engine URLs, since Flask-SQLAlchemy resolves relative SQLite paths against the instance folder
+    primary = db.engine.url
+    targets = [db.engines[key].url for key in replica_keys(db)]
+    if primary.get_backend_name() != 'sqlite' or any(url.get_backend_name() != 'sqlite' for url in targets):
+        raise click.UsageError('sync copies SQLite files only; use `flask replicas heartbeat` with database replication')
+    if not targets:
+        raise click.UsageError('No replicas configured (DATABASE_REPLICA_URLS)')
+
+    while True:
+        write_heartbeat(db)
+        for url in targets:
+            copy_sqlite(primary.database, url.database)
+        click.echo('Copied primary to %d replica(s) at %s' % (len(targets), datetime.utcnow().isoformat()))
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@replicas_cli.command('status')
+def status_command():
+    """Show each replica's lag."""
+    db = current_app.extensions['sqlalchemy']
+    for key in replica_keys(db):
+        try:
+            lag = replica_lag(db.engines[key])
+            click.echo('%s: %s' % (key, 'no heartbeat' if lag is None else 'lag %.1fs' % lag))
+        except Exception as e:
+            click.echo('%s: unreachable (%s)' % (key, e.__class__.__name__))
@@ -0,0 +1,181 @@
+import click
+from flask.cli import AppGroup
+from app import db
+from models import Payment, Subscription, RevenueRollup, PlanSubscriptionRollup
+from aggregations import date_bucket
+from datetime import datetime, date
+from sqlalchemy import func
+
+rollups_cli = AppGroup('rollups', help='Maintain the revenue and subscription rollup tables.')
+
+
+def _upsert_increment(model, key, increments):
+    """Add `increments` to the counters of the rollup row identified by `key`, creating it if needed"""
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(**key, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+        )
+        db.session.execute(stmt)
+        return
+
+    conditions = [table.c[name] == value for name, value in key.items()]
+    result = db.session.execute(
+        table.update().where(*conditions).values(
+            **{name: table.c[name] + value for name, value in increments.items()}
+        )
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(**key, **increments))
+
+
+def record_payment(payment, plan_id):
+    """Fold a newly added payment into the revenue rollup (no-op unless completed).
+
+    Runs inside the caller's transaction, so the rollup commits or rolls back with the payment.
+    """
+    if payment.payment_date is None:
+        payment.payment_date = datetime.utcnow()
+
+    record_payments([{
+        'plan_id': plan_id,
+        'payment_date': payment.payment_date,
+        'payment_method': payment.payment_method,
+        'amount': payment.amount,
+        'status': payment.status
+    }])
+
+
+def record_payments(payments):
+    """Fold many new payments (dicts with plan_id, payment_date, payment_method, amount, status) into the
+    revenue rollup with one upsert per (day, plan, method) bucket"""
+    buckets = {}
+    for payment in payments:
+        if payment['status'] != 'completed':
+            continue
+        key = (payment['payment_date'].date(), payment['plan_id'], payment['payment_method'])
+        amount, count = buckets.get(key, (0.0, 0))
+        buckets[key] = (amount + float(payment['amount']), count + 1)
+
+    for (day, plan_id, payment_method), (amount, count) in buckets.items():
+        _upsert_increment(
+            RevenueRollup,
+            {'day': day, 'plan_id': plan_id, 'payment_method': payment_method},
+            {'amount': amount, 'payment_count': count}
+        )
+
+
+def record_subscription_status(plan_id, old_status, new_status):
+    """Adjust the active subscription count for a status transition (old_status is None for new rows)"""
+    adjust_active_subscriptions(plan_id, (new_status == 'active') - (old_status == 'active'))
+
+
+def adjust_active_subscriptions(plan_id, delta):
+    """Add `delta` (possibly negative) to a plan's active subscription count"""
+    if delta:
+        _upsert_increment(PlanSubscriptionRollup, {'plan_id': plan_id}, {'active_count': delta})
+
+
+def _revenue_source():
+    """Per day/plan/method completed revenue computed straight from the payment table"""
+    day = date_bucket(Payment.payment_date, 'day')
+    return db.session.query(
+        day,
+        Subscription.plan_id,
+        Payment.payment_method,
+        func.sum(Payment.amount),
+        func.count(Payment.id)
+    ).join(Subscription, Payment.subscription_id == Subscription.id).filter(
+        Payment.status == 'completed'
+    ).group_by(day, Subscription.plan_id, Payment.payment_method)
+
+
+def _subscription_source():
+    """Per-plan active subscription counts computed straight from the subscription table"""
+    return db.session.query(
+        Subscription.plan_id,
+        func.count(Subscription.id)
+    ).filter(Subscription.status == 'active').group_by(Subscription.plan_id)
+
+
+def rebuild_rollups():
+    """Recompute both rollup tables from the base tables in a single transaction"""
+    revenue_rows = [{
+        'day': day if isinstance(day, date) else date.fromisoformat(day),
+        'plan_id': plan_id,
+        'payment_method': payment_method,
+        'amount': float(amount),
+        'payment_count': payment_count
+    } for day, plan_id, payment_method, amount, payment_count in _revenue_source()]
+    subscription_rows = [
+        {'plan_id': plan_id, 'active_count': active_count}
+        for plan_id, active_count in _subscription_source()
+    ]
+
+    try:
+        db.session.execute(RevenueRollup.__table__.delete())
+        db.session.execute(PlanSubscriptionRollup.__table__.delete())
+        if revenue_rows:
+            db.session.execute(RevenueRollup.__table__.insert(), revenue_rows)
+        if subscription_rows:
+            db.session.execute(PlanSubscriptionRollup.__table__.insert(), subscription_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(revenue_rows), len(subscription_rows)
+
+
+def verify_rollups():
+    """Compare the rollup tables with the base tables; returns a list of mismatch descriptions"""
+    expected_revenue = {
+        (str(day), plan_id, payment_method): (round(float(amount), 2), payment_count)
+        for day, plan_id, payment_method, amount, payment_count in _revenue_source()
+    }
+    actual_revenue = {
+        (row.day.isoformat(), row.plan_id, row.payment_method): (round(row.amount, 2), row.payment_count)
+        for row in RevenueRollup.query.filter(RevenueRollup.payment_count != 0)
+    }
+    expected_active = dict(_subscription_source().all())
+    actual_active = {
+        row.plan_id: row.active_count
+        for row in PlanSubscriptionRollup.query.filter(PlanSubscriptionRollup.active_count != 0)
+    }
+
+    mismatches = []
+    for key in sorted(set(expected_revenue) | set(actual_revenue), key=str):
+        if expected_revenue.get(key) != actual_revenue.get(key):
+            mismatches.append('revenue %s: expected %s, found %s' % (
+                key, expected_revenue.get(key), actual_revenue.get(key)))
+    for plan_id in sorted(set(expected_active) | set(actual_active)):
+        if expected_active.get(plan_id) != actual_active.get(plan_id):
+            mismatches.append('active subscriptions for plan %s: expected %s, found %s' % (
+                plan_id, expected_active.get(plan_id), actual_active.get(plan_id)))
+    return mismatches
+
+
+@rollups_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the rollup tables from payments and subscriptions (backfill)."""
+    revenue_count, plan_count = rebuild_rollups()
+    click.echo('Rebuilt %d revenue rollup rows and %d plan rollup rows' % (revenue_count, plan_count))
+
+
+@rollups_cli.command('verify')
+def verify_command():
+    """Check the rollup tables against payments and subscriptions."""
+    mismatches = verify_rollups()
+    for mismatch in mismatches:
+        click.echo(mismatch)
+    if mismatches:
+        raise SystemExit('%d rollup mismatches found' % len(mismatches))
+    click.echo('Rollups are consistent')
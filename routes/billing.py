@@ -0,0 +1,36 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt
+from authz import current_principal
+from billing import current_cycle, validate_cycle
+from jobs import enqueue
+from app import db
+
+billing_bp = Blueprint('billing', __name__, url_prefix='/api/billing')
+
+@billing_bp.route('/runs', methods=['POST'])
+@jwt_required()
+def create_billing_run():
+    """Start a billing run for a cycle on the job runner (admin only); poll the returned job for its report"""
+    claims = get_jwt()
+    if claims.get('role') != 'admin':
+        return jsonify({'message': 'Admin access required'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    cycle = data.get('cycle') or current_cycle()
+    try:
+        validate_cycle(cycle)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    workers = data.get('workers')
+    if workers is not None and (not isinstance(workers, int) or workers < 1):
+        return jsonify({'message': 'workers must be a positive integer'}), 400
+    
+    job = enqueue('billing_run', {'cycle': cycle, 'workers': workers}, created_by=current_principal().user_id)
+    db.session.commit()
+    
+    return jsonify({
+        'cycle': cycle,
+        'job_id': job.id,
+        'message': 'Billing run queued'
+    }), 202
@@ -1,7 +1,14 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import Customer, ServicePlan, Subscription, User
 from app import db
+from authz import current_principal
+from capacity import CapacityError, admit_for_request
+from conditional import Validators
+from rollups import record_subscription_status
+from pagination import keyset_paginate, wants_cursor
+from search import index_entity, matching_ids, search_backend
+from routes.subscriptions import active_subscription_query, customer_subscriptions_query
 from datetime import datetime, timedelta
 
 customers_bp = Blueprint('customers', __name__)
@@ -19,25 +26,42 @@ def get_customers():
     search = request.args.get('search', '')
     
     query = Customer.query
-    if search:
+    if search and search_backend() == 'fts5':
+        query = query.filter(Customer.id.in_(matching_ids('customer', search)))
+    elif search:
         query = query.filter(
             Customer.name.contains(search) | 
             Customer.email.contains(search)
         )
     
+    try:
+        serialize, options = Customer.serializers['list'].select(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    query = query.options(*options)
+    
+    if wants_cursor(request.args):
+        try:
+            customers = keyset_paginate(
+                query, [Customer.id],
+                cursor=request.args.get('cursor'), per_page=per_page, descending=False,
+                include_total=request.args.get('include_total', 'false').lower() == 'true'
+            )
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        
+        # Cursor mode needs somewhere to put next_cursor, so it returns an object
+        return jsonify({
+            'customers': serialize.many(customers.items),
+            'next_cursor': customers.next_cursor,
+            'total': customers.total
+        })
+    
     customers = query.paginate(
         page=page, per_page=per_page, error_out=False
     )
     
-    return jsonify([{
-        'id': customer.id,
-        'name': customer.name,
-        'email': customer.email,
-        'phone': customer.phone,
-        'billing_address': customer.billing_address,
-        'service_address': customer.service_address,
-        'created_at': customer.created_at.isoformat()
-    } for customer in customers.items])
+    return jsonify(serialize.many(customers.items))
 
 @customers_bp.route('/api/customers', methods=['POST'])
 @jwt_required()
@@ -67,6 +91,8 @@ def create_customer():
         service_address=data.get('service_address')
     )
     db.session.add(customer)
+    db.session.flush()
+    index_entity('customer', customer)
     db.session.commit()
     
     return jsonify({
@@ -80,43 +106,40 @@ def create_customer():
 @jwt_required()
 def get_customer(customer_id):
     from flask_jwt_extended import get_jwt
-    current_user_id = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user_id)).first()
-        if not customer or customer.id != customer_id:
+        if not principal.owns_customer(customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     elif claims.get('role') not in ['admin', 'sales', 'tech']:
         return jsonify({'message': 'Unauthorized'}), 403
     
-    customer = Customer.query.get_or_404(customer_id)
+    try:
+        serialize, options = Customer.serializers['detail'].select(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify({
-        'id': customer.id,
-        'name': customer.name,
-        'email': customer.email,
-        'phone': customer.phone,
-        'personal_info': customer.personal_info,
-        'contact_info': customer.contact_info,
-        'billing_address': customer.billing_address,
-        'service_address': customer.service_address,
-        'created_at': customer.created_at.isoformat(),
-        'updated_at': customer.updated_at.isoformat()
-    })
+    state = db.session.query(Customer.updated_at).filter(Customer.id == customer_id).first_or_404()
+    validators = Validators('customer', customer_id, state.updated_at, fields=serialize.fields)
+    if validators.fresh():
+        return validators.not_modified()
+    
+    customer = Customer.query.options(*options).get_or_404(customer_id)
+    
+    return validators.apply(jsonify(serialize(customer)))
 
 @customers_bp.route('/api/customers/<int:customer_id>', methods=['PUT'])
 @jwt_required()
 def update_customer(customer_id):
     from flask_jwt_extended import get_jwt
-    current_user_id = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user_id)).first()
-        if not customer or customer.id != customer_id:
+        if not principal.owns_customer(customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     elif claims.get('role') not in ['admin', 'sales']:
         return jsonify({'message': 'Unauthorized'}), 403
@@ -151,6 +174,7 @@ def update_customer(customer_id):
         customer.service_address = data['service_address']
     
     customer.updated_at = datetime.utcnow()
+    index_entity('customer', customer)
     db.session.commit()
     
     return jsonify({
@@ -162,29 +186,20 @@ def update_customer(customer_id):
 @jwt_required()
 def get_customer_subscriptions_route(customer_id):
     from flask_jwt_extended import get_jwt
-    current_user_id = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user_id)).first()
-        if not customer or customer.id != customer_id:
+        if not principal.owns_customer(customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     elif claims.get('role') not in ['admin', 'sales', 'tech']:
         return jsonify({'message': 'Unauthorized'}), 403
     
     customer = Customer.query.get_or_404(customer_id)
-    subscriptions = Subscription.query.filter_by(customer_id=customer_id).all()
-    
-    return jsonify([{
-        'id': sub.id,
-        'plan_name': sub.plan.name,
-        'plan_price': sub.plan.price,
-        'start_date': sub.start_date.isoformat(),
-        'end_date': sub.end_date.isoformat() if sub.end_date else None,
-        'status': sub.status,
-        'payment_method': sub.payment_method
-    } for sub in subscriptions])
+    subscriptions = customer_subscriptions_query(customer_id).all()
+    
+    return jsonify(Subscription.serializers['customer'].many(subscriptions))
 
 @customers_bp.route('/api/customers/<int:customer_id>/subscribe', methods=['POST'])
 @jwt_required()
@@ -199,10 +214,7 @@ def create_subscription(customer_id):
     plan = ServicePlan.query.get_or_404(data['plan_id'])
     
     # Check for existing active subscription
-    existing = Subscription.query.filter_by(
-        customer_id=customer.id,
-        status='active'
-    ).first()
+    existing = active_subscription_query(customer.id).first()
     
     if existing:
         return jsonify({'message': 'Customer already has an active subscription'}), 400
@@ -211,14 +223,27 @@ def create_subscription(customer_id):
     duration_days = data.get('duration_days', 30)
     end_date = datetime.utcnow() + timedelta(days=duration_days)
     
+    # Reserve node capacity in the same transaction as the subscription
+    try:
+        node_id = admit_for_request(customer, data)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except CapacityError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 409
+    
     subscription = Subscription(
         customer_id=customer.id,
         plan_id=plan.id,
+        node_id=node_id,
         status='active',
         payment_method=data.get('payment_method', 'cash'),
+        auto_renew=bool(data.get('auto_renew', False)),
         end_date=end_date
     )
     db.session.add(subscription)
+    record_subscription_status(plan.id, None, subscription.status)
     db.session.commit()
     
     return jsonify({
@@ -226,5 +251,6 @@ def create_subscription(customer_id):
         'customer': customer.name,
         'plan': plan.name,
         'status': subscription.status,
+        'node_id': subscription.node_id,
         'end_date': subscription.end_date.isoformat()
     }), 201
\ No newline at end of file
@@ -1,12 +1,35 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt
-from models import User, Customer, Subscription, Payment, Ticket, ServicePlan, Equipment, NetworkNode
+from models import User, Customer, Subscription, Payment, Ticket, ServicePlan, Equipment, NetworkNode, RevenueRollup, PlanSubscriptionRollup
 from app import db
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 from sqlalchemy import func
+from aggregations import count_where, sum_where, status_counts, monthly_totals, date_bucket
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
 
+TICKET_STATUSES = ['open', 'in_progress', 'resolved', 'closed']
+GRANULARITIES = ['day', 'week', 'month']
+RECENT_LIMIT = 10
+
+def recent_customers_query():
+    return Customer.query.order_by(Customer.created_at.desc()).limit(RECENT_LIMIT)
+
+def recent_payments_query():
+    return Payment.query.order_by(Payment.payment_date.desc()).limit(RECENT_LIMIT)
+
+def recent_tickets_query():
+    return Ticket.query.order_by(Ticket.created_at.desc()).limit(RECENT_LIMIT)
+
+def revenue_series_query(start, end, granularity):
+    """Revenue and payment count per period between `start` and `end` (inclusive), from the rollup"""
+    bucket = date_bucket(RevenueRollup.day, granularity).label('period')
+    return db.session.query(
+        bucket,
+        func.sum(RevenueRollup.amount),
+        func.sum(RevenueRollup.payment_count)
+    ).filter(RevenueRollup.day >= start, RevenueRollup.day <= end).group_by(bucket).order_by(bucket)
+
 @dashboard_bp.route('/stats', methods=['GET'])
 @jwt_required()
 def get_dashboard_stats():
@@ -17,66 +40,53 @@ def get_dashboard_stats():
     if role not in ['admin', 'sales', 'tech']:
         return jsonify({'message': 'Unauthorized'}), 403
     
-    # Basic counts
-    total_customers = Customer.query.count()
-    active_subscriptions = Subscription.query.filter_by(status='active').count()
-    total_revenue = db.session.query(func.sum(Payment.amount)).filter_by(status='completed').scalar() or 0
-    open_tickets = Ticket.query.filter_by(status='open').count()
-    
-    # Recent activity (last 30 days)
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    new_customers = Customer.query.filter(Customer.created_at >= thirty_days_ago).count()
-    recent_payments = Payment.query.filter(
-        Payment.payment_date >= thirty_days_ago,
-        Payment.status == 'completed'
-    ).count()
     
-    # Service plan popularity
+    # Customer totals and recent sign-ups
+    total_customers, new_customers = db.session.query(
+        func.count(Customer.id),
+        count_where(Customer.created_at >= thirty_days_ago)
+    ).one()
+    
+    # Revenue and recent completed payments (from the revenue rollup)
+    total_revenue, recent_payments = db.session.query(
+        func.coalesce(func.sum(RevenueRollup.amount), 0),
+        sum_where(RevenueRollup.payment_count, RevenueRollup.day >= thirty_days_ago.date())
+    ).one()
+    
+    # Service plan popularity (from the subscription rollup)
     plan_stats = db.session.query(
         ServicePlan.name,
-        func.count(Subscription.id).label('subscription_count')
-    ).join(Subscription).filter(
-        Subscription.status == 'active'
-    ).group_by(ServicePlan.id, ServicePlan.name).all()
+        PlanSubscriptionRollup.active_count
+    ).join(PlanSubscriptionRollup, PlanSubscriptionRollup.plan_id == ServicePlan.id).filter(
+        PlanSubscriptionRollup.active_count > 0
+    ).all()
+    active_subscriptions = sum(count for _, count in plan_stats)
     
-    # Monthly revenue (last 12 months)
-    monthly_revenue = []
-    for i in range(12):
-        month_start = datetime.utcnow().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        revenue = db.session.query(func.sum(Payment.amount)).filter(
-            Payment.payment_date >= month_start,
-            Payment.payment_date <= month_end,
-            Payment.status == 'completed'
-        ).scalar() or 0
-        
-        monthly_revenue.append({
-            'month': month_start.strftime('%Y-%m'),
-            'revenue': float(revenue)
-        })
-    
-    monthly_revenue.reverse()  # Show oldest to newest
+    # Monthly revenue (last 12 calendar months, oldest to newest)
+    monthly_revenue = [
+        {'month': month, 'revenue': revenue}
+        for month, revenue in monthly_totals(RevenueRollup.amount, RevenueRollup.day, months=12)
+    ]
     
     # Ticket statistics
-    ticket_stats = {
-        'open': Ticket.query.filter_by(status='open').count(),
-        'in_progress': Ticket.query.filter_by(status='in_progress').count(),
-        'resolved': Ticket.query.filter_by(status='resolved').count(),
-        'closed': Ticket.query.filter_by(status='closed').count()
-    }
+    ticket_row = db.session.query(*status_counts(Ticket.status, TICKET_STATUSES)).one()
+    ticket_stats = dict(zip(TICKET_STATUSES, ticket_row))
+    open_tickets = ticket_stats['open']
     
     # Network node status (for tech/admin)
     network_stats = {}
     if role in ['admin', 'tech']:
-        total_nodes = NetworkNode.query.count()
-        active_nodes = NetworkNode.query.filter_by(status='active').count()
-        avg_load = db.session.query(func.avg(NetworkNode.current_load)).scalar() or 0
+        total_nodes, active_nodes, avg_load = db.session.query(
+            func.count(NetworkNode.id),
+            count_where(NetworkNode.status == 'active'),
+            func.avg(NetworkNode.current_load)
+        ).one()
         
         network_stats = {
             'total_nodes': total_nodes,
             'active_nodes': active_nodes,
-            'average_load': round(float(avg_load), 2)
+            'average_load': round(float(avg_load or 0), 2)
         }
     
     return jsonify({
@@ -97,6 +107,74 @@ def get_dashboard_stats():
         'network_stats': network_stats
     })
 
+@dashboard_bp.route('/revenue', methods=['GET'])
+@jwt_required()
+def get_revenue_analytics():
+    """Revenue over a date range, bucketed by day/week/month (reads only the rollup tables)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'sales']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'message': 'Invalid granularity'}), 400
+    
+    try:
+        end = date.fromisoformat(request.args['end']) if 'end' in request.args else datetime.utcnow().date()
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else end - timedelta(days=30)
+    except ValueError:
+        return jsonify({'message': 'Dates must be YYYY-MM-DD'}), 400
+    
+    if start > end:
+        return jsonify({'message': 'start must not be after end'}), 400
+    
+    in_range = (RevenueRollup.day >= start) & (RevenueRollup.day <= end)
+    
+    series = revenue_series_query(start, end, granularity).all()
+    
+    by_plan = db.session.query(
+        ServicePlan.id,
+        ServicePlan.name,
+        func.sum(RevenueRollup.amount),
+        func.sum(RevenueRollup.payment_count)
+    ).join(RevenueRollup, RevenueRollup.plan_id == ServicePlan.id).filter(
+        in_range
+    ).group_by(ServicePlan.id, ServicePlan.name).all()
+    
+    by_method = db.session.query(
+        RevenueRollup.payment_method,
+        func.sum(RevenueRollup.amount),
+        func.sum(RevenueRollup.payment_count)
+    ).filter(in_range).group_by(RevenueRollup.payment_method).all()
+    
+    active_by_plan = db.session.query(
+        ServicePlan.id,
+        ServicePlan.name,
+        PlanSubscriptionRollup.active_count
+    ).join(PlanSubscriptionRollup, PlanSubscriptionRollup.plan_id == ServicePlan.id).all()
+    
+    return jsonify({
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'series': [
+            {'period': period, 'revenue': float(revenue or 0), 'payments': int(count or 0)}
+            for period, revenue, count in series
+        ],
+        'by_plan': [
+            {'plan_id': plan_id, 'plan_name': name, 'revenue': float(revenue or 0), 'payments': int(count or 0)}
+            for plan_id, name, revenue, count in by_plan
+        ],
+        'by_payment_method': [
+            {'payment_method': method, 'revenue': float(revenue or 0), 'payments': int(count or 0)}
+            for method, revenue, count in by_method
+        ],
+        'active_subscriptions': [
+            {'plan_id': plan_id, 'plan_name': name, 'active': active}
+            for plan_id, name, active in active_by_plan
+        ]
+    })
+
 @dashboard_bp.route('/recent-activity', methods=['GET'])
 @jwt_required()
 def get_recent_activity():
@@ -105,20 +183,10 @@ def get_recent_activity():
     if claims.get('role') not in ['admin', 'sales', 'tech']:
         return jsonify({'message': 'Unauthorized'}), 403
     
-    # Recent customers (last 10)
-    recent_customers = Customer.query.order_by(
-        Customer.created_at.desc()
-    ).limit(10).all()
-    
-    # Recent payments (last 10)
-    recent_payments = Payment.query.order_by(
-        Payment.payment_date.desc()
-    ).limit(10).all()
-    
-    # Recent tickets (last 10)
-    recent_tickets = Ticket.query.order_by(
-        Ticket.created_at.desc()
-    ).limit(10).all()
+    # Last 10 customers, payments and tickets
+    recent_customers = recent_customers_query().all()
+    recent_payments = recent_payments_query().all()
+    recent_tickets = recent_tickets_query().all()
     
     return jsonify({
         'recent_customers': [{
@@ -1,11 +1,26 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask_jwt_extended import jwt_required, get_jwt
 from models import Equipment, Customer
 from app import db
+from authz import current_principal
+from pagination import keyset_paginate, wants_cursor
+from search import index_entity
 from datetime import datetime
 
 equipment_bp = Blueprint('equipment', __name__, url_prefix='/api/equipment')
 
+def equipment_query(equipment_type=None, status=None):
+    """Equipment listing, optionally filtered by type and status"""
+    query = Equipment.query
+    if equipment_type:
+        query = query.filter_by(type=equipment_type)
+    if status:
+        query = query.filter_by(status=status)
+    return query
+
+def customer_equipment_query(customer_id):
+    return Equipment.query.filter_by(customer_id=customer_id)
+
 @equipment_bp.route('', methods=['GET'])
 @jwt_required()
 def get_all_equipment():
@@ -19,27 +34,36 @@ def get_all_equipment():
     equipment_type = request.args.get('type')
     status = request.args.get('status')
     
-    query = Equipment.query
-    if equipment_type:
-        query = query.filter_by(type=equipment_type)
-    if status:
-        query = query.filter_by(status=status)
+    query = equipment_query(equipment_type, status)
+    
+    try:
+        serialize, options = Equipment.serializers['list'].select(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    query = query.options(*options)
+    
+    if wants_cursor(request.args):
+        try:
+            equipment_list = keyset_paginate(
+                query, [Equipment.id],
+                cursor=request.args.get('cursor'), per_page=per_page, descending=False,
+                include_total=request.args.get('include_total', 'false').lower() == 'true'
+            )
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        
+        return jsonify({
+            'equipment': serialize.many(equipment_list.items),
+            'next_cursor': equipment_list.next_cursor,
+            'total': equipment_list.total
+        })
     
     equipment_list = query.paginate(
         page=page, per_page=per_page, error_out=False
     )
     
     return jsonify({
-        'equipment': [{
-            'id': eq.id,
-            'customer_name': eq.customer.name,
-            'type': eq.type,
-            'model': eq.model,
-            'serial_number': eq.serial_number,
-            'mac_address': eq.mac_address,
-            'status': eq.status,
-            'installed_date': eq.installed_date.isoformat()
-        } for eq in equipment_list.items],
+        'equipment': serialize.many(equipment_list.items),
         'total': equipment_list.total,
         'pages': equipment_list.pages,
         'current_page': page
@@ -75,6 +99,8 @@ def create_equipment():
     )
     
     db.session.add(equipment)
+    db.session.flush()
+    index_entity('equipment', equipment)
     db.session.commit()
     
     return jsonify({
@@ -87,27 +113,18 @@ def create_equipment():
 @jwt_required()
 def get_customer_equipment(customer_id):
     """Get all equipment for a customer"""
-    current_user_id = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user_id)).first()
-        if not customer or customer.id != customer_id:
+        if not principal.owns_customer(customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     
     customer = Customer.query.get_or_404(customer_id)
-    equipment_list = Equipment.query.filter_by(customer_id=customer_id).all()
-    
-    return jsonify([{
-        'id': eq.id,
-        'type': eq.type,
-        'model': eq.model,
-        'serial_number': eq.serial_number,
-        'mac_address': eq.mac_address,
-        'status': eq.status,
-        'installed_date': eq.installed_date.isoformat()
-    } for eq in equipment_list])
+    equipment_list = customer_equipment_query(customer_id).all()
+    
+    return jsonify(Equipment.serializers['customer'].many(equipment_list))
 
 @equipment_bp.route('/<int:equipment_id>', methods=['PUT'])
 @jwt_required()
@@ -128,6 +145,7 @@ def update_equipment(equipment_id):
         equipment.status = data['status']
     if 'mac_address' in data:
         equipment.mac_address = data['mac_address']
+        index_entity('equipment', equipment)
     
     db.session.commit()
     
@@ -0,0 +1,151 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt
+from models import Payment, Subscription, Customer, ServicePlan, Ticket, User
+from streaming import stream_query
+from datetime import datetime
+from sqlalchemy import select
+
+exports_bp = Blueprint('exports', __name__, url_prefix='/api/exports')
+
+EXPORT_FORMATS = ['csv', 'ndjson']
+
+def _export_args(date_column):
+    """Format plus date-range/status filters from the query string; returns (format, filters) or an error response"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return None, (jsonify({'message': 'format must be csv or ndjson'}), 400)
+    
+    filters = []
+    try:
+        if request.args.get('start'):
+            filters.append(date_column >= datetime.fromisoformat(request.args['start']))
+        if request.args.get('end'):
+            filters.append(date_column < datetime.fromisoformat(request.args['end']))
+    except ValueError:
+        return None, (jsonify({'message': 'start/end must be ISO dates'}), 400)
+    
+    return fmt, filters
+
+@exports_bp.route('/payments', methods=['GET'])
+@jwt_required()
+def export_payments():
+    """Stream all payments with customer and plan names (admin/sales only)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'sales']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    fmt, filters = _export_args(Payment.payment_date)
+    if fmt is None:
+        return filters
+    if request.args.get('status'):
+        filters.append(Payment.status == request.args['status'])
+    
+    stmt = select(
+        Payment.id,
+        Payment.subscription_id,
+        Subscription.customer_id,
+        Customer.name.label('customer_name'),
+        ServicePlan.name.label('plan_name'),
+        Payment.amount,
+        Payment.payment_date,
+        Payment.payment_method,
+        Payment.transaction_id,
+        Payment.status
+    ).join(Subscription, Payment.subscription_id == Subscription.id).join(
+        Customer, Subscription.customer_id == Customer.id
+    ).join(ServicePlan, Subscription.plan_id == ServicePlan.id).where(*filters).order_by(Payment.id)
+    
+    columns = ['id', 'subscription_id', 'customer_id', 'customer_name', 'plan_name', 'amount',
+               'payment_date', 'payment_method', 'transaction_id', 'status']
+    return stream_query(stmt, columns, fmt, filename='payments')
+
+@exports_bp.route('/subscriptions', methods=['GET'])
+@jwt_required()
+def export_subscriptions():
+    """Stream all subscriptions with customer and plan details (admin/sales only)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'sales']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    fmt, filters = _export_args(Subscription.start_date)
+    if fmt is None:
+        return filters
+    if request.args.get('status'):
+        filters.append(Subscription.status == request.args['status'])
+    
+    stmt = select(
+        Subscription.id,
+        Subscription.customer_id,
+        Customer.name.label('customer_name'),
+        Subscription.plan_id,
+        ServicePlan.name.label('plan_name'),
+        ServicePlan.price.label('plan_price'),
+        Subscription.status,
+        Subscription.start_date,
+        Subscription.end_date,
+        Subscription.payment_method
+    ).join(Customer, Subscription.customer_id == Customer.id).join(
+        ServicePlan, Subscription.plan_id == ServicePlan.id
+    ).where(*filters).order_by(Subscription.id)
+    
+    columns = ['id', 'customer_id', 'customer_name', 'plan_id', 'plan_name', 'plan_price',
+               'status', 'start_date', 'end_date', 'payment_method']
+    return stream_query(stmt, columns, fmt, filename='subscriptions')
+
+@exports_bp.route('/customers', methods=['GET'])
+@jwt_required()
+def export_customers():
+    """Stream all customers (admin/sales only)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'sales']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    fmt, filters = _export_args(Customer.created_at)
+    if fmt is None:
+        return filters
+    
+    stmt = select(
+        Customer.id,
+        Customer.name,
+        Customer.email,
+        Customer.phone,
+        Customer.billing_address,
+        Customer.service_address,
+        Customer.created_at
+    ).where(*filters).order_by(Customer.id)
+    
+    columns = ['id', 'name', 'email', 'phone', 'billing_address', 'service_address', 'created_at']
+    return stream_query(stmt, columns, fmt, filename='customers')
+
+@exports_bp.route('/tickets', methods=['GET'])
+@jwt_required()
+def export_tickets():
+    """Stream all tickets with customer and assignee names (staff only)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'sales', 'tech']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    fmt, filters = _export_args(Ticket.created_at)
+    if fmt is None:
+        return filters
+    if request.args.get('status'):
+        filters.append(Ticket.status == request.args['status'])
+    
+    stmt = select(
+        Ticket.id,
+        Ticket.customer_id,
+        Customer.name.label('customer_name'),
+        Ticket.title,
+        Ticket.description,
+        Ticket.status,
+        Ticket.priority,
+        Ticket.created_at,
+        Ticket.resolved_at,
+        User.username.label('assigned_to')
+    ).join(Customer, Ticket.customer_id == Customer.id).outerjoin(
+        User, Ticket.assigned_to == User.id
+    ).where(*filters).order_by(Ticket.id)
+    
+    columns = ['id', 'customer_id', 'customer_name', 'title', 'description', 'status',
+               'priority', 'created_at', 'resolved_at', 'assigned_to']
+    return stream_query(stmt, columns, fmt, filename='tickets')
@@ -0,0 +1,76 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt
+from models import ImportJob
+from imports import ENTITY_TYPES, IMPORT_FORMATS
+from jobs import enqueue
+from app import db
+from authz import current_principal
+import shutil
+import tempfile
+
+imports_bp = Blueprint('imports', __name__, url_prefix='/api/imports')
+
+# Roles allowed to bulk-load each entity type (mirrors the single-record create routes)
+IMPORT_ROLES = {
+    'customers': ['admin', 'sales'],
+    'equipment': ['admin', 'tech'],
+    'subscriptions': ['admin', 'sales'],
+}
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'entity_type': job.entity_type,
+        'status': job.status,
+        'processed_rows': job.processed_rows,
+        'inserted_rows': job.inserted_rows,
+        'error_count': job.error_count,
+        'errors': job.errors or [],
+        'message': job.message,
+        'rows_per_second': job.rows_per_second,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'created_at': job.created_at.isoformat()
+    }
+
+@imports_bp.route('/<entity_type>', methods=['POST'])
+@jwt_required()
+def create_import(entity_type):
+    """Upload a CSV/NDJSON file and import it in the background; poll the returned job for progress"""
+    claims = get_jwt()
+    if entity_type not in ENTITY_TYPES:
+        return jsonify({'message': 'Unknown import type'}), 404
+    if claims.get('role') not in IMPORT_ROLES[entity_type]:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format') or ('ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'csv')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'message': 'format must be csv or ndjson'}), 400
+    
+    # Spool the upload to disk so the worker can read it after the request ends
+    spool = tempfile.NamedTemporaryFile(prefix='import-', suffix='.' + fmt, delete=False)
+    with spool:
+        shutil.copyfileobj(upload.stream if upload else request.stream, spool)
+    
+    job = ImportJob(entity_type=entity_type, created_by=current_principal().user_id)
+    db.session.add(job)
+    db.session.flush()
+    # One attempt: a partly applied import is not safe to replay, and the spool file is removed after it
+    runner_job = enqueue('import', {'import_job_id': job.id, 'path': spool.name, 'format': fmt},
+                         created_by=job.created_by, max_attempts=1)
+    db.session.commit()
+    
+    return jsonify(dict(serialize_job(job), job_id=runner_job.id)), 202
+
+@imports_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_import(job_id):
+    """Progress, per-row errors and throughput of an import job"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'sales', 'tech']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    job = ImportJob.query.get_or_404(job_id)
+    return jsonify(serialize_job(job))
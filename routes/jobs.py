@@ -0,0 +1,21 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required, get_jwt
+from models import Job
+from authz import current_principal
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Status, attempts and result of a background job (staff, or the user who started it)"""
+    claims = get_jwt()
+    job = Job.query.get_or_404(job_id)
+    
+    if claims.get('role') not in ['admin', 'sales', 'tech'] and job.created_by != current_principal().user_id:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    response = jsonify(Job.serializers['detail'](job))
+    if job.status in ('queued', 'running'):
+        response.headers['Retry-After'] = '1'
+    return response
@@ -1,11 +1,46 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt
-from models import NetworkNode
+from models import NetworkNode, Customer
 from app import db
-from datetime import datetime
+from conditional import Validators
+from streaming import iter_mappings, stream_response
+from forecast import SORT_FIELDS, ForecastUnavailable, get_forecast, sort_nodes
+from spatial import coordinates, index_node, node_index
+from telemetry import RESOLUTION_NAMES, SampleError, ingest_samples, load_history, parse_timestamp, pick_resolution
+from sqlalchemy import select
+from datetime import datetime, timedelta
+import json
 
 network_nodes_bp = Blueprint('network_nodes', __name__, url_prefix='/api/network-nodes')
 
+MAX_NEAREST = 100
+MAX_WITHIN = 5000
+
+def invalid_location(location):
+    """Error message for a location whose lat/lng are given but unusable, else None"""
+    if not isinstance(location, dict):
+        return 'location must be an object'
+    if ('lat' in location or 'lng' in location) and coordinates(location) is None:
+        return 'location lat/lng must be numbers within -90..90 and -180..180'
+    return None
+
+def located_nodes(node_ids):
+    """Node summaries for index results, in the order given"""
+    rows = db.session.execute(select(
+        NetworkNode.id, NetworkNode.name, NetworkNode.location, NetworkNode.status,
+        NetworkNode.capacity, NetworkNode.current_load
+    ).where(NetworkNode.id.in_(node_ids))).all() if node_ids else []
+    nodes = {row.id: row for row in rows}
+    return [{
+        'id': node.id,
+        'name': node.name,
+        'location': node.location,
+        'status': node.status,
+        'capacity': node.capacity,
+        'current_load': node.current_load,
+        'load_percentage': round((node.current_load / node.capacity) * 100, 2) if node.capacity > 0 else 0
+    } for node in (nodes.get(node_id) for node_id in node_ids) if node is not None]
+
 @network_nodes_bp.route('', methods=['GET'])
 @jwt_required()
 def get_network_nodes():
@@ -14,17 +49,105 @@ def get_network_nodes():
     if claims.get('role') not in ['admin', 'tech']:
         return jsonify({'message': 'Tech access required'}), 403
     
-    nodes = NetworkNode.query.all()
+    stmt = select(
+        NetworkNode.id,
+        NetworkNode.name,
+        NetworkNode.location,
+        NetworkNode.status,
+        NetworkNode.capacity,
+        NetworkNode.current_load
+    ).order_by(NetworkNode.id)
     
-    return jsonify([{
-        'id': node.id,
-        'name': node.name,
-        'location': node.location,
-        'status': node.status,
-        'capacity': node.capacity,
-        'current_load': node.current_load,
-        'load_percentage': round((node.current_load / node.capacity) * 100, 2) if node.capacity > 0 else 0
-    } for node in nodes])
+    def nodes():
+        for node in iter_mappings(stmt):
+            yield dict(node, load_percentage=round((node['current_load'] / node['capacity']) * 100, 2) if node['capacity'] > 0 else 0)
+    
+    return stream_response(nodes(), ['id', 'name', 'location', 'status', 'capacity', 'current_load', 'load_percentage'])
+
+@network_nodes_bp.route('/forecast', methods=['GET'])
+@jwt_required()
+def get_network_node_forecast():
+    """Projected time to saturation for every node (tech/admin only): ?sort=<field>&order=asc|desc"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'tech']:
+        return jsonify({'message': 'Tech access required'}), 403
+    
+    sort = request.args.get('sort', 'days_to_saturation')
+    order = request.args.get('order', 'asc')
+    if sort not in SORT_FIELDS or order not in ('asc', 'desc'):
+        return jsonify({'message': 'sort must be one of %s and order asc or desc' % ', '.join(SORT_FIELDS)}), 400
+    
+    try:
+        forecast, stamp = get_forecast()
+    except ForecastUnavailable as e:
+        return jsonify({'message': str(e)}), 503
+    
+    # ETag only: late samples change the stamp's rollup_version but not any timestamp Last-Modified could use
+    validators = Validators('network_node_forecast', ':'.join([sort, order] + [
+        value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in stamp
+    ]))
+    if validators.fresh():
+        return validators.not_modified()
+    
+    return validators.apply(jsonify({
+        'generated_at': forecast['generated_at'],
+        'nodes': sort_nodes(forecast['nodes'], sort, descending=order == 'desc')
+    }))
+
+@network_nodes_bp.route('/nearest', methods=['GET'])
+@jwt_required()
+def get_nearest_network_nodes():
+    """The k nearest active nodes to ?lat=&lng= or to ?customer_id='s service address (tech/admin only)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'tech']:
+        return jsonify({'message': 'Tech access required'}), 403
+    
+    if request.args.get('customer_id'):
+        customer = Customer.query.get_or_404(request.args.get('customer_id', type=int))
+        origin = coordinates(customer.service_address)
+        if origin is None:
+            return jsonify({'message': 'Customer service address has no lat/lng coordinates'}), 400
+    else:
+        origin = coordinates({'lat': request.args.get('lat', type=float), 'lng': request.args.get('lng', type=float)})
+        if origin is None:
+            return jsonify({'message': 'Valid lat and lng (or customer_id) are required'}), 400
+    
+    k = request.args.get('k', 5, type=int)
+    max_km = request.args.get('max_km', type=float)
+    if not 1 <= k <= MAX_NEAREST:
+        return jsonify({'message': 'k must be between 1 and %d' % MAX_NEAREST}), 400
+    
+    found = node_index().nearest(origin[0], origin[1], k, max_km=max_km)
+    distances = {node_id: distance for distance, node_id in found}
+    nodes = located_nodes([node_id for _, node_id in found])
+    
+    return jsonify({
+        'origin': {'lat': origin[0], 'lng': origin[1]},
+        'nodes': [dict(node, distance_km=round(distances[node['id']], 3)) for node in nodes]
+    })
+
+@network_nodes_bp.route('/within', methods=['GET'])
+@jwt_required()
+def get_network_nodes_within():
+    """Nodes inside ?bbox=west,south,east,north for map views; ?status=active for active ones only (tech/admin only)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'tech']:
+        return jsonify({'message': 'Tech access required'}), 403
+    
+    try:
+        west, south, east, north = [float(value) for value in request.args.get('bbox', '').split(',')]
+    except ValueError:
+        return jsonify({'message': 'bbox must be west,south,east,north'}), 400
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        return jsonify({'message': 'bbox must be west,south,east,north within -180..180 and -90..90'}), 400
+    
+    node_ids = node_index().within(south, west, north, east, active_only=request.args.get('status') == 'active')
+    truncated = len(node_ids) > MAX_WITHIN
+    
+    return jsonify({
+        'nodes': located_nodes(sorted(node_ids)[:MAX_WITHIN]),
+        'truncated': truncated
+    })
 
 @network_nodes_bp.route('', methods=['POST'])
 @jwt_required()
@@ -39,6 +162,10 @@ def create_network_node():
     if not data or not all(k in data for k in ('name', 'location', 'capacity')):
         return jsonify({'message': 'Missing required fields'}), 400
     
+    error = invalid_location(data['location'])
+    if error:
+        return jsonify({'message': error}), 400
+    
     node = NetworkNode(
         name=data['name'],
         location=data['location'],
@@ -49,6 +176,7 @@ def create_network_node():
     
     db.session.add(node)
     db.session.commit()
+    index_node(node)
     
     return jsonify({
         'id': node.id,
@@ -70,6 +198,10 @@ def update_network_node(node_id):
     if not data:
         return jsonify({'message': 'No data provided'}), 400
     
+    # reserved_load only moves by admission deltas (see capacity.py)
+    if 'reserved_load' in data:
+        return jsonify({'message': 'reserved_load is managed by subscription admission'}), 400
+    
     # Update fields if provided
     if 'status' in data:
         node.status = data['status']
@@ -77,9 +209,15 @@ def update_network_node(node_id):
         node.current_load = int(data['current_load'])
     if 'capacity' in data and claims.get('role') == 'admin':
         node.capacity = int(data['capacity'])
+    if 'location' in data and claims.get('role') == 'admin':
+        error = invalid_location(data['location'])
+        if error:
+            return jsonify({'message': error}), 400
+        node.location = data['location']
     
     node.updated_at = datetime.utcnow()
     db.session.commit()
+    index_node(node)
     
     return jsonify({
         'id': node.id,
@@ -94,16 +232,88 @@ def get_network_node(node_id):
     if claims.get('role') not in ['admin', 'tech']:
         return jsonify({'message': 'Tech access required'}), 403
     
-    node = NetworkNode.query.get_or_404(node_id)
+    try:
+        serialize, options = NetworkNode.serializers['detail'].select(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    state = db.session.query(NetworkNode.updated_at).filter(NetworkNode.id == node_id).first_or_404()
+    validators = Validators('network_node', node_id, state.updated_at, fields=serialize.fields)
+    if validators.fresh():
+        return validators.not_modified()
+    
+    node = NetworkNode.query.options(*options).get_or_404(node_id)
+    
+    return validators.apply(jsonify(serialize(node)))
+
+@network_nodes_bp.route('/telemetry', methods=['POST'])
+@jwt_required()
+def ingest_telemetry():
+    """Record a batch of load samples from pollers (admin/tech)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'tech']:
+        return jsonify({'message': 'Tech access required'}), 403
+    
+    # Accept a JSON array, {"samples": [...]}, or NDJSON (one sample per line)
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        try:
+            items = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError:
+            return jsonify({'message': 'Invalid NDJSON body'}), 400
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('samples') if isinstance(data, dict) else data
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'A non-empty list of samples is required'}), 400
+    
+    max_items = current_app.config.get('TELEMETRY_BATCH_MAX_SAMPLES', 50000)
+    if len(items) > max_items:
+        return jsonify({'message': 'Batch exceeds %d samples' % max_items}), 413
+    
+    accepted, duplicates, errors = ingest_samples(items)
     
     return jsonify({
-        'id': node.id,
-        'name': node.name,
-        'location': node.location,
-        'status': node.status,
-        'capacity': node.capacity,
-        'current_load': node.current_load,
-        'load_percentage': round((node.current_load / node.capacity) * 100, 2) if node.capacity > 0 else 0,
-        'created_at': node.created_at.isoformat(),
-        'updated_at': node.updated_at.isoformat()
-    })
\ No newline at end of file
+        'accepted': accepted,
+        'duplicates': duplicates,
+        'rejected': len(errors),
+        'errors': errors
+    }), 202 if accepted or duplicates else 400
+
+@network_nodes_bp.route('/<int:node_id>/load', methods=['GET'])
+@jwt_required()
+def get_node_load_history(node_id):
+    """Load history for a node: ?start=&end= (ISO 8601 or epoch seconds, default the last hour) and
+    ?resolution=raw|1m|1h (default: the finest that fits the range)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'tech']:
+        return jsonify({'message': 'Tech access required'}), 403
+    
+    NetworkNode.query.get_or_404(node_id)
+    
+    try:
+        end = parse_timestamp(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        start = parse_timestamp(request.args['start']) if request.args.get('start') else end - timedelta(hours=1)
+    except SampleError as e:
+        return jsonify({'message': str(e).replace('timestamp', 'start and end')}), 400
+    except OverflowError:
+        return jsonify({'message': 'start and end are out of range'}), 400
+    if start >= end:
+        return jsonify({'message': 'start must be before end'}), 400
+    
+    resolution = request.args.get('resolution') or pick_resolution(start, end)
+    if resolution not in RESOLUTION_NAMES:
+        return jsonify({'message': 'resolution must be raw, 1m or 1h'}), 400
+    
+    try:
+        points = load_history(node_id, start, end, resolution)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify({
+        'node_id': node_id,
+        'start': start,
+        'end': end,
+        'resolution': resolution,
+        'points': points
+    })
@@ -1,8 +1,15 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask import Blueprint, jsonify, request, current_app
+from flask_jwt_extended import jwt_required, get_jwt
 from models import Payment, Subscription, Customer
 from app import db
+from authz import current_principal
+from rollups import record_payment
+from pagination import keyset_paginate, wants_cursor
+from payment_batches import ingest_payments, BATCH_MODES
+from jobs import enqueue
+import payment_gateway  # registers the process_payment job handler
 from datetime import datetime
+import json
 import uuid
 
 payments_bp = Blueprint('payments', __name__, url_prefix='/api/payments')
@@ -34,6 +41,7 @@ def create_payment():
     )
     
     db.session.add(payment)
+    record_payment(payment, subscription.plan_id)
     db.session.commit()
     
     return jsonify({
@@ -44,31 +52,73 @@ def create_payment():
         'message': 'Payment recorded successfully'
     }), 201
 
+@payments_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def create_payment_batch():
+    """Record many payments in one request (sales role required)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'sales']:
+        return jsonify({'message': 'Sales access required'}), 403
+    
+    mode = request.args.get('mode', 'atomic')
+    if mode not in BATCH_MODES:
+        return jsonify({'message': 'mode must be atomic or partial'}), 400
+    
+    # Accept a JSON array, {"payments": [...]}, or NDJSON (one payment per line)
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        try:
+            items = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError:
+            return jsonify({'message': 'Invalid NDJSON body'}), 400
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('payments') if isinstance(data, dict) else data
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'A non-empty list of payments is required'}), 400
+    
+    max_items = current_app.config.get('PAYMENT_BATCH_MAX_ITEMS', 10000)
+    if len(items) > max_items:
+        return jsonify({'message': 'Batch exceeds %d payments' % max_items}), 413
+    
+    results, created = ingest_payments(
+        items, mode=mode, chunk_size=current_app.config.get('PAYMENT_BATCH_CHUNK_SIZE', 1000)
+    )
+    
+    return jsonify({
+        'mode': mode,
+        'created': created,
+        'failed': len(items) - created,
+        'results': results
+    }), 201 if created else 400
+
+def payments_query(status=None):
+    """Payments listing, newest first, optionally filtered by status"""
+    query = Payment.query
+    if status:
+        query = query.filter_by(status=status)
+    return query.order_by(Payment.payment_date.desc())
+
+def subscription_payments_query(subscription_id):
+    return Payment.query.filter_by(subscription_id=subscription_id)
+
 @payments_bp.route('/subscription/<int:subscription_id>', methods=['GET'])
 @jwt_required()
 def get_subscription_payments(subscription_id):
     """Get all payments for a subscription"""
-    current_user_id = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
     subscription = Subscription.query.get_or_404(subscription_id)
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user_id)).first()
-        if not customer or subscription.customer_id != customer.id:
+        if not principal.owns_customer(subscription.customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     
-    payments = Payment.query.filter_by(subscription_id=subscription_id).all()
+    payments = subscription_payments_query(subscription_id).all()
     
-    return jsonify([{
-        'id': payment.id,
-        'amount': payment.amount,
-        'payment_date': payment.payment_date.isoformat(),
-        'payment_method': payment.payment_method,
-        'transaction_id': payment.transaction_id,
-        'status': payment.status
-    } for payment in payments])
+    return jsonify(Payment.serializers['subscription'].many(payments))
 
 @payments_bp.route('/process', methods=['POST'])
 @jwt_required()
@@ -85,25 +135,18 @@ def process_payment():
     
     subscription = Subscription.query.get_or_404(data['subscription_id'])
     
-    # Simulate payment processing
-    transaction_id = str(uuid.uuid4())
-    
-    # In a real implementation, integrate with payment gateway here
-    # For demo, we'll simulate success/failure
-    import random
-    success = random.choice([True, True, True, False])  # 75% success rate
-    
-    status = 'completed' if success else 'failed'
-    
     payment = Payment(
         subscription_id=subscription.id,
         amount=float(data['amount']),
         payment_method=data['payment_method'],
-        transaction_id=transaction_id,
-        status=status
+        transaction_id=str(uuid.uuid4()),
+        status='pending'
     )
     
+    # The gateway call runs on a job worker; the payment is settled (and enters the revenue rollup) there
     db.session.add(payment)
+    db.session.flush()
+    job = enqueue('process_payment', {'payment_id': payment.id}, created_by=current_principal().user_id)
     db.session.commit()
     
     return jsonify({
@@ -111,9 +154,9 @@ def process_payment():
         'transaction_id': payment.transaction_id,
         'amount': payment.amount,
         'status': payment.status,
-        'success': success,
-        'message': 'Payment processed successfully' if success else 'Payment failed'
-    }), 201 if success else 400
+        'job_id': job.id,
+        'message': 'Payment submitted for processing'
+    }), 202
 
 @payments_bp.route('', methods=['GET'])
 @jwt_required()
@@ -127,25 +170,36 @@ def get_all_payments():
     per_page = request.args.get('per_page', 20, type=int)
     status = request.args.get('status')
     
-    query = Payment.query
-    if status:
-        query = query.filter_by(status=status)
-    
-    payments = query.order_by(Payment.payment_date.desc()).paginate(
+    query = payments_query(status)
+    
+    try:
+        serialize, options = Payment.serializers['list'].select(request.args.get('fields'), extra=[Payment.payment_date])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    query = query.options(*options)
+    
+    if wants_cursor(request.args):
+        try:
+            payments = keyset_paginate(
+                query, [Payment.payment_date, Payment.id],
+                cursor=request.args.get('cursor'), per_page=per_page,
+                include_total=request.args.get('include_total', 'false').lower() == 'true'
+            )
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        
+        return jsonify({
+            'payments': serialize.many(payments.items),
+            'next_cursor': payments.next_cursor,
+            'total': payments.total
+        })
+    
+    payments = query.paginate(
         page=page, per_page=per_page, error_out=False
     )
     
     return jsonify({
-        'payments': [{
-            'id': payment.id,
-            'subscription_id': payment.subscription_id,
-            'customer_name': payment.subscription.customer.name,
-            'amount': payment.amount,
-            'payment_date': payment.payment_date.isoformat(),
-            'payment_method': payment.payment_method,
-            'transaction_id': payment.transaction_id,
-            'status': payment.status
-        } for payment in payments.items],
+        'payments': serialize.many(payments.items),
         'total': payments.total,
         'pages': payments.pages,
         'current_page': page
@@ -155,15 +209,14 @@ def get_all_payments():
 @jwt_required()
 def get_payment(payment_id):
     """Get specific payment details"""
-    current_user_id = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
     payment = Payment.query.get_or_404(payment_id)
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user_id)).first()
-        if not customer or payment.subscription.customer_id != customer.id:
+        if not principal.owns_customer(payment.subscription.customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     
     return jsonify({
@@ -0,0 +1,31 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt
+from search import search, ENTITY_TYPES
+
+search_bp = Blueprint('search', __name__, url_prefix='/api/search')
+
+@search_bp.route('', methods=['GET'])
+@jwt_required()
+def unified_search():
+    """Ranked full-text search across customers, tickets and equipment (staff only)"""
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'sales', 'tech']:
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    text = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    types = request.args.get('types')
+    types = types.split(',') if types else ENTITY_TYPES
+    
+    if not text.strip():
+        return jsonify({'message': 'Search text (q) required'}), 400
+    
+    results, has_more = search(text, types, page=page, per_page=per_page)
+    
+    return jsonify({
+        'results': results,
+        'page': page,
+        'per_page': per_page,
+        'has_more': has_more
+    })
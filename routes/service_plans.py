@@ -1,31 +1,27 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt
-from models import ServicePlan
+from models import ServicePlan, Subscription
 from app import db
+from catalog import get_catalog, invalidate_catalog, max_age
+from conditional import Validators
 from datetime import datetime
 
 service_plans_bp = Blueprint('service_plans', __name__, url_prefix='/api/plans')
 
+def active_plan_subscriptions_query(plan_id):
+    return Subscription.query.filter_by(plan_id=plan_id, status='active')
+
 @service_plans_bp.route('', methods=['GET'])
 def get_service_plans():
-    """Get all service plans (public endpoint)"""
+    """Get all service plans (public endpoint, served from the catalog cache)"""
     active_only = request.args.get('active_only', 'true').lower() == 'true'
+    catalog = get_catalog(active_only)
     
-    query = ServicePlan.query
-    if active_only:
-        query = query.filter_by(is_active=True)
-    
-    plans = query.all()
-    
-    return jsonify([{
-        'id': plan.id,
-        'name': plan.name,
-        'description': plan.description,
-        'speed': plan.speed,
-        'data_cap': plan.data_cap,
-        'price': plan.price,
-        'is_active': plan.is_active
-    } for plan in plans])
+    response = current_app.response_class(catalog.body, mimetype='application/json')
+    response.set_etag(catalog.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age()
+    return response.make_conditional(request)
 
 @service_plans_bp.route('', methods=['POST'])
 @jwt_required()
@@ -51,6 +47,7 @@ def create_service_plan():
     
     db.session.add(plan)
     db.session.commit()
+    invalidate_catalog()
     
     return jsonify({
         'id': plan.id,
@@ -61,19 +58,19 @@ def create_service_plan():
 @service_plans_bp.route('/<int:plan_id>', methods=['GET'])
 def get_service_plan(plan_id):
     """Get specific service plan"""
-    plan = ServicePlan.query.get_or_404(plan_id)
+    try:
+        serialize, options = ServicePlan.serializers['detail'].select(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify({
-        'id': plan.id,
-        'name': plan.name,
-        'description': plan.description,
-        'speed': plan.speed,
-        'data_cap': plan.data_cap,
-        'price': plan.price,
-        'is_active': plan.is_active,
-        'created_at': plan.created_at.isoformat(),
-        'updated_at': plan.updated_at.isoformat()
-    })
+    state = db.session.query(ServicePlan.updated_at).filter(ServicePlan.id == plan_id).first_or_404()
+    validators = Validators('service_plan', plan_id, state.updated_at, fields=serialize.fields)
+    if validators.fresh():
+        return validators.not_modified()
+    
+    plan = ServicePlan.query.options(*options).get_or_404(plan_id)
+    
+    return validators.apply(jsonify(serialize(plan)))
 
 @service_plans_bp.route('/<int:plan_id>', methods=['PUT'])
 @jwt_required()
@@ -105,6 +102,7 @@ def update_service_plan(plan_id):
     
     plan.updated_at = datetime.utcnow()
     db.session.commit()
+    invalidate_catalog()
     
     return jsonify({
         'id': plan.id,
@@ -122,15 +120,15 @@ def delete_service_plan(plan_id):
     plan = ServicePlan.query.get_or_404(plan_id)
     
     # Check if plan has active subscriptions
-    if plan.subscriptions:
-        active_subs = [sub for sub in plan.subscriptions if sub.status == 'active']
-        if active_subs:
-            return jsonify({
-                'message': 'Cannot delete plan with active subscriptions',
-                'active_subscriptions': len(active_subs)
-            }), 400
+    active_subs = active_plan_subscriptions_query(plan_id).count()
+    if active_subs:
+        return jsonify({
+            'message': 'Cannot delete plan with active subscriptions',
+            'active_subscriptions': active_subs
+        }), 400
     
     db.session.delete(plan)
     db.session.commit()
+    invalidate_catalog()
     
     return jsonify({'message': 'Service plan deleted successfully'})
\ No newline at end of file
@@ -1,11 +1,32 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from flask_jwt_extended import jwt_required, get_jwt
 from models import Subscription, Customer, ServicePlan
 from app import db
+from authz import current_principal
+from capacity import CapacityError, admit_for_request
+from conditional import Validators
+from rollups import record_subscription_status
+from subscription_lifecycle import set_status
+from pagination import keyset_paginate, wants_cursor
 from datetime import datetime, timedelta
 
 subscriptions_bp = Blueprint('subscriptions', __name__, url_prefix='/api/subscriptions')
 
+def active_subscription_query(customer_id):
+    """A customer's active subscription (at most one is allowed)"""
+    return Subscription.query.filter_by(customer_id=customer_id, status='active')
+
+def customer_subscriptions_query(customer_id):
+    """All of a customer's subscriptions"""
+    return Subscription.query.filter_by(customer_id=customer_id)
+
+def subscriptions_query(status=None):
+    """Subscriptions listing, optionally filtered by status"""
+    query = Subscription.query
+    if status:
+        query = query.filter_by(status=status)
+    return query
+
 @subscriptions_bp.route('', methods=['POST'])
 @jwt_required()
 def create_subscription():
@@ -26,10 +47,7 @@ def create_subscription():
         return jsonify({'message': 'Service plan is not active'}), 400
     
     # Check for existing active subscription
-    existing = Subscription.query.filter_by(
-        customer_id=customer.id,
-        status='active'
-    ).first()
+    existing = active_subscription_query(customer.id).first()
     
     if existing:
         return jsonify({'message': 'Customer already has an active subscription'}), 400
@@ -38,15 +56,28 @@ def create_subscription():
     duration_days = data.get('duration_days', 30)
     end_date = datetime.utcnow() + timedelta(days=duration_days)
     
+    # Reserve node capacity in the same transaction as the subscription
+    try:
+        node_id = admit_for_request(customer, data)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except CapacityError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 409
+    
     subscription = Subscription(
         customer_id=customer.id,
         plan_id=plan.id,
+        node_id=node_id,
         end_date=end_date,
         payment_method=data.get('payment_method', 'cash'),
+        auto_renew=bool(data.get('auto_renew', False)),
         status='active'
     )
     
     db.session.add(subscription)
+    record_subscription_status(plan.id, None, subscription.status)
     db.session.commit()
     
     return jsonify({
@@ -54,6 +85,7 @@ def create_subscription():
         'customer': customer.name,
         'plan': plan.name,
         'status': subscription.status,
+        'node_id': subscription.node_id,
         'end_date': subscription.end_date.isoformat()
     }), 201
 
@@ -61,29 +93,35 @@ def create_subscription():
 @jwt_required()
 def get_subscription(subscription_id):
     """Get specific subscription"""
-    current_user_id = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
-    subscription = Subscription.query.get_or_404(subscription_id)
+    try:
+        serialize, options = Subscription.serializers['detail'].select(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Timestamps of the subscription and of the customer and plan it embeds
+    state = db.session.query(
+        Subscription.customer_id, Subscription.updated_at,
+        Customer.updated_at.label('customer_updated_at'), ServicePlan.updated_at.label('plan_updated_at')
+    ).join(Customer, Subscription.customer_id == Customer.id).join(
+        ServicePlan, Subscription.plan_id == ServicePlan.id
+    ).filter(Subscription.id == subscription_id).first_or_404()
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user_id)).first()
-        if not customer or subscription.customer_id != customer.id:
+        if not principal.owns_customer(state.customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     
-    return jsonify({
-        'id': subscription.id,
-        'customer_id': subscription.customer_id,
-        'customer_name': subscription.customer.name,
-        'plan_id': subscription.plan_id,
-        'plan_name': subscription.plan.name,
-        'plan_price': subscription.plan.price,
-        'start_date': subscription.start_date.isoformat(),
-        'end_date': subscription.end_date.isoformat() if subscription.end_date else None,
-        'status': subscription.status,
-        'payment_method': subscription.payment_method
-    })
+    validators = Validators('subscription', subscription_id, state.updated_at, state.customer_updated_at, state.plan_updated_at,
+                            fields=serialize.fields)
+    if validators.fresh():
+        return validators.not_modified()
+    
+    subscription = Subscription.query.options(*options).get_or_404(subscription_id)
+    
+    return validators.apply(jsonify(serialize(subscription)))
 
 @subscriptions_bp.route('/<int:subscription_id>/status', methods=['PUT'])
 @jwt_required()
@@ -103,14 +141,21 @@ def update_subscription_status(subscription_id):
     if data['status'] not in valid_statuses:
         return jsonify({'message': 'Invalid status'}), 400
     
-    subscription.status = data['status']
-    subscription.updated_at = datetime.utcnow()
+    # Conditional on the status read above: of concurrent transitions from it only one applies
+    try:
+        applied = set_status(subscription, data['status'])
+    except CapacityError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 409
+    if not applied:
+        db.session.rollback()
+        return jsonify({'message': 'Subscription status changed concurrently; reload and retry'}), 409
     
     db.session.commit()
     
     return jsonify({
-        'id': subscription.id,
-        'status': subscription.status,
+        'id': subscription_id,
+        'status': data['status'],
         'message': 'Subscription status updated successfully'
     })
 
@@ -118,27 +163,18 @@ def update_subscription_status(subscription_id):
 @jwt_required()
 def get_customer_subscriptions(customer_id):
     """Get all subscriptions for a customer"""
-    current_user_id = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user_id)).first()
-        if not customer or customer.id != customer_id:
+        if not principal.owns_customer(customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     
     customer = Customer.query.get_or_404(customer_id)
-    subscriptions = Subscription.query.filter_by(customer_id=customer_id).all()
-    
-    return jsonify([{
-        'id': sub.id,
-        'plan_name': sub.plan.name,
-        'plan_price': sub.plan.price,
-        'start_date': sub.start_date.isoformat(),
-        'end_date': sub.end_date.isoformat() if sub.end_date else None,
-        'status': sub.status,
-        'payment_method': sub.payment_method
-    } for sub in subscriptions])
+    subscriptions = customer_subscriptions_query(customer_id).all()
+    
+    return jsonify(Subscription.serializers['customer'].many(subscriptions))
 
 @subscriptions_bp.route('', methods=['GET'])
 @jwt_required()
@@ -152,23 +188,36 @@ def get_all_subscriptions():
     per_page = request.args.get('per_page', 20, type=int)
     status = request.args.get('status')
     
-    query = Subscription.query
-    if status:
-        query = query.filter_by(status=status)
+    query = subscriptions_query(status)
+    
+    try:
+        serialize, options = Subscription.serializers['list'].select(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    query = query.options(*options)
+    
+    if wants_cursor(request.args):
+        try:
+            subscriptions = keyset_paginate(
+                query, [Subscription.id],
+                cursor=request.args.get('cursor'), per_page=per_page, descending=False,
+                include_total=request.args.get('include_total', 'false').lower() == 'true'
+            )
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        
+        return jsonify({
+            'subscriptions': serialize.many(subscriptions.items),
+            'next_cursor': subscriptions.next_cursor,
+            'total': subscriptions.total
+        })
     
     subscriptions = query.paginate(
         page=page, per_page=per_page, error_out=False
     )
     
     return jsonify({
-        'subscriptions': [{
-            'id': sub.id,
-            'customer_name': sub.customer.name,
-            'plan_name': sub.plan.name,
-            'status': sub.status,
-            'start_date': sub.start_date.isoformat(),
-            'end_date': sub.end_date.isoformat() if sub.end_date else None
-        } for sub in subscriptions.items],
+        'subscriptions': serialize.many(subscriptions.items),
         'total': subscriptions.total,
         'pages': subscriptions.pages,
         'current_page': page
@@ -1,16 +1,39 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import Ticket, Customer, User
+from flask import Blueprint, jsonify, request, current_app
+from flask_jwt_extended import jwt_required
+from models import Ticket, Customer, User, ticket_priority_rank
 from app import db
+from authz import current_principal
+from conditional import Validators
+from pagination import keyset_paginate, wants_cursor
+from search import index_entity
+from streaming import stream_query
+from ticket_queue import DEFAULT_MAX_BATCH, DEFAULT_MAX_LEASE_SECONDS, claim, queue_writes, renew, release
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
 from datetime import datetime
 
 tickets_bp = Blueprint('tickets', __name__, url_prefix='/api/tickets')
 
+def tickets_query(customer_id=None, technician_id=None, status=None, priority=None):
+    """Tickets listing, newest first: a customer's own, or a technician's plus unassigned, or all"""
+    query = Ticket.query
+    if customer_id is not None:
+        query = query.filter_by(customer_id=customer_id)
+    elif technician_id is not None:
+        query = query.filter(
+            (Ticket.assigned_to == technician_id) | (Ticket.assigned_to.is_(None))
+        )
+    if status:
+        query = query.filter_by(status=status)
+    if priority:
+        query = query.filter_by(priority=priority)
+    return query.order_by(Ticket.created_at.desc())
+
 @tickets_bp.route('', methods=['GET'])
 @jwt_required()
 def get_tickets():
     from flask_jwt_extended import get_jwt
-    current_user = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     role = claims.get('role')
     
@@ -19,39 +42,43 @@ def get_tickets():
     status = request.args.get('status')
     priority = request.args.get('priority')
     
-    query = Ticket.query
-    
     if role == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user)).first()
-        if not customer:
+        if principal.customer_id is None:
             return jsonify({'message': 'Customer profile not found'}), 404
-        query = query.filter_by(customer_id=customer.id)
+        query = tickets_query(customer_id=principal.customer_id, status=status, priority=priority)
     elif role == 'tech':
-        user_id = int(current_user)
-        query = query.filter(
-            (Ticket.assigned_to == user_id) | (Ticket.assigned_to.is_(None))
-        )
+        query = tickets_query(technician_id=principal.user_id, status=status, priority=priority)
+    else:
+        query = tickets_query(status=status, priority=priority)
     
-    if status:
-        query = query.filter_by(status=status)
-    if priority:
-        query = query.filter_by(priority=priority)
+    try:
+        serialize, options = Ticket.serializers['list'].select(request.args.get('fields'), extra=[Ticket.created_at])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    query = query.options(*options)
     
-    tickets = query.order_by(Ticket.created_at.desc()).paginate(
+    if wants_cursor(request.args):
+        try:
+            tickets = keyset_paginate(
+                query, [Ticket.created_at, Ticket.id],
+                cursor=request.args.get('cursor'), per_page=per_page,
+                include_total=request.args.get('include_total', 'false').lower() == 'true'
+            )
+        except ValueError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        
+        return jsonify({
+            'tickets': serialize.many(tickets.items),
+            'next_cursor': tickets.next_cursor,
+            'total': tickets.total
+        })
+    
+    tickets = query.paginate(
         page=page, per_page=per_page, error_out=False
     )
     
     return jsonify({
-        'tickets': [{
-            'id': ticket.id,
-            'title': ticket.title,
-            'description': ticket.description,
-            'status': ticket.status,
-            'priority': ticket.priority,
-            'created_at': ticket.created_at.isoformat(),
-            'customer_name': ticket.customer.name,
-            'assigned_to': ticket.assigned_user.username if ticket.assigned_user else None
-        } for ticket in tickets.items],
+        'tickets': serialize.many(tickets.items),
         'total': tickets.total,
         'pages': tickets.pages,
         'current_page': page
@@ -62,7 +89,7 @@ def get_tickets():
 def create_ticket():
     from flask_jwt_extended import get_jwt
     data = request.get_json()
-    current_user = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
 
     if not data or 'title' not in data or 'description' not in data:
@@ -70,10 +97,9 @@ def create_ticket():
 
     # Get customer ID based on role
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user)).first()
-        if not customer:
+        if principal.customer_id is None:
             return jsonify({'message': 'Customer profile not found'}), 404
-        customer_id = customer.id
+        customer_id = principal.customer_id
     else:
         # Admin/sales/tech can create tickets for any customer
         if 'customer_id' not in data:
@@ -88,6 +114,8 @@ def create_ticket():
             priority=data.get('priority', 'medium')
         )
         db.session.add(ticket)
+        db.session.flush()
+        index_entity('ticket', ticket)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -100,61 +128,171 @@ def create_ticket():
         'customer_name': ticket.customer.name
     }), 201
 
+def lease_seconds_arg(data):
+    """Requested lease length from a claim/renew body, or None for the default; raises ValueError"""
+    if data.get('lease_seconds') is None:
+        return None
+    lease_seconds = data['lease_seconds']
+    max_seconds = current_app.config.get('TICKET_LEASE_MAX_SECONDS', DEFAULT_MAX_LEASE_SECONDS)
+    if not isinstance(lease_seconds, int) or isinstance(lease_seconds, bool) or not 0 < lease_seconds <= max_seconds:
+        raise ValueError('lease_seconds must be an integer between 1 and %d' % max_seconds)
+    return lease_seconds
+
+def queue_busy():
+    """503 for a claim-queue write that gave up waiting on the database lock; the client retries shortly"""
+    db.session.rollback()
+    response = jsonify({'message': 'Ticket queue is busy, retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@tickets_bp.route('/claim', methods=['POST'])
+@jwt_required()
+def claim_tickets():
+    """Take the highest-priority, oldest queued tickets under a lease (tech role required)"""
+    from flask_jwt_extended import get_jwt
+    principal = current_principal()
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'tech']:
+        return jsonify({'message': 'Tech access required'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    count = data.get('count', 1)
+    max_batch = current_app.config.get('TICKET_CLAIM_MAX_BATCH', DEFAULT_MAX_BATCH)
+    if not isinstance(count, int) or isinstance(count, bool) or not 0 < count <= max_batch:
+        return jsonify({'message': 'count must be an integer between 1 and %d' % max_batch}), 400
+    try:
+        lease_seconds = lease_seconds_arg(data)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    try:
+        with queue_writes():
+            ids, expires = claim(principal.user_id, count, lease_seconds)
+            db.session.commit()
+    except OperationalError:
+        return queue_busy()
+    
+    order = {ticket_id: position for position, ticket_id in enumerate(ids)}
+    tickets = sorted(Ticket.query.filter(Ticket.id.in_(ids)).all(), key=lambda ticket: order[ticket.id]) if ids else []
+    
+    return jsonify({
+        'tickets': Ticket.serializers['claim'].many(tickets),
+        'lease_expires_at': expires.isoformat() if ids else None
+    })
+
+@tickets_bp.route('/<int:ticket_id>/lease', methods=['PUT'])
+@jwt_required()
+def renew_ticket_lease(ticket_id):
+    """Extend the caller's claim lease on a ticket"""
+    from flask_jwt_extended import get_jwt
+    principal = current_principal()
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'tech']:
+        return jsonify({'message': 'Tech access required'}), 403
+    
+    try:
+        lease_seconds = lease_seconds_arg(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    try:
+        with queue_writes():
+            expires = renew(ticket_id, principal.user_id, lease_seconds)
+            db.session.commit()
+    except OperationalError:
+        return queue_busy()
+    if expires is None:
+        return jsonify({'message': 'You do not hold a current lease on this ticket'}), 409
+    
+    return jsonify({'id': ticket_id, 'lease_expires_at': expires.isoformat()})
+
+@tickets_bp.route('/<int:ticket_id>/lease', methods=['DELETE'])
+@jwt_required()
+def release_ticket_lease(ticket_id):
+    """Give a claimed ticket back to the queue"""
+    from flask_jwt_extended import get_jwt
+    principal = current_principal()
+    claims = get_jwt()
+    if claims.get('role') not in ['admin', 'tech']:
+        return jsonify({'message': 'Tech access required'}), 403
+    
+    try:
+        with queue_writes():
+            released = release(ticket_id, principal.user_id)
+            db.session.commit()
+    except OperationalError:
+        return queue_busy()
+    if not released:
+        return jsonify({'message': 'You do not hold a lease on this ticket'}), 409
+    
+    return jsonify({'id': ticket_id, 'message': 'Ticket returned to the queue'})
+
 @tickets_bp.route('/<int:ticket_id>', methods=['GET'])
 @jwt_required()
 def get_ticket(ticket_id):
     from flask_jwt_extended import get_jwt
-    current_user = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
-    ticket = Ticket.query.get_or_404(ticket_id)
+    try:
+        serialize, options = Ticket.serializers['detail'].select(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Timestamps of the ticket and of the customer and assignee whose names it embeds
+    state = db.session.query(
+        Ticket.customer_id, Ticket.updated_at, Customer.updated_at.label('customer_updated_at'),
+        User.updated_at.label('assignee_updated_at')
+    ).join(Customer, Ticket.customer_id == Customer.id).outerjoin(
+        User, Ticket.assigned_to == User.id
+    ).filter(Ticket.id == ticket_id).first_or_404()
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user)).first()
-        if not customer or ticket.customer_id != customer.id:
+        if not principal.owns_customer(state.customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     
-    return jsonify({
-        'id': ticket.id,
-        'title': ticket.title,
-        'description': ticket.description,
-        'status': ticket.status,
-        'priority': ticket.priority,
-        'created_at': ticket.created_at.isoformat(),
-        'resolved_at': ticket.resolved_at.isoformat() if ticket.resolved_at else None,
-        'customer_name': ticket.customer.name,
-        'assigned_to': ticket.assigned_user.username if ticket.assigned_user else None
-    })
+    validators = Validators('ticket', ticket_id, state.updated_at, state.customer_updated_at, state.assignee_updated_at,
+                            fields=serialize.fields)
+    if validators.fresh():
+        return validators.not_modified()
+    
+    ticket = Ticket.query.options(*options).get_or_404(ticket_id)
+    
+    return validators.apply(jsonify(serialize(ticket)))
 
 @tickets_bp.route('/<int:ticket_id>', methods=['PUT'])
 @jwt_required()
 def update_ticket(ticket_id):
     from flask_jwt_extended import get_jwt
-    current_user = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     ticket = Ticket.query.get_or_404(ticket_id)
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user)).first()
-        if not customer or ticket.customer_id != customer.id:
+        if not principal.owns_customer(ticket.customer_id):
             return jsonify({"msg": "Unauthorized"}), 403
     elif claims.get('role') not in ['admin', 'tech', 'sales']:
         return jsonify({"msg": "Unauthorized"}), 403
     
     data = request.get_json()
     
+    # A status change or manual assignment ends any claim lease
     if 'status' in data and claims.get('role') in ['tech', 'admin']:
         ticket.status = data['status']
+        ticket.lease_expires_at = None
         if data['status'] == 'resolved':
             ticket.resolved_at = datetime.utcnow()
     
     if 'assigned_to' in data and claims.get('role') in ['tech', 'admin']:
         ticket.assigned_to = data['assigned_to']
+        ticket.lease_expires_at = None
     
     if 'priority' in data and claims.get('role') in ['tech', 'admin']:
         ticket.priority = data['priority']
+        ticket.priority_rank = ticket_priority_rank(data['priority'])
     
     ticket.updated_at = datetime.utcnow()
     db.session.commit()
@@ -171,31 +309,30 @@ def update_ticket(ticket_id):
 @jwt_required()
 def get_customer_tickets(customer_id):
     from flask_jwt_extended import get_jwt
-    current_user = get_jwt_identity()
+    principal = current_principal()
     claims = get_jwt()
     
     # Check permissions
     if claims.get('role') == 'customer':
-        customer = Customer.query.filter_by(user_id=int(current_user)).first()
-        if not customer or customer.id != customer_id:
+        if not principal.owns_customer(customer_id):
             return jsonify({'message': 'Unauthorized'}), 403
     elif claims.get('role') not in ['admin', 'tech', 'sales']:
         return jsonify({'message': 'Unauthorized'}), 403
     
     customer = Customer.query.get_or_404(customer_id)
-    tickets = Ticket.query.filter_by(customer_id=customer_id).order_by(
-        Ticket.created_at.desc()
-    ).all()
+    stmt = select(
+        Ticket.id,
+        Ticket.title,
+        Ticket.description,
+        Ticket.status,
+        Ticket.priority,
+        Ticket.created_at,
+        User.username.label('assigned_to')
+    ).outerjoin(User, Ticket.assigned_to == User.id).where(
+        Ticket.customer_id == customer_id
+    ).order_by(Ticket.created_at.desc())
     
-    return jsonify([{
-        'id': ticket.id,
-        'title': ticket.title,
-        'description': ticket.description,
-        'status': ticket.status,
-        'priority': ticket.priority,
-        'created_at': ticket.created_at.isoformat(),
-        'assigned_to': ticket.assigned_user.username if ticket.assigned_user else None
-    } for ticket in tickets])
+    return stream_query(stmt, ['id', 'title', 'description', 'status', 'priority', 'created_at', 'assigned_to'])
 
 @tickets_bp.route('/<int:ticket_id>/status', methods=['PATCH'])
 @jwt_required()
@@ -217,6 +354,7 @@ def update_ticket_status(ticket_id):
         return jsonify({'message': 'Invalid status'}), 400
     
     ticket.status = data['status']
+    ticket.lease_expires_at = None
     if data['status'] == 'resolved':
         ticket.resolved_at = datetime.utcnow()
     
@@ -1,34 +1,29 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import User
 from app import db
+from authz import current_principal
+from streaming import stream_query
+from sqlalchemy import select
+from datetime import datetime
 
 users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/api/users', methods=['GET'])
 @jwt_required()
 def get_users():
-    current_user = get_jwt_identity()
-    # current_user is now a string (user id), so fetch user from DB
-    user = User.query.get(int(current_user))
-    if not user or user.role != 'admin':
+    principal = current_principal()
+    if principal.role != 'admin':
         return jsonify({"msg": "Unauthorized"}), 403
     
-    users = User.query.all()
-    return jsonify([{
-        'id': user.id,
-        'username': user.username,
-        'role': user.role,
-        'email': user.email
-    } for user in users])
+    stmt = select(User.id, User.username, User.role, User.email).order_by(User.id)
+    return stream_query(stmt, ['id', 'username', 'role', 'email'])
 
 @users_bp.route('/api/users', methods=['POST'])
 @jwt_required()
 def create_user():
-    from flask_jwt_extended import get_jwt
-    current_user = get_jwt_identity()
-    user = User.query.get(int(current_user))
-    if not user or user.role != 'admin':
+    principal = current_principal()
+    if principal.role != 'admin':
         return jsonify({"msg": "Unauthorized"}), 403
     
     data = request.get_json()
@@ -63,10 +58,8 @@ def create_user():
 @users_bp.route('/api/users/<int:user_id>', methods=['GET'])
 @jwt_required()
 def get_user(user_id):
-    current_user = get_jwt_identity()
-    # current_user is a string (user id), fetch user from DB
-    user = User.query.get(int(current_user))
-    if not user or (user.role != 'admin' and user.id != user_id):
+    principal = current_principal()
+    if principal.role != 'admin' and principal.user_id != user_id:
         return jsonify({"msg": "Unauthorized"}), 403
     
     user = User.query.get_or_404(user_id)
@@ -80,9 +73,8 @@ def get_user(user_id):
 @users_bp.route('/api/users/<int:user_id>', methods=['PUT'])
 @jwt_required()
 def update_user(user_id):
-    current_user = get_jwt_identity()
-    user = User.query.get(int(current_user))
-    if not user or (user.role != 'admin' and user.id != user_id):
+    principal = current_principal()
+    if principal.role != 'admin' and principal.user_id != user_id:
         return jsonify({"msg": "Unauthorized"}), 403
     
     target_user = User.query.get_or_404(user_id)
@@ -113,7 +105,7 @@ def update_user(user_id):
     if 'password' in data:
         target_user.set_password(data['password'])
     
-    if 'role' in data and user.role == 'admin':
+    if 'role' in data and principal.role == 'admin':
         target_user.role = data['role']
     
     target_user.updated_at = datetime.utcnow()
@@ -130,15 +122,14 @@ def update_user(user_id):
 @users_bp.route('/api/users/<int:user_id>', methods=['DELETE'])
 @jwt_required()
 def delete_user(user_id):
-    current_user = get_jwt_identity()
-    user = User.query.get(int(current_user))
-    if not user or user.role != 'admin':
+    principal = current_principal()
+    if principal.role != 'admin':
         return jsonify({"msg": "Unauthorized"}), 403
     
     target_user = User.query.get_or_404(user_id)
     
     # Prevent admin from deleting themselves
-    if target_user.id == user.id:
+    if target_user.id == principal.user_id:
         return jsonify({'message': 'Cannot delete your own account'}), 400
     
     db.session.delete(target_user)
@@ -0,0 +1,207 @@
+import re
+from types import SimpleNamespace
+import click
+from flask.cli import AppGroup
+from app import db
+from models import Customer, Ticket, Equipment
+from sqlalchemy import or_
+
+search_cli = AppGroup('search', help='Maintain the full-text search index.')
+
+SEARCH_TABLE = 'search_index'
+ENTITY_TYPES = ['customer', 'ticket', 'equipment']
+TYPE_CODES = {'customer': 1, 'ticket': 2, 'equipment': 3}
+
+# rowid encodes (entity_type, entity_id) so refreshes are keyed lookups; title outranks body
+CREATE_SEARCH_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "entity_type UNINDEXED, entity_id UNINDEXED, title, body, "
+    "tokenize='unicode61', prefix='2 3')"
+)
+RANK = 'bm25(search_index, 0.0, 0.0, 10.0, 1.0)'
+INSERT_ROW = db.text(
+    'INSERT INTO search_index (rowid, entity_type, entity_id, title, body) '
+    'VALUES (:rowid, :entity_type, :entity_id, :title, :body)'
+)
+
+_backend = None
+
+
+def search_backend():
+    """'fts5' when the SQLite FTS5 index exists, otherwise 'like' (other databases or no FTS5 build)"""
+    global _backend
+    if _backend is None:
+        _backend = 'like'
+        if db.engine.dialect.name == 'sqlite':
+            found = db.session.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ), {'name': SEARCH_TABLE}).first()
+            if found:
+                _backend = 'fts5'
+    return _backend
+
+
+def _flatten(value):
+    """Searchable text from a scalar or a JSON address/info blob"""
+    if value is None:
+        return ''
+    if isinstance(value, dict):
+        return ' '.join(_flatten(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return ' '.join(_flatten(item) for item in value)
+    return str(value)
+
+
+def _document(entity_type, entity):
+    """(title, body) text indexed for an entity"""
+    if entity_type == 'customer':
+        return entity.name, ' '.join(filter(None, [
+            entity.email, entity.phone,
+            _flatten(entity.billing_address), _flatten(entity.service_address)
+        ]))
+    if entity_type == 'ticket':
+        return entity.title, entity.description or ''
+    return entity.serial_number, ' '.join(filter(None, [entity.model, entity.mac_address, entity.type]))
+
+
+def _index_row(entity_type, entity):
+    title, body = _document(entity_type, entity)
+    return {
+        'rowid': entity.id * 4 + TYPE_CODES[entity_type],
+        'entity_type': entity_type,
+        'entity_id': entity.id,
+        'title': title,
+        'body': body
+    }
+
+
+def index_entity(entity_type, entity):
+    """Insert or refresh one row of the search index inside the caller's transaction.
+
+    The entity must already have an id, so call this after db.session.flush() for new rows.
+    """
+    if search_backend() != 'fts5':
+        return
+
+    row = _index_row(entity_type, entity)
+    db.session.execute(db.text('DELETE FROM search_index WHERE rowid = :rowid'), row)
+    db.session.execute(INSERT_ROW, row)
+
+
+def index_rows(entity_type, rows):
+    """Bulk-insert index rows for newly created entities (dicts or objects with the indexed attributes)"""
+    if search_backend() != 'fts5' or not rows:
+        return
+
+    entities = [SimpleNamespace(**row) if isinstance(row, dict) else row for row in rows]
+    db.session.execute(INSERT_ROW, [_index_row(entity_type, entity) for entity in entities])
+
+
+def _match_expression(text):
+    """FTS5 MATCH expression: every word must match, each as a prefix; None if there are no words"""
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def matching_ids(entity_type, text):
+    """Subquery of ids of one entity type matching `text`, for use in .in_() filters (FTS5 only)"""
+    return db.text(
+        'SELECT entity_id FROM search_index WHERE search_index MATCH :match AND entity_type = :entity_type'
+    ).bindparams(match=_match_expression(text) or '""', entity_type=entity_type).columns(entity_id=db.Integer)
+
+
+def _fts_search(text, types, limit, offset):
+    match = _match_expression(text)
+    if match is None:
+        return []
+
+    params = {'match': match, 'limit': limit, 'offset': offset}
+    type_params = {'type_%d' % i: entity_type for i, entity_type in enumerate(types)}
+    params.update(type_params)
+
+    rows = db.session.execute(db.text(
+        'SELECT entity_type, entity_id, title, '
+        "snippet(search_index, 3, '[', ']', '...', 12) AS snippet, " + RANK + ' AS score '
+        'FROM search_index WHERE search_index MATCH :match '
+        'AND entity_type IN (' + ', '.join(':' + name for name in type_params) + ') '
+        'ORDER BY score LIMIT :limit OFFSET :offset'
+    ), params)
+
+    return [{
+        'type': entity_type,
+        'id': int(entity_id),
+        'title': title,
+        'snippet': snippet,
+        'score': round(-score, 4)
+    } for entity_type, entity_id, title, snippet, score in rows]
+
+
+def _like_search(text, types, limit, offset):
+    """Substring search for backends without FTS5; newest rows first, one entity type after another"""
+    pattern = '%' + text + '%'
+    searchable = {
+        'customer': (Customer, [Customer.name, Customer.email, Customer.phone]),
+        'ticket': (Ticket, [Ticket.title, Ticket.description]),
+        'equipment': (Equipment, [Equipment.serial_number, Equipment.model, Equipment.mac_address]),
+    }
+
+    results = []
+    for entity_type in types:
+        model, columns = searchable[entity_type]
+        rows = model.query.filter(
+            or_(*[column.ilike(pattern) for column in columns])
+        ).order_by(model.id.desc()).limit(offset + limit).all()
+        for row in rows:
+            title, body = _document(entity_type, row)
+            results.append({'type': entity_type, 'id': row.id, 'title': title, 'snippet': body[:80], 'score': None})
+    return results[offset:offset + limit]
+
+
+def search(text, types=None, page=1, per_page=20):
+    """Ranked matches across customers, tickets and equipment; returns (results, has_more)"""
+    types = [t for t in (types or ENTITY_TYPES) if t in ENTITY_TYPES]
+    if not text.strip() or not types:
+        return [], False
+
+    offset = (page - 1) * per_page
+    runner = _fts_search if search_backend() == 'fts5' else _like_search
+    results = runner(text, types, per_page + 1, offset)
+    return results[:per_page], len(results) > per_page
+
+
+def rebuild_search_index(chunk_size=1000):
+    """Recreate the FTS5 index from the base tables"""
+    global _backend
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('The full-text index requires SQLite with FTS5')
+
+    db.session.execute(db.text('DROP TABLE IF EXISTS search_index'))
+    db.session.execute(db.text(CREATE_SEARCH_TABLE))
+    _backend = 'fts5'
+
+    counts = {}
+    for entity_type, model in (('customer', Customer), ('ticket', Ticket), ('equipment', Equipment)):
+        counts[entity_type] = 0
+        batch = []
+        for entity in model.query.order_by(model.id).yield_per(chunk_size):
+            batch.append(_index_row(entity_type, entity))
+            if len(batch) == chunk_size:
+                db.session.execute(INSERT_ROW, batch)
+                counts[entity_type] += len(batch)
+                batch = []
+        if batch:
+            db.session.execute(INSERT_ROW, batch)
+            counts[entity_type] += len(batch)
+
+    db.session.execute(db.text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    db.session.commit()
+    return counts
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the full-text search index from customers, tickets and equipment."""
+    counts = rebuild_search_index()
+    click.echo('Indexed ' + ', '.join('%d %s rows' % (count, name) for name, count in counts.items()))
@@ -1,6 +1,8 @@
 # seed.py
 from app import app, db
 from models import User, Customer, ServicePlan, Subscription, NetworkNode
+from rollups import rebuild_rollups
+from search import rebuild_search_index
 from datetime import datetime, timedelta
 
 def seed():
@@ -133,6 +135,10 @@ def seed():
             
             db.session.add_all(nodes)
             db.session.commit()
+            
+            # Backfill the analytics rollups from the seeded rows
+            rebuild_rollups()
+            rebuild_search_index()
 
             print("Database seeded successfully!")
             print("Users created:")
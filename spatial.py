@@ -0,0 +1,379 @@
+"""In-memory spatial index over network node coordinates.
+
+NetworkNode.location is JSON with `lat`/`lng` in degrees. Each process keeps a uniform lat/lng grid
+of SPATIAL_CELL_DEGREES cells mapping every node with valid coordinates to its cell:
+- `nearest` scans rings of cells outward from the query point until no unscanned cell can hold a
+  node closer than the k-th best found (great-circle distances, wrapping at the antimeridian).
+- `within` reads only the cells overlapping a bounding box.
+
+The index is built on first use. Route writes apply their node straight away with `index_node`.
+Changes made by other processes are picked up by re-reading nodes whose updated_at moved, at most
+every SPATIAL_SYNC_SECONDS. Lookups themselves never touch the database.
+"""
+import heapq
+import math
+import random
+import tempfile
+import threading
+import time
+import click
+from datetime import timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+from app import db
+from models import NetworkNode
+from engine_profile import scratch_database
+
+spatial_cli = AppGroup('spatial', help='Network node spatial index.')
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_CELL_DEGREES = 0.1
+# Rows committed out of updated_at order within this window are still picked up by the next sync
+SYNC_OVERLAP = timedelta(seconds=10)
+
+_index = {'grid': None, 'synced_through': None, 'checked_at': 0.0}
+_sync_lock = threading.Lock()
+
+
+def coordinates(location):
+    """(lat, lng) from a location or address JSON object, or None when absent or out of range"""
+    if not isinstance(location, dict):
+        return None
+    lat, lng = location.get('lat'), location.get('lng')
+    if isinstance(lat, bool) or isinstance(lng, bool) or not isinstance(lat, (int, float)) \
+            or not isinstance(lng, (int, float)):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return float(lat), float(lng)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _Level:
+    """One grid resolution: points bucketed into cells of `cell` degrees"""
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.rows = math.ceil(180 / cell)
+        self.columns = math.ceil(360 / cell)
+        self.cells = {}  # (row, column) -> [(id, lat, lng, active, lat radians, lng radians, cos lat), ...]
+
+    def key(self, lat, lng):
+        return min(int((lat + 90) / self.cell), self.rows - 1), min(int((lng + 180) / self.cell), self.columns - 1)
+
+    def add(self, key, point):
+        self.cells.setdefault(key, []).append(point)
+
+    def discard(self, key, point_id):
+        remaining = [point for point in self.cells.get(key, ()) if point[0] != point_id]
+        if remaining:
+            self.cells[key] = remaining
+        else:
+            self.cells.pop(key, None)
+
+    def ring(self, row, column, radius):
+        """Cell keys at Chebyshev distance `radius` from (row, column), columns wrapping around"""
+        if radius == 0:
+            yield row, column
+            return
+        wraps = 2 * radius + 1 >= self.columns
+        full = range(self.columns) if wraps else range(column - radius, column + radius + 1)
+        sides = () if wraps else ((column - radius) % self.columns, (column + radius) % self.columns)
+        for ring_row in range(max(row - radius, 0), min(row + radius, self.rows - 1) + 1):
+            if abs(ring_row - row) == radius:
+                for ring_column in full:
+                    yield ring_row, ring_column % self.columns
+            else:
+                for ring_column in sides:
+                    yield ring_row, ring_column
+
+    def bound(self, lat, radius):
+        """Lower bound on the distance to any point outside the first `radius` rings around a point at `lat`"""
+        span = math.radians(radius * self.cell)
+        by_lat = EARTH_RADIUS_KM * span
+        if 2 * radius + 1 >= self.columns:
+            return by_lat
+        farthest = min(90.0, abs(lat) + (radius + 1) * self.cell)
+        scale = math.sqrt(math.cos(math.radians(lat)) * math.cos(math.radians(farthest)))
+        by_lng = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, scale * math.sin(min(span, math.pi) / 2)))
+        return min(by_lat, by_lng)
+
+    def holds(self, lat, lng, k, max_radius):
+        """True if the first `max_radius` rings around (lat, lng) hold at least `k` points"""
+        row, column = self.key(lat, lng)
+        cells = self.cells
+        count = 0
+        for radius in range(max_radius + 1):
+            for key in self.ring(row, column, radius):
+                count += len(cells.get(key, ()))
+            if count >= k:
+                return True
+        return False
+
+    def cell_bound(self, key, phi, lam):
+        """Distance from (phi, lam), in radians, to the nearest point of cell `key`"""
+        row, column = key
+        low, high = math.radians(row * self.cell - 90), math.radians(min((row + 1) * self.cell - 90, 90))
+        half = math.radians(self.cell) / 2
+        center = math.radians((column + 0.5) * self.cell - 180)
+        offset = (lam - center + math.pi) % (2 * math.pi) - math.pi
+        gap = abs(offset) - half
+        if gap <= 0 or gap >= math.pi / 2:
+            # Same longitudes (exact), or far enough round that the latitude gap is the bound used
+            return EARTH_RADIUS_KM * max(low - phi, phi - high, 0.0)
+        # Nearest point of the nearer edge meridian, clamped to the cell's latitudes
+        foot = min(max(math.atan2(math.sin(phi), math.cos(phi) * math.cos(gap)), low), high)
+        a = math.sin((foot - phi) / 2) ** 2 + math.cos(phi) * math.cos(foot) * math.sin(gap / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+    def nearest(self, lat, lng, k, max_km, active_only, max_radius=None):
+        """Up to `k` (distance_km, id) pairs closest to (lat, lng), nearest first.
+
+        Scans rings of cells outward; None if that isn't settled within `max_radius` rings. With no
+        limit, cells are instead visited in order of their exact distance bound, which stays tight
+        near the poles where ring bounds do not.
+        """
+        row, column = self.key(lat, lng)
+        cells = self.cells
+        phi, lam = math.radians(lat), math.radians(lng)
+        best = []  # max-heap of (-distance, id)
+
+        def scan(points):
+            cos_phi = math.cos(phi)
+            sin, asin, sqrt = math.sin, math.asin, math.sqrt
+            for point_id, _, _, active, point_phi, point_lam, point_cos in points:
+                if active_only and not active:
+                    continue
+                # Haversine, with the point's radians and cosine precomputed
+                a = sin((point_phi - phi) / 2) ** 2 + cos_phi * point_cos * sin((point_lam - lam) / 2) ** 2
+                distance = 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+                if max_km is not None and distance > max_km:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, point_id))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, point_id))
+
+        def settled(bound):
+            return (len(best) == k and -best[0][0] <= bound) or (max_km is not None and bound > max_km)
+
+        if max_radius is None:
+            for bound, key in sorted((self.cell_bound(key, phi, lam), key) for key in list(cells)):
+                if settled(bound):
+                    break
+                scan(cells.get(key, ()))
+            return sorted((-distance, point_id) for distance, point_id in best)
+
+        radius = 0
+        while True:
+            for key in self.ring(row, column, radius):
+                scan(cells.get(key, ()))
+            if settled(self.bound(lat, radius)) or radius >= self.rows + self.columns:
+                return sorted((-distance, point_id) for distance, point_id in best)
+            if radius >= max_radius:
+                return None
+            radius += 1
+
+
+class GridIndex:
+    """Points bucketed into lat/lng grids of LEVELS resolutions, each CELL_FACTOR times coarser.
+
+    Writers (serialized by `lock`) append to a cell's list or replace it, never remove from it in
+    place, so readers need no lock.
+    """
+
+    LEVELS = 4
+    CELL_FACTOR = 4
+    MAX_RINGS = 4  # a level is searched if this many rings around the query hold k points
+    RING_LIMIT = 16  # rings searched at a level before the search moves to a coarser one (near the poles)
+
+    def __init__(self, cell_degrees=DEFAULT_CELL_DEGREES):
+        self.cell = cell_degrees
+        self.levels = [_Level(cell_degrees * self.CELL_FACTOR ** number) for number in range(self.LEVELS)]
+        self.points = {}  # id -> (lat, lng, active)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.points)
+
+    def upsert(self, point_id, lat, lng, active):
+        with self.lock:
+            current = self.points.get(point_id)
+            if current == (lat, lng, active):
+                return
+            phi = math.radians(lat)
+            point = (point_id, lat, lng, active, phi, math.radians(lng), math.cos(phi))
+            for level in self.levels:
+                if current is not None:
+                    level.discard(level.key(current[0], current[1]), point_id)
+                level.add(level.key(lat, lng), point)
+            self.points[point_id] = (lat, lng, active)
+
+    def remove(self, point_id):
+        with self.lock:
+            current = self.points.pop(point_id, None)
+            if current is not None:
+                for level in self.levels:
+                    level.discard(level.key(current[0], current[1]), point_id)
+
+    def nearest(self, lat, lng, k, max_km=None, active_only=True):
+        """Up to `k` (distance_km, id) pairs closest to (lat, lng), nearest first.
+
+        The search runs at the finest level with k points near the query, so it scans few cells
+        in sparse areas and few points in dense ones.
+        """
+        if k <= 0:
+            return []
+        for level in self.levels[:-1]:
+            if level.holds(lat, lng, k, self.MAX_RINGS):
+                found = level.nearest(lat, lng, k, max_km, active_only, self.RING_LIMIT)
+                if found is not None:
+                    return found
+        return self.levels[-1].nearest(lat, lng, k, max_km, active_only)
+
+    def within(self, south, west, north, east, active_only=False):
+        """Ids of points inside the box; west > east means the box crosses the antimeridian"""
+        # The finest level that covers the box in a few hundred cells
+        for level in self.levels:
+            low_row, low_column = level.key(south, west)
+            high_row, high_column = level.key(north, east)
+            if west > east:
+                column_keys = sorted(set(range(low_column, level.columns)) | set(range(0, high_column + 1)))
+            else:
+                column_keys = range(low_column, high_column + 1)
+            if (high_row - low_row + 1) * len(column_keys) <= 256:
+                break
+
+        cells = level.cells
+        if (high_row - low_row + 1) * len(column_keys) > len(cells):
+            wanted = set(column_keys)
+            keys = [key for key in list(cells) if low_row <= key[0] <= high_row and key[1] in wanted]
+        else:
+            keys = [(cell_row, cell_column) for cell_row in range(low_row, high_row + 1) for cell_column in column_keys]
+
+        found = []
+        for key in keys:
+            for point_id, lat, lng, active, _, _, _ in cells.get(key, ()):
+                if active_only and not active:
+                    continue
+                inside = west <= lng <= east if west <= east else (lng >= west or lng <= east)
+                if inside and south <= lat <= north:
+                    found.append(point_id)
+        return found
+
+
+def _apply(grid, rows):
+    for node_id, location, status in rows:
+        point = coordinates(location)
+        if point is None:
+            grid.remove(node_id)
+        else:
+            grid.upsert(node_id, point[0], point[1], status == 'active')
+
+
+def node_index():
+    """This process's index of node coordinates, built on first use and kept in sync with the table"""
+    config = current_app.config
+    now = time.monotonic()
+    if _index['grid'] is not None and now - _index['checked_at'] < config.get('SPATIAL_SYNC_SECONDS', 1):
+        return _index['grid']
+
+    with _sync_lock:
+        if _index['grid'] is None or now - _index['checked_at'] >= config.get('SPATIAL_SYNC_SECONDS', 1):
+            table = NetworkNode.__table__
+            query = select(table.c.id, table.c.location, table.c.status)
+            grid = _index['grid']
+            if grid is None:
+                grid = GridIndex(config.get('SPATIAL_CELL_DEGREES', DEFAULT_CELL_DEGREES))
+            elif _index['synced_through'] is not None:
+                query = query.where(table.c.updated_at >= _index['synced_through'] - SYNC_OVERLAP)
+            synced_through = db.session.execute(select(func.max(table.c.updated_at))).scalar()
+            _apply(grid, db.session.execute(query).all())
+            db.session.rollback()
+            _index['synced_through'] = synced_through
+            _index['grid'] = grid
+            _index['checked_at'] = now
+    return _index['grid']
+
+
+def index_node(node):
+    """Apply a committed create or update to this process's index straight away"""
+    if _index['grid'] is not None:
+        _apply(_index['grid'], [(node.id, node.location, node.status)])
+
+
+def reset_index():
+    _index.update(grid=None, synced_through=None, checked_at=0.0)
+
+
+@spatial_cli.command('benchmark')
+@click.option('--nodes', default=50000, show_default=True)
+@click.option('--queries', default=10000, show_default=True)
+@click.option('--k', default=5, show_default=True)
+def benchmark_command(nodes, queries, k):
+    """Time nearest-node and bounding-box lookups over synthetic nodes in a scratch SQLite database."""
+    generator = random.Random(0)
+    # Clustered like a real footprint: most nodes around a few metro areas, the rest spread out
+    metros = [(generator.uniform(25, 50), generator.uniform(-125, -70)) for _ in range(20)]
+
+    def place():
+        if generator.random() < 0.9:
+            lat, lng = generator.choice(metros)
+            return max(-90.0, min(90.0, generator.gauss(lat, 0.5))), max(-180.0, min(180.0, generator.gauss(lng, 0.5)))
+        return generator.uniform(-60, 70), generator.uniform(-180, 180)
+
+    with tempfile.TemporaryDirectory() as directory, scratch_database(directory):
+        reset_index()
+        points = [place() for _ in range(nodes)]
+        db.session.execute(NetworkNode.__table__.insert(), [{
+            'name': 'Node %d' % number, 'location': {'lat': lat, 'lng': lng},
+            'status': 'active' if number % 10 else 'maintenance', 'capacity': 1000, 'current_load': 0
+        } for number, (lat, lng) in enumerate(points)])
+        db.session.commit()
+
+        started = time.perf_counter()
+        grid = node_index()
+        click.echo('Indexed %d nodes in %.2fs (%d cells of %s degrees)' % (
+            len(grid), time.perf_counter() - started, len(grid.levels[0].cells), grid.cell))
+
+        origins = [place() for _ in range(queries)]
+        results = []
+        timings = []
+        for lat, lng in origins:
+            started = time.perf_counter()
+            results.append(grid.nearest(lat, lng, k))
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        click.echo('%d nearest-%d queries: mean %.1f us, p99 %.1f us, max %.1f us' % (
+            queries, k, sum(timings) / queries * 1e6, timings[int(queries * 0.99)] * 1e6, timings[-1] * 1e6))
+
+        # Check a sample against a brute-force scan
+        active = [(number + 1, lat, lng) for number, (lat, lng) in enumerate(points) if number % 10]
+        mismatches = 0
+        for (lat, lng), result in list(zip(origins, results))[:200]:
+            expected = heapq.nsmallest(k, ((distance_km(lat, lng, point_lat, point_lng), point_id)
+                                           for point_id, point_lat, point_lng in active))
+            mismatches += [point_id for _, point_id in expected] != [point_id for _, point_id in result]
+        click.echo('Brute-force check of 200 queries: %d mismatches' % mismatches)
+
+        boxes = [(lat - 0.1, lng - 0.15, lat + 0.1, lng + 0.15) for lat, lng in origins[:1000]]
+        started = time.perf_counter()
+        found = sum(len(grid.within(*box)) for box in boxes)
+        elapsed = time.perf_counter() - started
+        click.echo('1000 bounding-box queries (0.2 x 0.3 degrees): %.1f us each, %.0f nodes per box' % (
+            elapsed / 1000 * 1e6, found / 1000))
+
+        started = time.perf_counter()
+        for point_id in range(1, 1001):
+            lat, lng = place()
+            grid.upsert(point_id, lat, lng, True)
+        click.echo('1000 node moves: %.1f us each' % ((time.perf_counter() - started) / 1000 * 1e6))
+        reset_index()
@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+from datetime import datetime, date
+from flask import Response, stream_with_context
+from app import db
+from serialization import dumps
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def iter_mappings(stmt, chunk_size=1000):
+    """Rows of a Core select as mappings, fetched from the server `chunk_size` at a time"""
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    for row in result:
+        yield row._mapping
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _record(mapping, columns):
+    # Dates are encoded natively by serialization.dumps
+    return {column: mapping[column] for column in columns}
+
+
+def _csv_cell(value):
+    value = _jsonable(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def csv_chunks(mappings, columns, rows_per_chunk=500):
+    """CSV text in chunks of rows, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    for mapping in mappings:
+        writer.writerow([_csv_cell(mapping[column]) for column in columns])
+        count += 1
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(mappings, columns, rows_per_chunk=500):
+    """One JSON object per line, batched into chunks"""
+    lines = []
+    for mapping in mappings:
+        lines.append(dumps(_record(mapping, columns)))
+        if len(lines) == rows_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def json_array_chunks(mappings, columns, rows_per_chunk=500):
+    """A JSON array written element by element, so the whole list is never held in memory"""
+    yield '['
+    first = True
+    parts = []
+    for mapping in mappings:
+        parts.append(('' if first else ',') + dumps(_record(mapping, columns)))
+        first = False
+        if len(parts) == rows_per_chunk:
+            yield ''.join(parts)
+            parts = []
+    yield ''.join(parts) + ']'
+
+
+def stream_response(mappings, columns, fmt='json', filename=None):
+    """Response streaming `mappings` (an iterator of row mappings) as csv, ndjson or a json array"""
+    encoders = {'csv': csv_chunks, 'ndjson': ndjson_chunks, 'json': json_array_chunks}
+    response = Response(
+        stream_with_context(encoders[fmt](mappings, columns)),
+        mimetype=FORMATS[fmt]
+    )
+    if filename:
+        response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (filename, fmt)
+    return response
+
+
+def stream_query(stmt, columns, fmt='json', filename=None, chunk_size=1000):
+    """Stream a Core select with server-side chunked iteration"""
+    return stream_response(iter_mappings(stmt, chunk_size), columns, fmt, filename)
@@ -0,0 +1,231 @@
+"""Subscription expiry and renewal.
+
+`run_lifecycle()` handles every active subscription whose end_date has passed. auto_renew
+subscriptions move forward one renewal period at a time until the end date is in the future. All
+others become 'inactive'. The work is done in chunks of set-based UPDATEs over the due rows. Each
+chunk commits on its own, together with its SubscriptionTransition rows, the active-subscription
+rollup adjustment and the node capacity its expired subscriptions give back.
+
+A chunk is the head of the (status, end_date) index, and handled rows leave it, so nothing is
+scanned twice. The chunk's transitions are recorded with INSERT ... SELECT and applied with one
+UPDATE over the same condition, with the chunk's rows locked (the database write lock on SQLite).
+If the two row counts differ, a concurrent writer got in between and the chunk is retried. Because
+the condition re-checks status = 'active' AND end_date <= now, a crashed run can simply be run
+again, and concurrent runs never transition the same row twice.
+"""
+import tempfile
+import time
+import uuid
+import click
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DateTime, and_, case, func, literal, or_, select, true
+from app import db
+from models import Subscription, SubscriptionTransition, ServicePlan, Customer
+from aggregations import add_days
+from capacity import release, status_changed
+from engine_profile import scratch_database
+from rollups import adjust_active_subscriptions, rebuild_rollups, record_subscription_status, verify_rollups
+
+lifecycle_cli = AppGroup('subscriptions', help='Subscription expiry and renewal.')
+
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_RENEWAL_DAYS = 30
+MAX_CONFLICTS = 10
+
+
+class ChunkConflict(Exception):
+    """Rows of a chunk changed between recording and applying its transitions"""
+
+
+def set_status(subscription, new_status, now=None):
+    """Move a subscription from the status it was read with to `new_status`, in the current transaction.
+
+    The UPDATE is conditional on that status, so of concurrent transitions from it exactly one applies,
+    and only that one adjusts the active-subscription rollup and the node's capacity. Returns False if
+    the status changed since it was read; raises CapacityError if re-activation finds the node full.
+    """
+    table = Subscription.__table__
+    old_status = subscription.status
+    applied = db.session.execute(
+        table.update().where(table.c.id == subscription.id, table.c.status == old_status).values(
+            status=new_status, updated_at=now or datetime.utcnow()
+        )
+    ).rowcount
+    if not applied:
+        return False
+    status_changed(subscription.node_id, old_status, new_status)
+    record_subscription_status(subscription.plan_id, old_status, new_status)
+    return True
+
+
+def _next_chunk(due, chunk_size):
+    """Condition for the first `chunk_size` due subscriptions in (end_date, id) order, or None if none are due"""
+    table = Subscription.__table__
+    boundary = db.session.execute(
+        select(table.c.end_date, table.c.id).where(due).order_by(table.c.end_date, table.c.id)
+        .offset(chunk_size - 1).limit(1)
+    ).first()
+    if boundary is not None:
+        # The boundary row is due, so its end date replaces `now` as the index range's upper bound
+        return and_(table.c.status == 'active', table.c.end_date <= boundary.end_date, or_(
+            table.c.end_date < boundary.end_date,
+            and_(table.c.end_date == boundary.end_date, table.c.id <= boundary.id)
+        ))
+    return due if db.session.execute(select(table.c.id).where(due).limit(1)).first() else None
+
+
+def _process_chunk(run_id, now, chunk, renewal_days):
+    """Record, apply and roll up one chunk's transitions in the current transaction; returns (renewed, expired)"""
+    table = Subscription.__table__
+    renews = table.c.auto_renew == true()
+    renewed_end_date = add_days(table.c.end_date, renewal_days)
+
+    if db.session.get_bind().dialect.name != 'sqlite':
+        # Lock the chunk; on SQLite the INSERT below already holds the database write lock
+        db.session.execute(select(table.c.id).where(chunk).with_for_update()).all()
+
+    recorded = db.session.execute(SubscriptionTransition.__table__.insert().from_select(
+        ['subscription_id', 'run_id', 'action', 'from_status', 'to_status', 'end_date', 'created_at'],
+        select(
+            table.c.id,
+            literal(run_id),
+            case((renews, 'renewed'), else_='expired'),
+            table.c.status,
+            case((renews, 'active'), else_='inactive'),
+            case((renews, renewed_end_date), else_=table.c.end_date),
+            literal(now, DateTime)
+        ).where(chunk)
+    )).rowcount
+    expired_by_plan = db.session.execute(
+        select(table.c.plan_id, func.count()).where(chunk, ~renews).group_by(table.c.plan_id)
+    ).all()
+    expired_by_node = db.session.execute(
+        select(table.c.node_id, func.count()).where(chunk, ~renews, table.c.node_id.isnot(None))
+        .group_by(table.c.node_id)
+    ).all()
+
+    # Separate statements so each only rewrites the indexes on the column it changes
+    renewed = db.session.execute(
+        table.update().where(chunk, renews).values(end_date=renewed_end_date, updated_at=now)
+    ).rowcount
+    expired = db.session.execute(
+        table.update().where(chunk, ~renews).values(status='inactive', updated_at=now)
+    ).rowcount
+    if renewed + expired != recorded or expired != sum(count for _, count in expired_by_plan):
+        raise ChunkConflict('recorded %d transitions but applied %d' % (recorded, renewed + expired))
+
+    for plan_id, count in expired_by_plan:
+        adjust_active_subscriptions(plan_id, -count)
+    release(dict(expired_by_node))
+    return renewed, expired
+
+
+def run_lifecycle(now=None, chunk_size=None, renewal_days=None):
+    """Expire or renew every subscription that has reached its end date; returns (run id, renewed, expired)"""
+    config = current_app.config
+    now = now or datetime.utcnow()
+    chunk_size = chunk_size or config.get('SUBSCRIPTION_LIFECYCLE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    renewal_days = renewal_days or config.get('SUBSCRIPTION_RENEWAL_DAYS', DEFAULT_RENEWAL_DAYS)
+    run_id = str(uuid.uuid4())
+    table = Subscription.__table__
+    due = and_(table.c.status == 'active', table.c.end_date <= now)
+
+    renewed = expired = 0
+    conflicts = 0
+    while True:
+        # Handled rows leave the due set (renewals still in the past come back in a later chunk)
+        chunk = _next_chunk(due, chunk_size)
+        db.session.rollback()
+        if chunk is None:
+            break
+        try:
+            chunk_renewed, chunk_expired = _process_chunk(run_id, now, chunk, renewal_days)
+            db.session.commit()
+        except ChunkConflict:
+            db.session.rollback()
+            conflicts += 1
+            if conflicts > MAX_CONFLICTS:
+                raise
+            continue
+        except Exception:
+            db.session.rollback()
+            raise
+        renewed += chunk_renewed
+        expired += chunk_expired
+    return run_id, renewed, expired
+
+
+@lifecycle_cli.command('lifecycle')
+@click.option('--chunk-size', default=None, type=int, help='Subscriptions per transaction.')
+@click.option('--interval', type=float, default=0, help='Repeat every N seconds (0 = run once).')
+def lifecycle_command(chunk_size, interval):
+    """Expire or renew subscriptions past their end date (schedule this, or run with --interval)."""
+    while True:
+        started = time.perf_counter()
+        run_id, renewed, expired = run_lifecycle(chunk_size=chunk_size)
+        click.echo('Run %s: renewed %d, expired %d in %.2fs' % (run_id, renewed, expired, time.perf_counter() - started))
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+def seed_subscriptions(rows, plans=10, customers=1000):
+    """Insert `rows` active subscriptions: a quarter renewing, a quarter expiring, half not yet due"""
+    now = datetime.utcnow()
+    db.session.execute(ServicePlan.__table__.insert(), [{
+        'name': 'Plan %d' % number, 'speed': '100 Mbps', 'price': 10.0 + number, 'is_active': True,
+        'created_at': now, 'updated_at': now
+    } for number in range(plans)])
+    db.session.execute(Customer.__table__.insert(), [{
+        'name': 'Customer %d' % number, 'email': 'bench%d@example.com' % number, 'created_at': now, 'updated_at': now
+    } for number in range(customers)])
+
+    batch = []
+    for number in range(rows):
+        due = number % 2 == 0
+        batch.append({
+            'customer_id': number % customers + 1,
+            'plan_id': number % plans + 1,
+            'start_date': now - timedelta(days=60),
+            'end_date': now - timedelta(days=1 + number % 20) if due else now + timedelta(days=1 + number % 20),
+            'status': 'active',
+            'payment_method': 'cash',
+            'auto_renew': due and number % 4 == 0,
+            'created_at': now,
+            'updated_at': now
+        })
+        if len(batch) == 50000:
+            db.session.execute(Subscription.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Subscription.__table__.insert(), batch)
+    db.session.commit()
+
+
+@lifecycle_cli.command('benchmark')
+@click.option('--rows', default=1000000, show_default=True)
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+def benchmark_command(rows, chunk_size):
+    """Run the lifecycle engine over `rows` synthetic subscriptions in a scratch SQLite database."""
+    with tempfile.TemporaryDirectory() as directory, scratch_database(directory):
+        started = time.perf_counter()
+        seed_subscriptions(rows)
+        rebuild_rollups()
+        click.echo('Seeded %d subscriptions in %.1fs' % (rows, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        run_id, renewed, expired = run_lifecycle(chunk_size=chunk_size)
+        elapsed = time.perf_counter() - started
+        click.echo('First run:  renewed %d, expired %d of %d in %.2fs (%.0f subscriptions/s)' % (
+            renewed, expired, rows, elapsed, rows / elapsed))
+
+        started = time.perf_counter()
+        _, renewed, expired = run_lifecycle(chunk_size=chunk_size)
+        click.echo('Re-run:     renewed %d, expired %d in %.2fs' % (renewed, expired, time.perf_counter() - started))
+
+        transitions = db.session.query(func.count(SubscriptionTransition.id)).scalar()
+        mismatches = verify_rollups()
+        click.echo('Transitions recorded: %d; rollups %s' % (
+            transitions, 'consistent' if not mismatches else '%d mismatches' % len(mismatches)))
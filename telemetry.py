@@ -0,0 +1,359 @@
+"""Network node load telemetry.
+
+Pollers post batches of (node_id, timestamp, load) samples. Each batch is written in one transaction:
+- Raw samples are bulk-inserted into node_load_sample, keyed by (node_id, sampled_at), so a
+  re-sent batch inserts nothing twice.
+- The newly inserted samples are folded into the 1-minute and 1-hour node_load_rollup buckets (count,
+  sum, min, max) with one upsert per bucket.
+- Each node with new samples has its rollup_version incremented, whatever the samples' age.
+- NetworkNode.current_load is moved to each node's newest sample, unless a newer one is already
+  stored.
+
+Retention (TELEMETRY_RETENTION_*) is enforced by `prune_telemetry`. Ingestion queues it on the job
+runner at most every TELEMETRY_PRUNE_SECONDS per process; `flask telemetry prune` runs it directly.
+
+History queries read raw samples for short ranges and the rollups for longer ones.
+"""
+import tempfile
+import threading
+import time
+import click
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func, or_, select
+from app import db
+from models import NetworkNode, NodeLoadSample, NodeLoadRollup
+from engine_profile import scratch_database
+from jobs import enqueue, job_handler
+
+telemetry_cli = AppGroup('telemetry', help='Network node telemetry.')
+
+# Rollup resolutions in seconds, with the function that truncates a timestamp to its bucket
+RESOLUTIONS = {
+    60: lambda moment: moment.replace(second=0, microsecond=0),
+    3600: lambda moment: moment.replace(minute=0, second=0, microsecond=0),
+}
+RESOLUTION_NAMES = {'raw': None, '1m': 60, '1h': 3600}
+MAX_POINTS = 10000
+DEFAULT_RETENTION = {'raw': 48, '1m': 24 * 30, '1h': 24 * 730}  # hours
+
+_prune = {'queued_at': 0.0}
+_prune_lock = threading.Lock()
+
+
+class SampleError(ValueError):
+    """A telemetry sample failed validation"""
+
+
+def parse_timestamp(value):
+    """Naive UTC datetime from epoch seconds or an ISO 8601 string"""
+    if isinstance(value, bool):
+        raise SampleError('timestamp must be epoch seconds or ISO 8601')
+    if isinstance(value, str) and value.replace('.', '', 1).isdigit():
+        value = float(value)  # epoch seconds from a query string
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+        except (OverflowError, ValueError, OSError):
+            raise SampleError('timestamp is out of range')
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise SampleError('timestamp must be epoch seconds or ISO 8601')
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _parse_sample(item, nodes):
+    if not isinstance(item, dict):
+        raise SampleError('sample must be an object')
+    missing = [field for field in ('node_id', 'timestamp', 'load') if item.get(field) is None]
+    if missing:
+        raise SampleError('missing required fields: %s' % ', '.join(missing))
+    try:
+        node_id = int(item['node_id'])
+        load = int(item['load'])
+    except (TypeError, ValueError, OverflowError):
+        raise SampleError('node_id and load must be integers')
+    if node_id not in nodes:
+        raise SampleError('network node %s not found' % node_id)
+    if load < 0:
+        raise SampleError('load must not be negative')
+    return {'node_id': node_id, 'sampled_at': parse_timestamp(item['timestamp']), 'load': load}
+
+
+def _insert_samples(samples):
+    """Insert raw samples, skipping (node_id, sampled_at) pairs already stored; returns the ones inserted"""
+    table = NodeLoadSample.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        result = db.session.execute(
+            insert(table).on_conflict_do_nothing().returning(table.c.node_id, table.c.sampled_at, table.c.load),
+            samples
+        )
+        return [row._asdict() for row in result]
+
+    unique = {(sample['node_id'], sample['sampled_at']): sample for sample in samples}
+    existing = set(db.session.execute(
+        select(table.c.node_id, table.c.sampled_at).where(
+            table.c.node_id.in_({node_id for node_id, _ in unique}),
+            table.c.sampled_at.between(min(at for _, at in unique), max(at for _, at in unique))
+        )
+    ).tuples())
+    samples = [sample for key, sample in unique.items() if key not in existing]
+    if samples:
+        db.session.execute(table.insert(), samples)
+    return samples
+
+
+def _upsert_rollups(buckets):
+    """Fold per-bucket (count, sum, min, max) into node_load_rollup with one upsert per bucket"""
+    table = NodeLoadRollup.__table__
+    rows = [{
+        'node_id': node_id, 'resolution': resolution, 'bucket_start': bucket_start,
+        'sample_count': count, 'load_sum': total, 'load_min': low, 'load_max': high
+    } for (node_id, resolution, bucket_start), (count, total, low, high) in buckets.items()]
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            least, greatest = func.min, func.max  # two-argument min()/max() are scalar in SQLite
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+            least, greatest = func.least, func.greatest
+        stmt = insert(table)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['node_id', 'resolution', 'bucket_start'],
+            set_={
+                'sample_count': table.c.sample_count + stmt.excluded.sample_count,
+                'load_sum': table.c.load_sum + stmt.excluded.load_sum,
+                'load_min': least(table.c.load_min, stmt.excluded.load_min),
+                'load_max': greatest(table.c.load_max, stmt.excluded.load_max),
+            }
+        ), rows)
+        return
+
+    for row in rows:
+        key = [table.c.node_id == row['node_id'], table.c.resolution == row['resolution'],
+               table.c.bucket_start == row['bucket_start']]
+        current = db.session.execute(select(table).where(*key).with_for_update()).first()
+        if current is None:
+            db.session.execute(table.insert().values(**row))
+        else:
+            db.session.execute(table.update().where(*key).values(
+                sample_count=current.sample_count + row['sample_count'],
+                load_sum=current.load_sum + row['load_sum'],
+                load_min=min(current.load_min, row['load_min']),
+                load_max=max(current.load_max, row['load_max'])
+            ))
+
+
+def _bump_rollup_versions(node_ids):
+    """Count a rollup write against each node, so readers of the rollups (the forecast cache) see late samples too"""
+    if not node_ids:
+        return
+    table = NetworkNode.__table__
+    # updated_at is left alone: it only moves with current_load
+    db.session.execute(
+        table.update().where(table.c.id == bindparam('b_node_id')).values(
+            rollup_version=table.c.rollup_version + 1, updated_at=table.c.updated_at
+        ),
+        [{'b_node_id': node_id} for node_id in sorted(node_ids)]
+    )
+
+
+def _update_current_load(samples):
+    """Move each node's current_load to its newest sample unless a newer one is already recorded"""
+    latest = {}
+    for sample in samples:
+        if sample['node_id'] not in latest or sample['sampled_at'] > latest[sample['node_id']]['sampled_at']:
+            latest[sample['node_id']] = sample
+    if not latest:
+        return
+
+    table = NetworkNode.__table__
+    now = datetime.utcnow()
+    db.session.execute(
+        table.update().where(
+            table.c.id == bindparam('b_node_id'),
+            or_(table.c.load_sampled_at.is_(None), table.c.load_sampled_at < bindparam('b_sampled_at'))
+        ).values(current_load=bindparam('b_load'), load_sampled_at=bindparam('b_sampled_at'), updated_at=now),
+        [{'b_node_id': node_id, 'b_sampled_at': sample['sampled_at'], 'b_load': sample['load']}
+         for node_id, sample in latest.items()]
+    )
+
+
+def ingest_samples(items):
+    """Validate and store a batch of samples in one transaction.
+
+    Returns (accepted, duplicates, errors), where errors lists {'index', 'error'} for rejected items.
+    """
+    node_ids = set()
+    for item in items:
+        try:
+            node_ids.add(int(item['node_id']))
+        except (TypeError, ValueError, OverflowError, KeyError):
+            pass
+    nodes = set(db.session.execute(
+        select(NetworkNode.id).where(NetworkNode.id.in_(node_ids))
+    ).scalars()) if node_ids else set()
+
+    samples = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            samples.append(_parse_sample(item, nodes))
+        except SampleError as e:
+            errors.append({'index': index, 'error': str(e)})
+    if not samples:
+        return 0, 0, errors
+
+    inserted = _insert_samples(samples)
+    buckets = {}
+    for sample in inserted:
+        for resolution, truncate in RESOLUTIONS.items():
+            key = (sample['node_id'], resolution, truncate(sample['sampled_at']))
+            count, total, low, high = buckets.get(key, (0, 0, sample['load'], sample['load']))
+            buckets[key] = (count + 1, total + sample['load'], min(low, sample['load']), max(high, sample['load']))
+    _upsert_rollups(buckets)
+    _bump_rollup_versions({sample['node_id'] for sample in inserted})
+    _update_current_load(inserted)
+    _queue_prune()
+    db.session.commit()
+    return len(inserted), len(samples) - len(inserted), errors
+
+
+def _queue_prune():
+    """Queue a retention job in the current transaction if this process hasn't queued one recently"""
+    interval = current_app.config.get('TELEMETRY_PRUNE_SECONDS', 300)
+    now = time.monotonic()
+    with _prune_lock:
+        if now - _prune['queued_at'] < interval:
+            return
+        _prune['queued_at'] = now
+    enqueue('telemetry_prune')
+
+
+def retention_cutoffs(now=None):
+    """Oldest timestamp kept for raw samples and for each rollup resolution"""
+    config = current_app.config
+    now = now or datetime.utcnow()
+    hours = {
+        'raw': config.get('TELEMETRY_RETENTION_RAW_HOURS', DEFAULT_RETENTION['raw']),
+        '1m': config.get('TELEMETRY_RETENTION_1M_HOURS', DEFAULT_RETENTION['1m']),
+        '1h': config.get('TELEMETRY_RETENTION_1H_HOURS', DEFAULT_RETENTION['1h']),
+    }
+    return {name: now - timedelta(hours=value) for name, value in hours.items()}
+
+
+def prune_telemetry(now=None):
+    """Delete samples and rollup buckets past their retention; returns rows deleted per series"""
+    cutoffs = retention_cutoffs(now)
+    samples = NodeLoadSample.__table__
+    rollups = NodeLoadRollup.__table__
+    deleted = {'raw': db.session.execute(samples.delete().where(samples.c.sampled_at < cutoffs['raw'])).rowcount}
+    for name in ('1m', '1h'):
+        deleted[name] = db.session.execute(rollups.delete().where(
+            rollups.c.resolution == RESOLUTION_NAMES[name], rollups.c.bucket_start < cutoffs[name]
+        )).rowcount
+    db.session.commit()
+    return deleted
+
+
+@job_handler('telemetry_prune')
+def prune_job(payload):
+    return prune_telemetry()
+
+
+def pick_resolution(start, end):
+    """Finest resolution that keeps a node's history for [start, end) within MAX_POINTS (10 s polling)"""
+    seconds = (end - start).total_seconds()
+    if seconds / 10 <= MAX_POINTS and start >= retention_cutoffs()['raw']:
+        return 'raw'
+    if seconds / 60 <= MAX_POINTS and start >= retention_cutoffs()['1m']:
+        return '1m'
+    return '1h'
+
+
+def load_history(node_id, start, end, resolution):
+    """Load points for one node in [start, end): raw samples or rollup buckets"""
+    if resolution == 'raw':
+        rows = db.session.execute(
+            select(NodeLoadSample.sampled_at, NodeLoadSample.load).where(
+                NodeLoadSample.node_id == node_id,
+                NodeLoadSample.sampled_at >= start, NodeLoadSample.sampled_at < end
+            ).order_by(NodeLoadSample.sampled_at).limit(MAX_POINTS + 1)
+        ).all()
+        points = [{'t': sampled_at, 'load': load} for sampled_at, load in rows]
+    else:
+        rows = db.session.execute(
+            select(
+                NodeLoadRollup.bucket_start, NodeLoadRollup.sample_count, NodeLoadRollup.load_sum,
+                NodeLoadRollup.load_min, NodeLoadRollup.load_max
+            ).where(
+                NodeLoadRollup.node_id == node_id, NodeLoadRollup.resolution == RESOLUTION_NAMES[resolution],
+                NodeLoadRollup.bucket_start >= RESOLUTIONS[RESOLUTION_NAMES[resolution]](start),
+                NodeLoadRollup.bucket_start < end
+            ).order_by(NodeLoadRollup.bucket_start).limit(MAX_POINTS + 1)
+        ).all()
+        points = [{
+            't': bucket_start, 'avg': round(total / count, 2) if count else None,
+            'min': low, 'max': high, 'count': count
+        } for bucket_start, count, total, low, high in rows]
+    if len(points) > MAX_POINTS:
+        raise ValueError('Range has more than %d points at %s resolution' % (MAX_POINTS, resolution))
+    return points
+
+
+@telemetry_cli.command('prune')
+def prune_command():
+    """Delete telemetry past its retention period."""
+    deleted = prune_telemetry()
+    click.echo('Deleted %d raw samples, %d 1-minute and %d 1-hour buckets' % (deleted['raw'], deleted['1m'], deleted['1h']))
+
+
+@telemetry_cli.command('benchmark')
+@click.option('--nodes', default=2000, show_default=True)
+@click.option('--rounds', default=30, show_default=True, help='Polling rounds (10 s apart) to ingest.')
+@click.option('--batch', default=5000, show_default=True, help='Samples per ingest call.')
+def benchmark_command(nodes, rounds, batch):
+    """Ingest polling rounds for `nodes` nodes into a scratch SQLite database and time a history query."""
+    with tempfile.TemporaryDirectory() as directory, scratch_database(directory):
+        db.session.execute(NetworkNode.__table__.insert(), [{
+            'name': 'Node %d' % number, 'location': {}, 'status': 'active', 'capacity': 1000, 'current_load': 0
+        } for number in range(nodes)])
+        db.session.commit()
+
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(seconds=10 * rounds)
+        items = [
+            {'node_id': node_id, 'timestamp': (start + timedelta(seconds=10 * number)).isoformat(),
+             'load': (node_id * 7 + number * 13) % 1000}
+            for number in range(rounds) for node_id in range(1, nodes + 1)
+        ]
+        started = time.perf_counter()
+        accepted = 0
+        for offset in range(0, len(items), batch):
+            accepted += ingest_samples(items[offset:offset + batch])[0]
+        elapsed = time.perf_counter() - started
+        click.echo('Ingested %d samples in %.2fs (%.0f samples/s, %d-sample batches)' % (
+            accepted, elapsed, accepted / elapsed, batch))
+
+        started = time.perf_counter()
+        duplicates = ingest_samples(items[:batch])[1]
+        click.echo('Re-sent batch: %d duplicates skipped in %.3fs' % (duplicates, time.perf_counter() - started))
+
+        buckets = db.session.query(func.count()).select_from(NodeLoadRollup).scalar()
+        started = time.perf_counter()
+        for resolution in ('raw', '1m', '1h'):
+            load_history(1, start, start + timedelta(seconds=10 * rounds), resolution)
+        click.echo('Rollup buckets: %d; history queries (raw, 1m, 1h) for one node in %.2f ms' % (
+            buckets, (time.perf_counter() - started) * 1000))
@@ -0,0 +1,67 @@
+"""Test fixtures: the app on a throwaway SQLite database, seeded once per session."""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+import pytest
+from flask import g, request_started
+from sqlalchemy import event
+
+# The app reads DATABASE_URL when it is imported, so point it at a scratch file first
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_directory.name, 'test.db')
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from app import app as flask_app, db  # noqa: E402
+import seed  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    seed.seed()
+    with flask_app.app_context():
+        yield flask_app
+        db.session.remove()
+
+
+def _reset_request_state(sender, **extra):
+    # Test requests reuse the session's app context, so drop what a real request would start without
+    for name in ('principal', '_db_replica'):
+        g.pop(name, None)
+
+
+@pytest.fixture
+def client(app):
+    request_started.connect(_reset_request_state, app)
+    yield app.test_client()
+    request_started.disconnect(_reset_request_state, app)
+
+
+@pytest.fixture
+def auth_headers(app):
+    """Authorization headers for a token with `role` (and user id `user_id`)"""
+    def headers(role='admin', user_id=1):
+        token = create_access_token(identity=str(user_id), additional_claims={'role': role})
+        return {'Authorization': 'Bearer ' + token}
+    return headers
+
+
+@pytest.fixture
+def count_queries(app):
+    """Context manager collecting the SQL statements run inside it (token revocation syncs left out)"""
+    @contextmanager
+    def counting():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'revoked_token' not in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return counting
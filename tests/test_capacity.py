@@ -0,0 +1,95 @@
+import queue
+import threading
+from datetime import datetime
+from app import db
+from capacity import release, reserve, verify_capacity
+from models import Customer, NetworkNode, ServicePlan, Subscription
+from telemetry import ingest_samples
+
+
+def test_measured_load_does_not_touch_reservations(app, client, auth_headers):
+    node = NetworkNode(name='Measured node', location={'lat': 2.0, 'lng': 2.0}, status='active', capacity=2,
+                       current_load=0)
+    db.session.add(node)
+    db.session.commit()
+
+    assert reserve(node.id) and reserve(node.id)
+    assert not reserve(node.id)
+    db.session.commit()
+
+    accepted, _, _ = ingest_samples([{'node_id': node.id, 'timestamp': datetime.utcnow().isoformat(), 'load': 0}])
+    assert accepted == 1
+    response = client.put('/api/network-nodes/%d' % node.id, json={'current_load': 0}, headers=auth_headers('admin'))
+    assert response.status_code == 200
+    response = client.put('/api/network-nodes/%d' % node.id, json={'reserved_load': 0}, headers=auth_headers('admin'))
+    assert response.status_code == 400
+
+    db.session.expire_all()
+    assert db.session.get(NetworkNode, node.id).reserved_load == 2
+    assert not reserve(node.id)
+    db.session.rollback()
+    release({node.id: 2})  # the units were taken without subscriptions
+    db.session.commit()
+
+
+def test_verify_reports_drift(app):
+    node = NetworkNode(name='Drift node', location={'lat': 3.0, 'lng': 3.0}, status='active', capacity=5,
+                       current_load=0)
+    db.session.add(node)
+    db.session.commit()
+    assert not [problem for problem in verify_capacity() if problem['node_id'] == node.id]
+
+    reserve(node.id)  # a unit no subscription holds
+    db.session.commit()
+    assert [problem for problem in verify_capacity() if problem['node_id'] == node.id] == [
+        {'node_id': node.id, 'reserved_load': 1, 'capacity': 5, 'assigned': 0}]
+    release({node.id: 1})
+    db.session.commit()
+
+
+SIGNUPS = 300
+SIGNUP_THREADS = 50
+NODE_CAPACITY = 100
+
+
+def test_concurrent_signups_fill_a_node_exactly(app, auth_headers):
+    plan = ServicePlan(name='Race plan', speed='100 Mbps', price=10.0)
+    node = NetworkNode(name='Race node', location={'lat': 4.0, 'lng': 4.0}, status='active',
+                       capacity=NODE_CAPACITY, current_load=0)
+    customers = [Customer(name='Racer %d' % number, email='racer%d@example.com' % number) for number in range(SIGNUPS)]
+    db.session.add_all([plan, node] + customers)
+    db.session.commit()
+    plan_id, node_id = plan.id, node.id
+    pending = queue.Queue()
+    for customer in customers:
+        pending.put(customer.id)
+    headers = auth_headers('sales', 2)
+    statuses = []
+    lock = threading.Lock()
+
+    def signup():
+        with app.app_context():
+            client = app.test_client()
+            while True:
+                try:
+                    customer_id = pending.get_nowait()
+                except queue.Empty:
+                    break
+                response = client.post('/api/subscriptions', headers=headers, json={
+                    'customer_id': customer_id, 'plan_id': plan_id, 'node_id': node_id})
+                with lock:
+                    statuses.append(response.status_code)
+            db.session.remove()
+
+    threads = [threading.Thread(target=signup) for _ in range(SIGNUP_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses.count(201) == NODE_CAPACITY
+    assert statuses.count(409) == SIGNUPS - NODE_CAPACITY
+    db.session.expire_all()
+    assert db.session.get(NetworkNode, node_id).reserved_load == NODE_CAPACITY
+    assert Subscription.query.filter_by(node_id=node_id, status='active').count() == NODE_CAPACITY
+    assert verify_capacity() == []
@@ -0,0 +1,27 @@
+import json
+from flask import g
+from sqlalchemy import create_engine
+from app import db
+from catalog import get_catalog, invalidate_catalog
+from models import ServicePlan
+
+
+def test_catalog_is_rebuilt_from_the_primary(app):
+    # An empty replica that has not caught up with any of the primary's plans
+    replica = create_engine('sqlite://')
+    db.metadata.create_all(replica)
+    plans = ServicePlan.query.filter_by(is_active=True).count()
+    assert plans
+
+    with app.test_request_context('/api/plans'):
+        g._db_replica = replica
+        try:
+            assert db.session.get_bind(clause=db.select(ServicePlan)) is replica
+            invalidate_catalog()
+            entry = get_catalog(True)
+            assert g._db_replica is replica
+        finally:
+            g.pop('_db_replica')  # g belongs to the session-wide app context
+            invalidate_catalog()
+
+    assert len(json.loads(entry.body)) == plans
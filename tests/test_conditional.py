@@ -0,0 +1,29 @@
+import pytest
+from app import db
+from models import Customer, Ticket
+
+
+@pytest.fixture
+def ticket_id(app):
+    ticket = Ticket(customer_id=Customer.query.first().id, title='Conditional', description='-', status='open',
+                    priority='low')
+    db.session.add(ticket)
+    db.session.commit()
+    return ticket.id
+
+
+@pytest.mark.parametrize('path', ['/api/customers/%d', '/api/tickets/%d', '/api/subscriptions/%d', '/api/plans/%d',
+                                  '/api/network-nodes/%d'])
+def test_each_field_selection_has_its_own_etag(app, client, auth_headers, ticket_id, path):
+    path %= ticket_id if path.startswith('/api/tickets') else 1
+    headers = auth_headers('admin')
+    first = client.get(path + '?fields=id', headers=headers)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    assert client.get(path + '?fields=id', headers=dict(headers, **{'If-None-Match': etag})).status_code == 304
+    other = client.get(path, headers=dict(headers, **{'If-None-Match': etag}))
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+    # The same selection spelled differently is the same representation
+    respelled = client.get(path + '?fields=id,%20id', headers=dict(headers, **{'If-None-Match': etag}))
+    assert respelled.status_code == 304
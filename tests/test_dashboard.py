@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from app import db
+from models import Customer, NetworkNode, Payment, ServicePlan, Subscription, Ticket
+from rollups import record_payment, record_subscription_status
+
+# Customers/revenue, rollup revenue, plan popularity, monthly revenue, ticket statuses, network nodes
+STATS_QUERIES = {'admin': 6, 'sales': 5}
+
+
+def add_customers(count):
+    plan = ServicePlan(name='Dashboard plan', speed='100 Mbps', price=20.0)
+    db.session.add(plan)
+    db.session.flush()
+    for number in range(count):
+        customer = Customer(name='Dashboard %d' % number, email='dashboard%d@example.com' % number)
+        db.session.add(customer)
+        db.session.flush()
+        subscription = Subscription(customer_id=customer.id, plan_id=plan.id, status='active', payment_method='cash')
+        db.session.add(subscription)
+        db.session.flush()
+        record_subscription_status(plan.id, None, 'active')
+        for months_ago in range(3):
+            payment = Payment(subscription_id=subscription.id, amount=20.0, payment_method='cash', status='completed',
+                              payment_date=datetime.utcnow() - timedelta(days=30 * months_ago))
+            db.session.add(payment)
+            record_payment(payment, plan.id)
+        db.session.add(Ticket(customer_id=customer.id, title='Issue', description='-',
+                              status=['open', 'in_progress', 'resolved', 'closed'][number % 4]))
+        db.session.add(NetworkNode(name='Dashboard node %d' % number, location={}, capacity=100, current_load=number))
+    db.session.commit()
+
+
+def stats_queries(client, count_queries, headers):
+    with count_queries() as statements:
+        response = client.get('/api/dashboard/stats', headers=headers)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_stats_query_count_does_not_grow_with_data(app, client, auth_headers, count_queries):
+    for role, expected in STATS_QUERIES.items():
+        assert stats_queries(client, count_queries, auth_headers(role)) == expected
+
+    add_customers(40)
+    for role, expected in STATS_QUERIES.items():
+        assert stats_queries(client, count_queries, auth_headers(role)) == expected
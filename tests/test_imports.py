@@ -0,0 +1,43 @@
+import io
+import json
+from app import db
+from imports import run_import
+from models import ImportJob
+
+
+def _import(entity_type, records):
+    job = ImportJob(entity_type=entity_type)
+    db.session.add(job)
+    db.session.commit()
+    body = '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in records).encode()
+    return run_import(job.id, io.BytesIO(body), 'ndjson')
+
+
+def test_wrongly_typed_fields_are_row_errors(app):
+    job = _import('customers', [
+        {'name': 'Typed', 'email': 123},
+        {'name': ['Typed'], 'email': 'typed-list@example.com'},
+        {'name': 'Typed', 'email': 'typed-phone@example.com', 'phone': {'home': '1'}},
+        {'name': 'Typed', 'email': 'typed-ok@example.com'},
+    ])
+    assert job.status == 'completed'
+    assert job.inserted_rows == 1
+    assert [error['row'] for error in job.errors] == [1, 2, 3]
+
+    job = _import('equipment', [
+        {'customer_id': 1, 'type': 'router', 'model': 'X', 'serial_number': 42},
+        {'customer_id': True, 'type': 'router', 'model': 'X', 'serial_number': 'TYPED-1'},
+        '{"customer_id": Infinity, "type": "router", "model": "X", "serial_number": "TYPED-2"}',
+        {'customer_id': 1, 'type': 'router', 'model': 'X', 'serial_number': 'TYPED-3', 'status': 1},
+    ])
+    assert job.status == 'completed'
+    assert job.inserted_rows == 0
+    assert [error['row'] for error in job.errors] == [1, 2, 3, 4]
+
+    job = _import('subscriptions', [
+        {'customer_id': 1, 'plan_id': 1, 'status': ['active']},
+        {'customer_id': 1, 'plan_id': 1.5, 'status': 'inactive'},
+        {'customer_id': 1, 'plan_id': 1, 'status': 'inactive', 'payment_method': 5},
+    ])
+    assert job.status == 'completed'
+    assert [error['row'] for error in job.errors] == [1, 2, 3]
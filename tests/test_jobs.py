@@ -0,0 +1,43 @@
+from app import db
+from jobs import claim_next, enqueue, job_handler, run_job
+from models import Job
+from sqlalchemy import update
+
+
+@job_handler('test-echo')
+def echo_job(payload):
+    return payload
+
+
+@job_handler('test-lock-lost')
+def lock_lost_job(payload):
+    # What release_stale does once the lock times out; another worker may now claim the job
+    db.session.execute(update(Job).where(Job.id == payload['job_id']).values(
+        status='queued', locked_by=None, locked_at=None))
+    db.session.commit()
+    if payload.get('fail'):
+        raise RuntimeError('boom')
+    return {'done': True}
+
+
+def test_claimed_job_records_its_result(app):
+    db.session.execute(update(Job).where(Job.status == 'queued').values(status='failed'))
+    enqueue('test-echo', {'value': 1})
+    db.session.commit()
+    job = run_job(claim_next('test-worker'))
+    assert job.status == 'succeeded' and job.result == {'value': 1} and job.locked_by is None
+
+
+def test_outcome_is_dropped_once_the_lock_is_lost(app):
+    for fail in (False, True):
+        db.session.execute(update(Job).where(Job.status == 'queued').values(status='failed'))
+        db.session.commit()
+        job = enqueue('test-lock-lost', {'fail': fail})
+        db.session.flush()
+        job.payload = {'fail': fail, 'job_id': job.id}
+        db.session.commit()
+        job_id = job.id
+
+        assert run_job(claim_next('test-worker')) is None
+        job = db.session.get(Job, job_id)
+        assert job.status == 'queued' and job.result is None and job.error is None
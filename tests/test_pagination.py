@@ -0,0 +1,33 @@
+import base64
+import json
+import pytest
+from datetime import datetime
+from app import db
+from models import Customer, Ticket
+from pagination import MAX_PER_PAGE, decode_cursor, keyset_paginate
+
+
+def _cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('values', [[123, 1], [['2024-01-01'], 1], ['2024-01-01T00:00:00', {'id': 1}], ['not a date', 1]])
+def test_malformed_cursor_values_are_rejected(app, values):
+    with pytest.raises(ValueError):
+        decode_cursor(_cursor(values), [Ticket.created_at, Ticket.id])
+
+
+def test_malformed_cursor_is_a_bad_request(app, client, auth_headers):
+    response = client.get('/api/tickets?cursor=%s' % _cursor([123, 1]), headers=auth_headers('admin'))
+    assert response.status_code == 400
+
+
+def test_per_page_is_clamped(app):
+    now = datetime.utcnow()
+    db.session.execute(Customer.__table__.insert(), [{
+        'name': 'Page %d' % number, 'email': 'page%d@example.com' % number, 'created_at': now, 'updated_at': now
+    } for number in range(MAX_PER_PAGE + 10)])
+    db.session.commit()
+
+    assert len(keyset_paginate(Customer.query, [Customer.id], per_page=10000).items) == MAX_PER_PAGE
+    assert len(keyset_paginate(Customer.query, [Customer.id], per_page=-5).items) == 1
@@ -0,0 +1,53 @@
+import time
+import pytest
+import models
+from werkzeug.security import generate_password_hash
+from passwords import PasswordPoolBusy, PasswordPoolTimeout, _HashingPool, needs_rehash
+
+
+@pytest.mark.parametrize('configured, stored, expected', [
+    ('scrypt', 'scrypt:32768:8:1', False),
+    ('scrypt:32768:8:1', 'scrypt', False),
+    ('scrypt:65536:8:1', 'scrypt:32768:8:1', True),
+    ('pbkdf2', 'pbkdf2:sha256', False),
+    ('pbkdf2:sha256:600000', 'pbkdf2:sha256', True),
+    ('scrypt', 'pbkdf2:sha256:600000', True),
+])
+def test_needs_rehash_compares_effective_parameters(app, configured, stored, expected):
+    app.config['PASSWORD_HASH_METHOD'] = configured
+    try:
+        password_hash = generate_password_hash('secret', stored)
+        assert needs_rehash(password_hash) is expected
+    finally:
+        app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'
+
+
+def test_pool_timeout_is_busy():
+    pool = _HashingPool(1, 0, 'thread')
+    with pytest.raises(PasswordPoolTimeout):
+        pool.run(time.sleep, 0.5, timeout=0.01)
+    # The slot stays taken until the timed-out hash actually finishes
+    with pytest.raises(PasswordPoolBusy):
+        pool.run(time.sleep, 0)
+    time.sleep(0.6)
+    assert pool.run(len, 'ok') == 2
+
+
+def test_pool_timeout_on_login_is_a_503(app, client, monkeypatch):
+    def slow_verify(password_hash, password):
+        return _HashingPool(1, 0, 'thread').run(time.sleep, 0.2, timeout=0.01)
+
+    monkeypatch.setattr(models, 'verify_password', slow_verify)
+    response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_full_pool_on_login_is_a_429(app, client, monkeypatch):
+    pool = _HashingPool(1, 0, 'thread')
+    pool.slots.acquire()  # the only slot is taken by another request's hash
+
+    monkeypatch.setattr(models, 'verify_password', lambda password_hash, password: pool.run(len, password))
+    response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,23 @@
+from models import Subscription
+
+
+def test_invalid_items_are_rejected_per_item(app, client, auth_headers):
+    subscription_id = Subscription.query.first().id
+    body = '[%s]' % ', '.join([
+        '{"subscription_id": %d, "amount": NaN, "payment_method": "cash"}' % subscription_id,
+        '{"subscription_id": %d, "amount": Infinity, "payment_method": "cash"}' % subscription_id,
+        '{"subscription_id": %d, "amount": "-inf", "payment_method": "cash"}' % subscription_id,
+        '{"subscription_id": %d, "amount": 10, "payment_method": {"card": 1}}' % subscription_id,
+        '{"subscription_id": %d, "amount": 10, "payment_method": "bitcoin"}' % subscription_id,
+        '{"subscription_id": %d, "amount": 10, "payment_method": "cash", "transaction_id": [1]}' % subscription_id,
+        '{"subscription_id": Infinity, "amount": 10, "payment_method": "cash"}',
+        '{"subscription_id": %d.5, "amount": 10, "payment_method": "cash"}' % subscription_id,
+        '{"subscription_id": true, "amount": 10, "payment_method": "cash"}',
+        '{"subscription_id": "%d.5", "amount": 10, "payment_method": "cash"}' % subscription_id,
+        '{"subscription_id": %d, "amount": 10, "payment_method": "cash"}' % subscription_id,
+    ])
+    response = client.post('/api/payments/batch?mode=partial', data=body, content_type='application/json',
+                           headers=auth_headers('sales'))
+    assert response.status_code == 201
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['error'] * 10 + ['created']
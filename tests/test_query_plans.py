@@ -0,0 +1,10 @@
+from query_plans import check_query_plans, full_scans
+
+
+def test_route_queries_use_an_index(app):
+    assert check_query_plans() == {}
+
+
+def test_full_scans_flags_table_scans_only():
+    plan = ['SCAN payment', 'SCAN ticket USING INDEX ix_ticket_created_at', 'SEARCH customer USING INDEX ix_customer_user_id (user_id=?)']
+    assert full_scans(plan) == ['SCAN payment']
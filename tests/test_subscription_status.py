@@ -0,0 +1,82 @@
+import threading
+from sqlalchemy.exc import OperationalError
+from app import db
+from models import Customer, NetworkNode, ServicePlan, Subscription
+from rollups import verify_rollups
+from subscription_lifecycle import set_status
+
+RACERS = 8
+
+
+def race(app, subscription_id, new_status):
+    """Apply `new_status` from RACERS threads that all read the subscription before any writes; returns outcomes"""
+    ready = threading.Barrier(RACERS)
+    outcomes = []
+    lock = threading.Lock()
+
+    def racer():
+        with app.app_context():
+            subscription = db.session.get(Subscription, subscription_id)
+            subscription.status  # read before anyone writes; kept, since the session is not expired
+            ready.wait()
+            while True:
+                try:
+                    applied = set_status(subscription, new_status)
+                    db.session.commit()
+                    break
+                except OperationalError:
+                    db.session.rollback()
+            with lock:
+                outcomes.append(applied)
+            db.session.remove()
+
+    threads = [threading.Thread(target=racer) for _ in range(RACERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_concurrent_transitions_apply_once(app):
+    node = NetworkNode(name='Race node', location={'lat': 1.0, 'lng': 1.0}, status='active', capacity=10,
+                       current_load=0)
+    plan = ServicePlan(name='Race plan', speed='100 Mbps', price=10.0)
+    customer = Customer(name='Race customer', email='race@example.com')
+    db.session.add_all([node, plan, customer])
+    db.session.flush()
+    subscription = Subscription(customer_id=customer.id, plan_id=plan.id, node_id=node.id, status='inactive',
+                                payment_method='cash')
+    db.session.add(subscription)
+    db.session.commit()
+
+    def load():
+        db.session.expire_all()
+        return db.session.get(NetworkNode, node.id).reserved_load
+
+    assert sorted(race(app, subscription.id, 'active')) == [False] * (RACERS - 1) + [True]
+    assert load() == 1
+
+    assert sorted(race(app, subscription.id, 'cancelled')) == [False] * (RACERS - 1) + [True]
+    assert load() == 0
+    assert db.session.get(Subscription, subscription.id).status == 'cancelled'
+    assert verify_rollups() == []
+
+
+def test_stale_status_change_is_a_conflict(app, client, auth_headers):
+    plan = ServicePlan(name='Conflict plan', speed='100 Mbps', price=10.0)
+    customer = Customer(name='Conflict customer', email='conflict@example.com')
+    db.session.add_all([plan, customer])
+    db.session.flush()
+    subscription = Subscription(customer_id=customer.id, plan_id=plan.id, status='active', payment_method='cash')
+    db.session.add(subscription)
+    db.session.commit()
+
+    stale = db.session.get(Subscription, subscription.id)
+    assert stale.status == 'active'
+    db.session.expunge(stale)  # the client's requests share this session; keep the copy read before them
+    response = client.put('/api/subscriptions/%d/status' % subscription.id, json={'status': 'suspended'},
+                          headers=auth_headers('admin'))
+    assert response.status_code == 200
+    assert set_status(stale, 'cancelled') is False
+    db.session.rollback()
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from app import db
+from models import NetworkNode
+from telemetry import ingest_samples
+
+
+def _node():
+    node = NetworkNode(name='Telemetry node', location={'lat': 3.0, 'lng': 3.0}, status='active', capacity=10,
+                       current_load=0)
+    db.session.add(node)
+    db.session.commit()
+    return node.id
+
+
+def test_out_of_range_samples_are_rejected_per_item(app, client, auth_headers):
+    node_id = _node()
+    body = '[%s]' % ', '.join([
+        '{"node_id": %d, "timestamp": 1e15, "load": 1}' % node_id,
+        '{"node_id": %d, "timestamp": 1e20, "load": 1}' % node_id,
+        '{"node_id": %d, "timestamp": Infinity, "load": 1}' % node_id,
+        '{"node_id": %d, "timestamp": "99999999999999999999", "load": 1}' % node_id,
+        '{"node_id": %d, "timestamp": 1700000000, "load": Infinity}' % node_id,
+        '{"node_id": Infinity, "timestamp": 1700000000, "load": 1}',
+        '{"node_id": %d, "timestamp": 1700000000, "load": 1}' % node_id,
+    ])
+    response = client.post('/api/network-nodes/telemetry', data=body, content_type='application/json',
+                           headers=auth_headers('admin'))
+    assert response.status_code == 202
+    assert response.get_json()['accepted'] == 1
+    assert [error['index'] for error in response.get_json()['errors']] == [0, 1, 2, 3, 4, 5]
+
+
+def test_out_of_range_history_bounds_are_bad_requests(app, client, auth_headers):
+    node_id = _node()
+    for query in ('start=1e20', 'start=99999999999999999999', 'end=99999999999999999999', 'end=0001-01-01T00:00:00',
+                  'start=inf'):
+        response = client.get('/api/network-nodes/%d/load?%s' % (node_id, query), headers=auth_headers('admin'))
+        assert response.status_code == 400, query
+
+
+def test_late_samples_change_the_forecast_stamp(app):
+    from forecast import data_stamp
+    node_id = _node()
+    now = datetime.utcnow()
+    assert ingest_samples([{'node_id': node_id, 'timestamp': now.isoformat(), 'load': 4}])[0] == 1
+
+    stamp = data_stamp()
+    late = now - timedelta(hours=3)
+    assert ingest_samples([{'node_id': node_id, 'timestamp': late.isoformat(), 'load': 9}])[0] == 1
+    assert data_stamp() != stamp
+    assert db.session.get(NetworkNode, node_id).current_load == 4
+
+
+def test_forecast_etag_changes_with_late_samples(app, client, auth_headers):
+    node_id = _node()
+    now = datetime.utcnow()
+    assert ingest_samples([{'node_id': node_id, 'timestamp': now.isoformat(), 'load': 4}])[0] == 1
+
+    response = client.get('/api/network-nodes/forecast', headers=auth_headers('tech'))
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    response = client.get('/api/network-nodes/forecast', headers=dict(auth_headers('tech'), **{'If-None-Match': etag}))
+    assert response.status_code == 304
+
+    late = now - timedelta(hours=3)
+    assert ingest_samples([{'node_id': node_id, 'timestamp': late.isoformat(), 'load': 9}])[0] == 1
+    response = client.get('/api/network-nodes/forecast', headers=dict(auth_headers('tech'), **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
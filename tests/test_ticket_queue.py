@@ -0,0 +1,109 @@
+import threading
+import time
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+import routes.tickets
+from app import db
+from models import Customer, Ticket
+from ticket_queue import claim, queued, requeue_expired
+
+TECH = 3  # the seeded tech user
+
+
+def _queue_only(count):
+    """Take every queued ticket out of the queue, then add `count` fresh ones; returns their ids"""
+    db.session.execute(update(Ticket).where(queued()).values(status='closed'))
+    customer_id = Customer.query.first().id
+    tickets = [Ticket(customer_id=customer_id, title='Queue %d' % number, description='-', status='open',
+                      priority='medium') for number in range(count)]
+    db.session.add_all(tickets)
+    db.session.commit()
+    return [ticket.id for ticket in tickets]
+
+
+def test_concurrent_claims_never_double_assign(app):
+    created = _queue_only(200)
+    taken = []
+    lock = threading.Lock()
+
+    def technician(user_id):
+        with app.app_context():
+            while True:
+                try:
+                    ids, _ = claim(user_id, 3)
+                    db.session.commit()
+                except OperationalError:
+                    db.session.rollback()
+                    time.sleep(random.uniform(0.001, 0.01))
+                    continue
+                if not ids:
+                    break
+                with lock:
+                    taken.extend(ids)
+            db.session.remove()
+
+    threads = [threading.Thread(target=technician, args=(user_id,)) for user_id in range(100, 116)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(taken) == sorted(created)
+    db.session.expire_all()
+    assert Ticket.query.filter(Ticket.id.in_(created), Ticket.assigned_to.is_(None)).count() == 0
+
+
+def test_lapsed_lease_is_requeued(app):
+    ticket_id, = _queue_only(1)
+    past = datetime.utcnow() - timedelta(hours=1)
+    assert claim(TECH, 1, lease_seconds=60, now=past)[0] == [ticket_id]
+    db.session.commit()
+
+    assert requeue_expired() == 1
+    db.session.commit()
+    ticket = db.session.get(Ticket, ticket_id)
+    db.session.refresh(ticket)
+    assert ticket.assigned_to is None and ticket.lease_expires_at is None
+    assert claim(TECH, 1)[0] == [ticket_id]
+    db.session.commit()
+
+
+def test_only_the_holder_can_renew_or_release(app, client, auth_headers):
+    ticket_id, = _queue_only(1)
+    response = client.post('/api/tickets/claim', json={'count': 1}, headers=auth_headers('tech', TECH))
+    assert [ticket['id'] for ticket in response.get_json()['tickets']] == [ticket_id]
+
+    other = auth_headers('tech', TECH + 100)
+    assert client.put('/api/tickets/%d/lease' % ticket_id, headers=other).status_code == 409
+    assert client.delete('/api/tickets/%d/lease' % ticket_id, headers=other).status_code == 409
+
+    holder = auth_headers('tech', TECH)
+    assert client.put('/api/tickets/%d/lease' % ticket_id, headers=holder).status_code == 200
+    assert client.delete('/api/tickets/%d/lease' % ticket_id, headers=holder).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(Ticket, ticket_id).assigned_to is None
+
+
+def test_status_change_ends_the_lease(app, client, auth_headers):
+    ticket_id, = _queue_only(1)
+    holder = auth_headers('tech', TECH)
+    client.post('/api/tickets/claim', json={'count': 1}, headers=holder)
+    response = client.patch('/api/tickets/%d/status' % ticket_id, json={'status': 'in_progress'}, headers=holder)
+    assert response.status_code == 200
+
+    db.session.expire_all()
+    ticket = db.session.get(Ticket, ticket_id)
+    assert ticket.assigned_to == TECH and ticket.lease_expires_at is None
+    assert client.put('/api/tickets/%d/lease' % ticket_id, headers=holder).status_code == 409
+
+
+def test_locked_database_is_a_503(app, client, auth_headers, monkeypatch):
+    def locked(*args, **kwargs):
+        raise OperationalError('UPDATE ticket', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(routes.tickets, 'claim', locked)
+    response = client.post('/api/tickets/claim', json={'count': 1}, headers=auth_headers('tech', TECH))
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+from app import db
+from models import RevokedToken
+from token_revocation import _RevocationCache
+
+
+def test_sync_picks_up_rows_committed_out_of_order(app):
+    saved = {key: app.config[key] for key in ('TOKEN_REVOCATION_SYNC_SECONDS', 'TOKEN_REVOCATION_REBUILD_SECONDS')}
+    app.config.update(TOKEN_REVOCATION_SYNC_SECONDS=0, TOKEN_REVOCATION_REBUILD_SECONDS=3600)
+    try:
+        cache = _RevocationCache()
+        now = datetime.utcnow()
+        expires = now + timedelta(hours=1)
+        db.session.add(RevokedToken(id=1000, jti='sync-newer', expires_at=expires, revoked_at=now))
+        db.session.commit()
+        assert cache.might_contain('sync-newer')
+        count = cache.count
+
+        # Revoked (and given its id) earlier, but committed after the newer row was synced
+        db.session.add(RevokedToken(id=999, jti='sync-late', expires_at=expires, revoked_at=now - timedelta(seconds=5)))
+        db.session.commit()
+        assert cache.might_contain('sync-late')
+        assert cache.might_contain('sync-late')  # re-read inside the overlap, not counted again
+        assert cache.count == count + 1
+    finally:
+        app.config.update(saved)
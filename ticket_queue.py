@@ -0,0 +1,275 @@
+"""Ticket claim queue for technicians.
+
+The queue is the open, unassigned tickets in (priority_rank, created_at, id) order. It is read
+from the head of the ix_ticket_claim_queue index, so claiming costs the same however many tickets
+are waiting or already taken.
+
+A claim is one conditional UPDATE: it sets assigned_to and lease_expires_at on the tickets whose id
+is among the first `count` queued, and returns the ids it took. On SQLite the statement runs under
+the database write lock, so the queue cannot change between choosing and taking. On other databases
+the queue head is read with FOR UPDATE SKIP LOCKED, which re-checks each row as it locks it, so
+concurrent claims take different tickets instead of waiting on each other. Either way a ticket is
+never handed to two technicians.
+
+On SQLite, callers run each claim-queue transaction inside `queue_writes()`. It queues this
+process's writers first-come first-served. SQLite's own busy handler polls with growing sleeps, so
+the writer that has waited longest retries least often and can starve behind newer arrivals.
+
+A claimed ticket stays 'open' until its technician moves it on; any status change or manual
+assignment ends the lease. Leases can be renewed by their holder or released early. Tickets whose
+lease lapsed are put back in the queue at the start of every claim, and by `flask tickets requeue`.
+"""
+import queue
+import random
+import tempfile
+import threading
+import time
+import click
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import OperationalError
+from app import db
+from models import Customer, Ticket, User, TICKET_PRIORITY_RANKS
+from engine_profile import scratch_database
+
+tickets_cli = AppGroup('tickets', help='Ticket claim queue.')
+
+DEFAULT_LEASE_SECONDS = 900
+DEFAULT_MAX_LEASE_SECONDS = 8 * 3600
+DEFAULT_MAX_BATCH = 50
+# Benchmark retry backoff after a lock timeout
+BACKOFF_SECONDS = 0.002
+MAX_BACKOFF_SECONDS = 0.05
+
+
+class _FifoGate:
+    """A lock granted in arrival order"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = deque()
+        self.held = False
+
+    def __enter__(self):
+        with self.lock:
+            if not self.held:
+                self.held = True
+                return
+            turn = threading.Event()
+            self.waiters.append(turn)
+        turn.wait()
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            if self.waiters:
+                self.waiters.popleft().set()  # handed straight to the next waiter; held stays True
+            else:
+                self.held = False
+
+
+_gate = _FifoGate()
+
+
+@contextmanager
+def queue_writes():
+    """Hold this process's claim-queue gate for a transaction (SQLite only; row locks serve elsewhere)"""
+    if db.session.get_bind().dialect.name != 'sqlite':
+        yield
+        return
+    with _gate:
+        yield
+
+
+def queued():
+    """Condition for tickets waiting in the claim queue"""
+    table = Ticket.__table__
+    return (table.c.status == 'open') & table.c.assigned_to.is_(None)
+
+
+def requeue_expired(now=None):
+    """Put open tickets whose lease has lapsed back in the queue, in the current transaction; returns how many"""
+    table = Ticket.__table__
+    now = now or datetime.utcnow()
+    # Conditioned on the lease alone so it is an ix_ticket_lease_expires_at range; a lease left on a ticket
+    # that is no longer open is cleared without unassigning it
+    return db.session.execute(
+        table.update().where(table.c.lease_expires_at <= now).values(
+            assigned_to=case((table.c.status == 'open', None), else_=table.c.assigned_to),
+            lease_expires_at=None, updated_at=now
+        )
+    ).rowcount
+
+
+def claim(user_id, count=1, lease_seconds=None, now=None):
+    """Assign the first `count` queued tickets to `user_id` under a lease; returns ([ids in queue order], lease end)"""
+    table = Ticket.__table__
+    now = now or datetime.utcnow()
+    lease_seconds = lease_seconds or current_app.config.get('TICKET_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+    expires = now + timedelta(seconds=lease_seconds)
+    requeue_expired(now)
+
+    head = select(table.c.id).where(queued()).order_by(
+        table.c.priority_rank, table.c.created_at, table.c.id
+    ).limit(count)
+    if db.session.get_bind().dialect.name != 'sqlite':
+        head = head.with_for_update(skip_locked=True)
+    claimed = db.session.execute(
+        # Only the id condition, so the planner looks the chosen rows up by key rather than rescanning the queue
+        table.update().where(table.c.id.in_(head.scalar_subquery())).values(
+            assigned_to=user_id, lease_expires_at=expires, updated_at=now
+        ).returning(table.c.id, table.c.priority_rank, table.c.created_at)
+    ).all()
+    return [row.id for row in sorted(claimed, key=lambda row: (row.priority_rank, row.created_at, row.id))], expires
+
+
+def renew(ticket_id, user_id, lease_seconds=None, now=None):
+    """Extend `user_id`'s lease on a ticket; returns the new lease end, or None if they do not hold it"""
+    table = Ticket.__table__
+    now = now or datetime.utcnow()
+    lease_seconds = lease_seconds or current_app.config.get('TICKET_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+    expires = now + timedelta(seconds=lease_seconds)
+    renewed = db.session.execute(
+        table.update().where(
+            table.c.id == ticket_id, table.c.assigned_to == user_id, table.c.status == 'open',
+            table.c.lease_expires_at > now
+        ).values(lease_expires_at=expires, updated_at=now)
+    ).rowcount
+    return expires if renewed else None
+
+
+def release(ticket_id, user_id, now=None):
+    """Give a leased ticket back to the queue; False if `user_id` does not hold its lease"""
+    table = Ticket.__table__
+    now = now or datetime.utcnow()
+    return db.session.execute(
+        table.update().where(
+            table.c.id == ticket_id, table.c.assigned_to == user_id, table.c.status == 'open',
+            table.c.lease_expires_at.isnot(None)
+        ).values(assigned_to=None, lease_expires_at=None, updated_at=now)
+    ).rowcount == 1
+
+
+@tickets_cli.command('requeue')
+def requeue_command():
+    """Put tickets with lapsed claim leases back in the queue."""
+    requeued = requeue_expired()
+    db.session.commit()
+    click.echo('Requeued %d ticket(s)' % requeued)
+
+
+@tickets_cli.command('benchmark')
+@click.option('--tickets', 'rows', default=100000, show_default=True)
+@click.option('--techs', default=50, show_default=True, help='Concurrent technicians (threads).')
+@click.option('--batch', default=5, show_default=True, help='Tickets per claim.')
+@click.option('--claims', default=40, show_default=True, help='Claims per technician.')
+def benchmark_command(rows, techs, batch, claims):
+    """Race technicians claiming from a large queue in a scratch SQLite database."""
+    with tempfile.TemporaryDirectory() as directory, scratch_database(directory):
+        app = current_app._get_current_object()
+        now = datetime.utcnow()
+        generator = random.Random(0)
+        priorities = list(TICKET_PRIORITY_RANKS)
+        db.session.execute(Customer.__table__.insert(), [{
+            'name': 'Customer', 'email': 'queue@example.com', 'created_at': now, 'updated_at': now
+        }])
+        db.session.execute(User.__table__.insert(), [{
+            'username': 'tech%d' % number, 'password_hash': '-', 'role': 'tech',
+            'email': 'tech%d@example.com' % number, 'created_at': now, 'updated_at': now
+        } for number in range(techs)])
+        for start in range(0, rows, 50000):
+            db.session.execute(Ticket.__table__.insert(), [{
+                'customer_id': 1, 'title': 'Ticket %d' % number, 'description': '-', 'status': 'open',
+                'priority': priorities[generator.randrange(4)],
+                'created_at': now - timedelta(seconds=generator.randrange(90 * 86400)), 'updated_at': now
+            } for number in range(start, min(rows, start + 50000))])
+        db.session.commit()
+
+        def uncontended(samples=100):
+            """Median latency of claims by one technician, handed back afterwards"""
+            timings, held = [], []
+            for _ in range(samples):
+                started = time.perf_counter()
+                with queue_writes():
+                    ids, _ = claim(1, batch)
+                    db.session.commit()
+                timings.append(time.perf_counter() - started)
+                held += ids
+            for ticket_id in held:
+                release(ticket_id, 1)
+            db.session.commit()
+            return sorted(timings)[samples // 2] * 1000
+
+        before = uncontended()
+
+        taken = {}
+        timings = []
+        lock = threading.Lock()
+        work = queue.Queue()
+        for _ in range(claims):
+            for tech in range(1, techs + 1):
+                work.put(tech)
+
+        def technician():
+            with app.app_context():
+                while True:
+                    try:
+                        tech = work.get_nowait()
+                    except queue.Empty:
+                        break
+                    started = time.perf_counter()
+                    delay = BACKOFF_SECONDS
+                    while True:
+                        try:
+                            with queue_writes():
+                                ids, _ = claim(tech, batch)
+                                db.session.commit()
+                            break
+                        except OperationalError:
+                            db.session.rollback()
+                            # Another process held the lock past busy_timeout: back off with full jitter so
+                            # retries spread out instead of arriving in lockstep
+                            time.sleep(random.uniform(0, delay))
+                            delay = min(delay * 2, MAX_BACKOFF_SECONDS)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        timings.append(elapsed)
+                        for ticket_id in ids:
+                            taken.setdefault(ticket_id, []).append(tech)
+                db.session.remove()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=technician) for _ in range(techs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        def percentiles(values):
+            values = sorted(values)
+            return values[len(values) // 2] * 1000, values[int(len(values) * 0.99)] * 1000
+
+        tenth = max(1, len(timings) // 10)
+        click.echo('%d techs made %d claims of %d from %d tickets in %.1fs (%.0f claims/s)' % (
+            techs, len(timings), batch, rows, elapsed, len(timings) / elapsed))
+        click.echo('Contended latency first 10%%: median %.1f ms, p99 %.1f ms; last 10%%: median %.1f ms, p99 %.1f ms' % (
+            percentiles(timings[:tenth]) + percentiles(timings[-tenth:])))
+        click.echo('Uncontended claim: median %.2f ms with %d queued, %.2f ms with %d queued and %d claimed' % (
+            before, rows, uncontended(), rows - len(taken), len(taken)))
+
+        doubles = sum(1 for holders in taken.values() if len(holders) > 1)
+        assigned = dict(db.session.execute(
+            select(Ticket.id, Ticket.assigned_to).where(Ticket.assigned_to.isnot(None))
+        ).all())
+        mismatched = sum(1 for ticket_id, holders in taken.items() if assigned.get(ticket_id) != holders[0])
+        click.echo('Claimed %d tickets: %d double assignments, %d not held by their claimant' % (
+            len(taken), doubles, mismatched + len(assigned) - len(taken)))
+
+        requeued = requeue_expired(datetime.utcnow() + timedelta(days=1))
+        db.session.commit()
+        waiting = db.session.execute(select(func.count()).where(queued())).scalar()
+        click.echo('Lease expiry requeued %d; %d tickets queued again (expected %d)' % (requeued, waiting, rows))
@@ -0,0 +1,175 @@
+"""Revoked-token store shared by every worker process.
+
+Revoked JTIs live in the `revoked_token` table, so all workers see the same set. Each row is kept
+only until the token's own `exp`; after that the token is rejected anyway and the row is purged.
+
+Every JWT-protected request asks `is_token_revoked`. To keep that cheap, each process holds a Bloom
+filter of live revoked JTIs: a miss (the normal case) answers "not revoked" with no query; a hit is
+confirmed against the table. The filter picks up new rows incrementally every
+TOKEN_REVOCATION_SYNC_SECONDS, by revoked_at with an overlap (SYNC_OVERLAP) so rows that commit out of
+revoked_at order are not skipped, and is rebuilt from scratch (dropping expired entries) every
+TOKEN_REVOCATION_REBUILD_SECONDS. Revocations made by this process are visible immediately; those
+made by another worker take effect here within one sync interval.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from app import db
+from models import RevokedToken
+from datetime import datetime, timedelta
+from flask import current_app
+
+DEFAULT_SYNC_SECONDS = 5
+DEFAULT_REBUILD_SECONDS = 300
+DEFAULT_BLOOM_CAPACITY = 100000
+BLOOM_ERROR_RATE = 0.01
+
+# Tokens issued without an expiry are remembered for this long
+MAX_REVOCATION_TTL = timedelta(days=30)
+# Rows committed out of revoked_at order within this window are still picked up by the next sync
+SYNC_OVERLAP = timedelta(seconds=10)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives, ~BLOOM_ERROR_RATE false positives at capacity)"""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class _RevocationCache:
+    """Per-process Bloom filter view of the revoked_token table"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.count = 0
+        self.synced_through = None
+        self.recent = {}  # jti -> revoked_at for rows inside the overlap, so re-read rows are not counted twice
+        self.synced_at = 0.0
+        self.rebuilt_at = 0.0
+
+    def _rebuild(self, now):
+        config = current_app.config
+        with db.engine.begin() as connection:
+            connection.execute(RevokedToken.__table__.delete().where(RevokedToken.expires_at <= datetime.utcnow()))
+            rows = connection.execute(db.select(RevokedToken.jti, RevokedToken.revoked_at)).all()
+
+        capacity = config.get('TOKEN_REVOCATION_BLOOM_CAPACITY', DEFAULT_BLOOM_CAPACITY)
+        bloom = BloomFilter(max(capacity, len(rows) * 2))
+        for row in rows:
+            bloom.add(row.jti)
+
+        self.bloom = bloom
+        self.count = len(rows)
+        self.recent = {}
+        self._advance(rows)
+        self.synced_at = self.rebuilt_at = now
+
+    def _sync(self, now):
+        query = db.select(RevokedToken.jti, RevokedToken.revoked_at)
+        if self.synced_through is not None:
+            query = query.where(RevokedToken.revoked_at >= self.synced_through - SYNC_OVERLAP)
+        with db.engine.connect() as connection:
+            rows = connection.execute(query).all()
+        for row in rows:
+            if row.jti not in self.recent:
+                self.bloom.add(row.jti)
+                self.count += 1
+        self._advance(rows)
+        self.synced_at = now
+
+    def _advance(self, rows):
+        """Move synced_through to the newest revoked_at seen, remembering the rows still inside the overlap"""
+        stamps = [row.revoked_at for row in rows if row.revoked_at is not None]
+        if stamps and (self.synced_through is None or max(stamps) > self.synced_through):
+            self.synced_through = max(stamps)
+        if self.synced_through is None:
+            return
+        floor = self.synced_through - SYNC_OVERLAP
+        self.recent.update(
+            (row.jti, row.revoked_at) for row in rows if row.revoked_at is not None and row.revoked_at >= floor
+        )
+        self.recent = {jti: at for jti, at in self.recent.items() if at >= floor}
+
+    def refresh(self):
+        config = current_app.config
+        now = time.monotonic()
+        if self.bloom is not None and now - self.synced_at < config.get('TOKEN_REVOCATION_SYNC_SECONDS', DEFAULT_SYNC_SECONDS):
+            return
+        with self.lock:
+            if self.bloom is None or self.count > self.bloom.capacity or \
+                    now - self.rebuilt_at >= config.get('TOKEN_REVOCATION_REBUILD_SECONDS', DEFAULT_REBUILD_SECONDS):
+                self._rebuild(now)
+            elif now - self.synced_at >= config.get('TOKEN_REVOCATION_SYNC_SECONDS', DEFAULT_SYNC_SECONDS):
+                self._sync(now)
+
+    def might_contain(self, jti):
+        self.refresh()
+        return jti in self.bloom
+
+    def add(self, jti):
+        if self.bloom is not None:
+            with self.lock:
+                self.bloom.add(jti)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    """The cache for this process (re-created after a fork)"""
+    global _cache
+    if _cache is None or _cache.pid != os.getpid():
+        with _cache_lock:
+            if _cache is None or _cache.pid != os.getpid():
+                _cache = _RevocationCache()
+    return _cache
+
+
+def revoke_token(jwt_payload):
+    """Record a decoded token as revoked until its own expiry; the caller commits"""
+    jti = jwt_payload['jti']
+    if 'exp' in jwt_payload:
+        expires_at = datetime.utcfromtimestamp(jwt_payload['exp'])
+    else:
+        expires_at = datetime.utcnow() + MAX_REVOCATION_TTL
+
+    if not db.session.query(RevokedToken.id).filter_by(jti=jti).first():
+        db.session.add(RevokedToken(jti=jti, expires_at=expires_at))
+    _get_cache().add(jti)
+
+
+def is_token_revoked(jti):
+    """True if the JTI has been revoked; answered in-process unless the Bloom filter reports a hit"""
+    if not _get_cache().might_contain(jti):
+        return False
+    # Straight to the primary: runs before the request's identity (and so its replica routing) is known
+    with db.engine.connect() as connection:
+        return connection.execute(db.select(
+            db.select(RevokedToken.id).where(
+                RevokedToken.jti == jti,
+                RevokedToken.expires_at > datetime.utcnow()
+            ).exists()
+        )).scalar()
+